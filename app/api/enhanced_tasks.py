@@ -10,7 +10,7 @@ import math
 from app.core.database import get_async_session
 from app.core.auth import current_active_user
 from app.models.user import User, UserRole
-from app.models.task import GpuTask, TaskStatus, TaskPriority
+from app.models.task import ACTIVE_TASK_STATUSES, GpuTask, TaskStatus, TaskPriority
 from app.schemas.task import (
     TaskCreate, TaskUpdate, TaskRead, TaskList, TaskResponse, 
     TaskListResponse, ApiResponse, TaskStats
@@ -19,6 +19,19 @@ from app.schemas.task import (
 router = APIRouter()
 
 
+# 任务统计聚合查询：一次查询得到各状态任务数量和总成本（按状态计数使用 FILTER 子句）。
+# 语句只构建一次，各请求仅追加WHERE条件，SQL形状固定，可复用编译缓存和服务端预编译语句
+TASK_STATS_QUERY = select(
+    func.count().label("total_tasks"),
+    func.count().filter(GpuTask.status == TaskStatus.RUNNING).label("running_tasks"),
+    func.count().filter(GpuTask.status == TaskStatus.COMPLETED).label("completed_tasks"),
+    func.count().filter(GpuTask.status == TaskStatus.FAILED).label("failed_tasks"),
+    func.count().filter(GpuTask.status == TaskStatus.PENDING).label("pending_tasks"),
+    func.count().filter(GpuTask.status == TaskStatus.CANCELLED).label("cancelled_tasks"),
+    func.sum(GpuTask.actual_cost).label("total_cost")
+)
+
+
 def require_admin(current_user: User = Depends(current_active_user)):
     """管理员权限验证"""
     if current_user.role != UserRole.ADMIN:
@@ -215,7 +228,8 @@ async def create_task(
             "requirements": task_data.requirements or []
         }
         
-        # 创建任务实例
+        # 创建任务实例（创建时间与更新时间使用同一时间戳）
+        now = datetime.now(timezone.utc)
         new_task = GpuTask(
             name=task_data.name,
             description=task_data.description,
@@ -226,8 +240,8 @@ async def create_task(
             status=TaskStatus.PENDING,
             estimated_cost=task_data.budget_limit,
             currency="USD",
-            created_at=datetime.now(timezone.utc),
-            updated_at=datetime.now(timezone.utc)
+            created_at=now,
+            updated_at=now
         )
         
         session.add(new_task)
@@ -366,12 +380,13 @@ async def cancel_task(
                 "message": "任务已完成或已取消，无法取消"
             }
         
-        # 更新任务状态为已取消
+        # 更新任务状态为已取消（完成时间与更新时间使用同一时间戳）
+        now = datetime.now(timezone.utc)
         await session.execute(
             update(GpuTask).where(GpuTask.id == task_id).values(
                 status=TaskStatus.CANCELLED,
-                completed_at=datetime.now(timezone.utc),
-                updated_at=datetime.now(timezone.utc)
+                completed_at=now,
+                updated_at=now
             )
         )
         await session.commit()
@@ -424,7 +439,7 @@ async def restart_task(
             }
         
         # 检查任务状态是否可以重启
-        if task.status in [TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING]:
+        if task.status in ACTIVE_TASK_STATUSES:
             return {
                 "success": False,
                 "error": "任务正在运行中，无法重启",
@@ -589,47 +604,17 @@ async def get_task_stats(
     获取任务统计信息
     """
     try:
-        # 构建基础查询
-        base_query = select(GpuTask)
+        stats_query = TASK_STATS_QUERY
         
         # 权限控制
         if current_user.role != UserRole.ADMIN:
-            base_query = base_query.where(GpuTask.user_id == str(current_user.id))
+            stats_query = stats_query.where(GpuTask.user_id == str(current_user.id))
         elif user_id:
-            base_query = base_query.where(GpuTask.user_id == user_id)
-        
-        # 统计各种状态的任务数量
-        stats_queries = {
-            "total_tasks": select(func.count()).select_from(base_query.subquery()),
-            "running_tasks": select(func.count()).select_from(
-                base_query.where(GpuTask.status == TaskStatus.RUNNING).subquery()
-            ),
-            "completed_tasks": select(func.count()).select_from(
-                base_query.where(GpuTask.status == TaskStatus.COMPLETED).subquery()
-            ),
-            "failed_tasks": select(func.count()).select_from(
-                base_query.where(GpuTask.status == TaskStatus.FAILED).subquery()
-            ),
-            "pending_tasks": select(func.count()).select_from(
-                base_query.where(GpuTask.status == TaskStatus.PENDING).subquery()
-            ),
-            "cancelled_tasks": select(func.count()).select_from(
-                base_query.where(GpuTask.status == TaskStatus.CANCELLED).subquery()
-            )
-        }
+            stats_query = stats_query.where(GpuTask.user_id == user_id)
         
-        # 执行所有统计查询
-        stats = {}
-        for key, query in stats_queries.items():
-            result = await session.execute(query)
-            stats[key] = result.scalar()
-        
-        # 计算成本和计算时长（简化处理）
-        cost_query = select(func.sum(GpuTask.actual_cost)).select_from(
-            base_query.where(GpuTask.actual_cost.isnot(None)).subquery()
-        )
-        cost_result = await session.execute(cost_query)
-        total_cost = float(cost_result.scalar() or 0)
+        stats = (await session.execute(stats_query)).one()._asdict()
+        # SUM忽略NULL成本；没有任何成本记录时为NULL
+        total_cost = float(stats["total_cost"] or 0)
         
         # 简单计算总计算时长（假设每个已完成任务运行1小时）
         total_compute_hours = float(stats["completed_tasks"])
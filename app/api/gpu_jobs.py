@@ -1,19 +1,23 @@
+import asyncio
 import json
+import time
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from typing import List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.core.auth import current_active_user
+from app.core.celery_app import BEST_EFFORT_QUEUE
 from app.core.database import get_async_session
-from app.core.scheduler import IntelligentScheduler, TaskRequirement
+from app.core.scheduler import STRATEGY_WEIGHTS, TaskRequirement, get_intelligent_scheduler
 from app.core.websocket_manager import websocket_manager
 from app.core.task_status_broadcaster import task_broadcaster
 from app.models.user import User
 from app.models.task import GpuTask, TaskStatus, TaskPriority
 from app.gpu.interface import GpuSpec, JobConfig, JobResult, CostInfo
-from app.tasks.gpu_tasks import execute_gpu_task, cancel_gpu_task
+from app.tasks.gpu_tasks import PROVIDER_ADAPTERS, execute_gpu_task, cancel_gpu_task
 import os
 
 router = APIRouter()
@@ -38,6 +42,23 @@ PROVIDERS = {
 }
 
 
+# 任务优先级名称 -> 调度器使用的整数优先级（只读常量）
+_PRIORITY_TO_INT: Mapping[str, int] = MappingProxyType({
+    "low": 2,
+    "normal": 5,
+    "high": 8,
+    "urgent": 10,
+})
+
+# Provider健康检查结果的缓存时间（秒）；TTL内的请求直接返回上次结果，不再访问云厂商API
+PROVIDER_HEALTH_CACHE_TTL_SECONDS = 5.0
+
+# provider_name -> (检查时间(time.monotonic), 健康检查结果)
+_provider_health_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+# 每个Provider一把锁，缓存过期时并发请求只触发一次健康检查
+_provider_health_locks: Dict[str, asyncio.Lock] = {name: asyncio.Lock() for name in PROVIDERS}
+
+
 def get_provider_adapter(provider_name: str):
     """获取指定提供商的适配器实例"""
     if provider_name not in PROVIDERS:
@@ -46,24 +67,13 @@ def get_provider_adapter(provider_name: str):
             detail=f"Unsupported provider: {provider_name}"
         )
     
-    config = PROVIDERS[provider_name]
-
-    # 实际适配器实现
-    from app.gpu.providers.tencent import TencentCloudAdapter
-    from app.gpu.providers.alibaba import AlibabaCloudAdapter
-    from app.gpu.providers.runpod import RunPodAdapter
-    
-    if provider_name == "tencent":
-        return TencentCloudAdapter(config)
-    elif provider_name == "alibaba":
-        return AlibabaCloudAdapter(config)
-    elif provider_name == "runpod":
-        return RunPodAdapter(config)
-    else:
+    adapter_class = PROVIDER_ADAPTERS.get(provider_name)
+    if adapter_class is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Unknown provider: {provider_name}"
         )
+    return adapter_class(PROVIDERS[provider_name])
 
 
 @router.get("/providers")
@@ -107,6 +117,33 @@ async def list_available_gpus(
         )
 
 
+def _cached_provider_health(provider_name: str) -> Optional[Dict[str, Any]]:
+    cached = _provider_health_cache.get(provider_name)
+    if cached is not None and time.monotonic() - cached[0] < PROVIDER_HEALTH_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+async def get_provider_health(provider_name: str) -> Dict[str, Any]:
+    """获取Provider健康状态（带TTL缓存）"""
+    health = _cached_provider_health(provider_name)
+    if health is not None:
+        return health
+    
+    lock = _provider_health_locks.get(provider_name)
+    if lock is None:
+        # 未知Provider，由get_provider_adapter抛出错误
+        return await get_provider_adapter(provider_name).health_check()
+    
+    async with lock:
+        # 等锁期间其他请求可能已刷新缓存
+        health = _cached_provider_health(provider_name)
+        if health is None:
+            health = await get_provider_adapter(provider_name).health_check()
+            _provider_health_cache[provider_name] = (time.monotonic(), health)
+        return health
+
+
 @router.get("/providers/{provider_name}/health")
 async def check_provider_health(
     provider_name: str,
@@ -114,8 +151,7 @@ async def check_provider_health(
 ):
     """检查指定提供商的健康状态"""
     try:
-        adapter = get_provider_adapter(provider_name)
-        health = await adapter.health_check()
+        health = await get_provider_health(provider_name)
         return {"provider": provider_name, "health": health}
     except Exception as e:
         raise HTTPException(
@@ -136,7 +172,7 @@ async def get_scheduling_recommendations(
 ):
     """获取针对特定任务的调度建议"""
     try:
-        scheduler = IntelligentScheduler()
+        scheduler = get_intelligent_scheduler()
         
         task_requirement = TaskRequirement(
             gpu_type=gpu_type,
@@ -147,32 +183,15 @@ async def get_scheduling_recommendations(
             priority=priority
         )
         
+        # 每种策略的推荐结果（dataclass，由FastAPI直接序列化）
         recommendations = {}
-        strategies = ["cost", "performance", "availability", "balanced"]
-        
-        for strategy in strategies:
-            provider, routing_key = await scheduler.select_optimal_provider(
-                task_requirement, strategy
-            )
-            if provider:
-                score = await scheduler.calculate_provider_score(
-                    provider, task_requirement, strategy
-                )
-                recommendations[strategy] = {
-                    "provider": provider,
-                    "routing_key": routing_key,
-                    "score": score
-                }
+        for strategy in STRATEGY_WEIGHTS:
+            recommendation = scheduler.recommend_provider(task_requirement, strategy)
+            if recommendation is not None:
+                recommendations[strategy] = recommendation
         
         return {
-            "task_requirement": {
-                "gpu_type": task_requirement.gpu_type,
-                "gpu_count": task_requirement.gpu_count,
-                "memory_gb": task_requirement.memory_gb,
-                "vcpus": task_requirement.vcpus,
-                "estimated_duration_minutes": task_requirement.estimated_duration_minutes,
-                "priority": task_requirement.priority
-            },
+            "task_requirement": task_requirement,
             "recommendations": recommendations,
             "provider_metrics": scheduler.get_all_provider_metrics()
         }
@@ -190,13 +209,13 @@ async def get_scheduling_metrics(
 ):
     """获取调度器指标和提供商统计"""
     try:
-        scheduler = IntelligentScheduler()
+        scheduler = get_intelligent_scheduler()
         metrics = scheduler.get_all_provider_metrics()
         
         return {
             "provider_metrics": metrics,
             "total_providers": len(metrics),
-            "healthy_providers": len([m for m in metrics.values() if m.get("health_score", 0) > 0.7]),
+            "healthy_providers": sum(1 for m in metrics.values() if m.get("health_score", 0) > 0.7),
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
         
@@ -213,13 +232,14 @@ async def submit_job(
     priority: TaskPriority = TaskPriority.NORMAL,
     preferred_provider: Optional[str] = None,
     scheduling_strategy: str = "balanced",  # cost, performance, availability, balanced
+    service_level: str = "immediate",  # immediate, best_effort
     session: AsyncSession = Depends(get_async_session),
     user: User = Depends(current_active_user)
 ):
     """智能提交GPU作业到最优提供商"""
     try:
-        # 创建智能调度器
-        scheduler = IntelligentScheduler()
+        # 使用全局智能调度器（复用评分缓存）
+        scheduler = get_intelligent_scheduler()
         
         # 构建任务需求
         task_requirement = TaskRequirement(
@@ -279,6 +299,10 @@ async def submit_job(
         elif task_requirement.priority <= 2:
             queue_name = "priority_low"
         
+        # 可延迟的作业进入best_effort队列，等集群空闲时再执行
+        if service_level == "best_effort":
+            queue_name = BEST_EFFORT_QUEUE
+        
         celery_task = execute_gpu_task.apply_async(
             args=[task.id, provider_config],
             queue=queue_name
@@ -290,7 +314,7 @@ async def submit_job(
         await session.commit()
         
         # 获取调度决策的详细信息
-        provider_score = await scheduler.calculate_provider_score(
+        provider_score = scheduler.calculate_provider_score(
             selected_provider, task_requirement, scheduling_strategy
         )
         
@@ -534,9 +558,10 @@ async def cancel_task(
             cancel_gpu_task.delay(task_id, provider_config)
         
         # 更新任务状态
+        now = datetime.now(timezone.utc)
         task.status = TaskStatus.CANCELLED
-        task.completed_at = datetime.now(timezone.utc)
-        task.updated_at = datetime.now(timezone.utc)
+        task.completed_at = now
+        task.updated_at = now
         await session.commit()
         
         return {
@@ -668,24 +693,9 @@ async def websocket_task_status(
 
 def _map_priority_to_int(priority) -> int:
     """将TaskPriority映射为整数值"""
-    from app.models.task import TaskPriority
-    
-    if isinstance(priority, TaskPriority):
-        mapping = {
-            TaskPriority.LOW: 2,
-            TaskPriority.NORMAL: 5,
-            TaskPriority.HIGH: 8,
-            TaskPriority.URGENT: 10
-        }
-        return mapping.get(priority, 5)
-    elif isinstance(priority, str):
-        mapping = {
-            'low': 2,
-            'normal': 5,
-            'high': 8,
-            'urgent': 10
-        }
-        return mapping.get(priority.lower(), 5)
+    # TaskPriority是str枚举，lower()后与普通字符串共用同一映射表
+    if isinstance(priority, str):
+        return _PRIORITY_TO_INT.get(priority.lower(), 5)
     elif isinstance(priority, int):
         return max(1, min(10, priority))  # 确保在1-10范围内
     else:
@@ -1,41 +1,200 @@
-from fastapi import APIRouter, Depends, Query
-from typing import List, Optional
+import json
+from operator import itemgetter
+from fastapi import APIRouter, Depends, Query, Response
+from pydantic import TypeAdapter
+from typing import Dict, List, Optional, Tuple
 from app.core.auth import current_active_user
 from app.models.user import User
-from app.schemas.task import Provider, GPUModel, DockerImage, ApiResponse
+from app.schemas.task import Provider, GPUModel, DockerImage, ApiResponse, CompareRequest
 
 router = APIRouter()
 
 
+# 云服务商列表
+PROVIDERS = [
+    Provider(
+        id="alibaba",
+        name="alibaba",
+        display_name="阿里云 (Alibaba Cloud)",
+        is_available=True,
+        regions=["cn-hangzhou", "cn-beijing", "cn-shenzhen", "cn-shanghai", "ap-southeast-1"]
+    ),
+    Provider(
+        id="tencent",
+        name="tencent", 
+        display_name="腾讯云 (Tencent Cloud)",
+        is_available=True,
+        regions=["ap-beijing", "ap-shanghai", "ap-guangzhou", "ap-chengdu", "ap-singapore"]
+    ),
+    Provider(
+        id="runpod",
+        name="runpod",
+        display_name="RunPod",
+        is_available=True,
+        regions=["us-east", "us-west", "eu-central", "ap-southeast"]
+    )
+]
+
+# 模拟GPU型号数据
+GPU_MODELS = [
+    # 阿里云 GPU型号
+    GPUModel(
+        id="alibaba-v100",
+        name="Tesla V100",
+        provider="alibaba",
+        memory_gb=16,
+        compute_capability="7.0",
+        cost_per_hour=2.8,
+        availability="high"
+    ),
+    GPUModel(
+        id="alibaba-a100",
+        name="Tesla A100",
+        provider="alibaba",
+        memory_gb=40,
+        compute_capability="8.0",
+        cost_per_hour=3.9,
+        availability="medium"
+    ),
+    GPUModel(
+        id="alibaba-t4",
+        name="Tesla T4",
+        provider="alibaba",
+        memory_gb=16,
+        compute_capability="7.5",
+        cost_per_hour=0.48,
+        availability="high"
+    ),
+    GPUModel(
+        id="alibaba-rtx3090",
+        name="RTX 3090",
+        provider="alibaba",
+        memory_gb=24,
+        compute_capability="8.6",
+        cost_per_hour=1.25,
+        availability="medium"
+    ),
+    
+    # 腾讯云 GPU型号
+    GPUModel(
+        id="tencent-v100",
+        name="Tesla V100",
+        provider="tencent",
+        memory_gb=16,
+        compute_capability="7.0",
+        cost_per_hour=2.5,
+        availability="high"
+    ),
+    GPUModel(
+        id="tencent-a100",
+        name="Tesla A100",
+        provider="tencent",
+        memory_gb=40,
+        compute_capability="8.0",
+        cost_per_hour=3.8,
+        availability="medium"
+    ),
+    GPUModel(
+        id="tencent-t4",
+        name="Tesla T4",
+        provider="tencent",
+        memory_gb=16,
+        compute_capability="7.5",
+        cost_per_hour=0.42,
+        availability="high"
+    ),
+    GPUModel(
+        id="tencent-k80",
+        name="Tesla K80",
+        provider="tencent",
+        memory_gb=12,
+        compute_capability="3.7",
+        cost_per_hour=0.38,
+        availability="high"
+    ),
+    
+    # RunPod GPU型号
+    GPUModel(
+        id="runpod-v100",
+        name="Tesla V100",
+        provider="runpod",
+        memory_gb=16,
+        compute_capability="7.0",
+        cost_per_hour=1.89,
+        availability="high"
+    ),
+    GPUModel(
+        id="runpod-a100",
+        name="Tesla A100",
+        provider="runpod",
+        memory_gb=80,
+        compute_capability="8.0",
+        cost_per_hour=2.89,
+        availability="medium"
+    ),
+    GPUModel(
+        id="runpod-rtx4090",
+        name="RTX 4090",
+        provider="runpod",
+        memory_gb=24,
+        compute_capability="8.9",
+        cost_per_hour=0.79,
+        availability="high"
+    ),
+    GPUModel(
+        id="runpod-rtx3090",
+        name="RTX 3090",
+        provider="runpod",
+        memory_gb=24,
+        compute_capability="8.6",
+        cost_per_hour=0.59,
+        availability="high"
+    )
+]
+
+
+# 计算能力在目录中以字符串保存，导入时统一解析为浮点数: {gpu_id: compute_capability}
+_GPU_COMPUTE_CAPABILITY: Dict[str, float] = {gpu.id: float(gpu.compute_capability) for gpu in GPU_MODELS}
+
+
+def _score_gpu(gpu: GPUModel) -> Tuple[float, float]:
+    """计算GPU的性能分数和成本效益（简化算法）"""
+    performance_score = gpu.memory_gb * 10 + _GPU_COMPUTE_CAPABILITY[gpu.id] * 50
+    cost_efficiency = performance_score / gpu.cost_per_hour
+    return round(performance_score, 2), round(cost_efficiency, 2)
+
+
+# GPU目录是静态的，性能分数和成本效益在导入时一次性算好: {gpu_id: (performance_score, cost_efficiency)}
+_GPU_SCORES: Dict[str, Tuple[float, float]] = {gpu.id: _score_gpu(gpu) for gpu in GPU_MODELS}
+_GPU_BY_ID: Dict[str, GPUModel] = {gpu.id: gpu for gpu in GPU_MODELS}
+
+def _encode_json(payload: dict) -> bytes:
+    """将常量响应预先编码为JSON（与FastAPI默认JSONResponse格式一致）"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# 复用已编译的序列化器，避免每次请求重新走response_model校验
+_PROVIDER_LIST_ADAPTER = TypeAdapter(List[Provider])
+_GPU_LIST_ADAPTER = TypeAdapter(List[GPUModel])
+
+# 按云服务商预先分组并序列化GPU目录，过滤时只需一次字典查找
+_GPU_MODELS_JSON = _GPU_LIST_ADAPTER.dump_json(GPU_MODELS)
+_GPU_MODELS_JSON_BY_PROVIDER: Dict[str, bytes] = {
+    provider.id: _GPU_LIST_ADAPTER.dump_json([gpu for gpu in GPU_MODELS if gpu.provider == provider.id])
+    for provider in PROVIDERS
+}
+_EMPTY_GPU_LIST_JSON = _GPU_LIST_ADAPTER.dump_json([])
+
+
 @router.get("/providers", response_model=List[Provider])
 async def get_providers(current_user: User = Depends(current_active_user)):
     """
     获取所有云服务商列表
     """
-    providers = [
-        Provider(
-            id="alibaba",
-            name="alibaba",
-            display_name="阿里云 (Alibaba Cloud)",
-            is_available=True,
-            regions=["cn-hangzhou", "cn-beijing", "cn-shenzhen", "cn-shanghai", "ap-southeast-1"]
-        ),
-        Provider(
-            id="tencent",
-            name="tencent", 
-            display_name="腾讯云 (Tencent Cloud)",
-            is_available=True,
-            regions=["ap-beijing", "ap-shanghai", "ap-guangzhou", "ap-chengdu", "ap-singapore"]
-        ),
-        Provider(
-            id="runpod",
-            name="runpod",
-            display_name="RunPod",
-            is_available=True,
-            regions=["us-east", "us-west", "eu-central", "ap-southeast"]
-        )
-    ]
-    return providers
+    return Response(
+        content=_PROVIDER_LIST_ADAPTER.dump_json(PROVIDERS),
+        media_type="application/json"
+    )
 
 
 @router.get("/gpu/models", response_model=List[GPUModel])
@@ -46,128 +205,13 @@ async def get_gpu_models(
     """
     获取GPU型号列表
     """
-    # 模拟GPU型号数据
-    gpu_models = [
-        # 阿里云 GPU型号
-        GPUModel(
-            id="alibaba-v100",
-            name="Tesla V100",
-            provider="alibaba",
-            memory_gb=16,
-            compute_capability="7.0",
-            cost_per_hour=2.8,
-            availability="high"
-        ),
-        GPUModel(
-            id="alibaba-a100",
-            name="Tesla A100",
-            provider="alibaba",
-            memory_gb=40,
-            compute_capability="8.0",
-            cost_per_hour=3.9,
-            availability="medium"
-        ),
-        GPUModel(
-            id="alibaba-t4",
-            name="Tesla T4",
-            provider="alibaba",
-            memory_gb=16,
-            compute_capability="7.5",
-            cost_per_hour=0.48,
-            availability="high"
-        ),
-        GPUModel(
-            id="alibaba-rtx3090",
-            name="RTX 3090",
-            provider="alibaba",
-            memory_gb=24,
-            compute_capability="8.6",
-            cost_per_hour=1.25,
-            availability="medium"
-        ),
-        
-        # 腾讯云 GPU型号
-        GPUModel(
-            id="tencent-v100",
-            name="Tesla V100",
-            provider="tencent",
-            memory_gb=16,
-            compute_capability="7.0",
-            cost_per_hour=2.5,
-            availability="high"
-        ),
-        GPUModel(
-            id="tencent-a100",
-            name="Tesla A100",
-            provider="tencent",
-            memory_gb=40,
-            compute_capability="8.0",
-            cost_per_hour=3.8,
-            availability="medium"
-        ),
-        GPUModel(
-            id="tencent-t4",
-            name="Tesla T4",
-            provider="tencent",
-            memory_gb=16,
-            compute_capability="7.5",
-            cost_per_hour=0.42,
-            availability="high"
-        ),
-        GPUModel(
-            id="tencent-k80",
-            name="Tesla K80",
-            provider="tencent",
-            memory_gb=12,
-            compute_capability="3.7",
-            cost_per_hour=0.38,
-            availability="high"
-        ),
-        
-        # RunPod GPU型号
-        GPUModel(
-            id="runpod-v100",
-            name="Tesla V100",
-            provider="runpod",
-            memory_gb=16,
-            compute_capability="7.0",
-            cost_per_hour=1.89,
-            availability="high"
-        ),
-        GPUModel(
-            id="runpod-a100",
-            name="Tesla A100",
-            provider="runpod",
-            memory_gb=80,
-            compute_capability="8.0",
-            cost_per_hour=2.89,
-            availability="medium"
-        ),
-        GPUModel(
-            id="runpod-rtx4090",
-            name="RTX 4090",
-            provider="runpod",
-            memory_gb=24,
-            compute_capability="8.9",
-            cost_per_hour=0.79,
-            availability="high"
-        ),
-        GPUModel(
-            id="runpod-rtx3090",
-            name="RTX 3090",
-            provider="runpod",
-            memory_gb=24,
-            compute_capability="8.6",
-            cost_per_hour=0.59,
-            availability="high"
-        )
-    ]
+    content = _GPU_MODELS_JSON
     
     # 根据provider过滤
     if provider:
-        gpu_models = [gpu for gpu in gpu_models if gpu.provider == provider]
+        content = _GPU_MODELS_JSON_BY_PROVIDER.get(provider, _EMPTY_GPU_LIST_JSON)
     
-    return gpu_models
+    return Response(content=content, media_type="application/json")
 
 
 @router.get("/images", response_model=List[str])
@@ -217,63 +261,67 @@ async def get_docker_images(current_user: User = Depends(current_active_user)):
     return images
 
 
-@router.get("/gpu/pricing", response_model=dict)
+# 基础定价信息（所有用户可见）
+BASE_PRICING_INFO = {
+    "currency": "USD",
+    "unit": "per_hour",
+    "last_updated": "2024-01-01T00:00:00Z",
+    "price_ranges": {
+        "basic": {"min": 0.30, "max": 1.50, "description": "入门级GPU，适合学习和轻量任务"},
+        "professional": {"min": 1.50, "max": 4.00, "description": "专业级GPU，适合生产环境"},
+        "enterprise": {"min": 4.00, "max": 8.00, "description": "企业级GPU，适合大规模计算"}
+    }
+}
+
+# 详细定价信息（仅管理员可见）
+DETAILED_PRICING_INFO = {
+    "aws": {
+        "Tesla V100": {"base_price": 3.06, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
+        "Tesla A100": {"base_price": 4.10, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
+        "Tesla T4": {"base_price": 0.526, "discount_rates": {"weekly": 0.05, "monthly": 0.15}}
+    },
+    "gcp": {
+        "Tesla V100": {"base_price": 2.48, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
+        "Tesla A100": {"base_price": 3.67, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
+        "Tesla T4": {"base_price": 0.35, "discount_rates": {"weekly": 0.05, "monthly": 0.15}}
+    },
+    "azure": {
+        "Tesla V100": {"base_price": 3.20, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
+        "Tesla A100": {"base_price": 4.50, "discount_rates": {"weekly": 0.1, "monthly": 0.2}}
+    },
+    "local": {
+        "RTX 4090": {"base_price": 0.50, "discount_rates": {"weekly": 0.0, "monthly": 0.0}},
+        "RTX 3090": {"base_price": 0.40, "discount_rates": {"weekly": 0.0, "monthly": 0.0}},
+        "Tesla V100": {"base_price": 0.30, "discount_rates": {"weekly": 0.0, "monthly": 0.0}}
+    }
+}
+
+_PRICING_JSON = _encode_json({"success": True, "data": BASE_PRICING_INFO})
+_ADMIN_PRICING_JSON = _encode_json({
+    "success": True,
+    "data": {**BASE_PRICING_INFO, "detailed_pricing": DETAILED_PRICING_INFO}
+})
+
+
+@router.get("/gpu/pricing")
 async def get_gpu_pricing(current_user: User = Depends(current_active_user)):
     """
     获取GPU定价信息（管理员或高级用户可见详细信息）
     """
-    
-    # 基础定价信息（所有用户可见）
-    pricing_info = {
-        "currency": "USD",
-        "unit": "per_hour",
-        "last_updated": "2024-01-01T00:00:00Z",
-        "price_ranges": {
-            "basic": {"min": 0.30, "max": 1.50, "description": "入门级GPU，适合学习和轻量任务"},
-            "professional": {"min": 1.50, "max": 4.00, "description": "专业级GPU，适合生产环境"},
-            "enterprise": {"min": 4.00, "max": 8.00, "description": "企业级GPU，适合大规模计算"}
-        }
-    }
-    
     # 管理员可以看到详细定价
-    if current_user.role.value == "admin":
-        pricing_info["detailed_pricing"] = {
-            "aws": {
-                "Tesla V100": {"base_price": 3.06, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
-                "Tesla A100": {"base_price": 4.10, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
-                "Tesla T4": {"base_price": 0.526, "discount_rates": {"weekly": 0.05, "monthly": 0.15}}
-            },
-            "gcp": {
-                "Tesla V100": {"base_price": 2.48, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
-                "Tesla A100": {"base_price": 3.67, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
-                "Tesla T4": {"base_price": 0.35, "discount_rates": {"weekly": 0.05, "monthly": 0.15}}
-            },
-            "azure": {
-                "Tesla V100": {"base_price": 3.20, "discount_rates": {"weekly": 0.1, "monthly": 0.2}},
-                "Tesla A100": {"base_price": 4.50, "discount_rates": {"weekly": 0.1, "monthly": 0.2}}
-            },
-            "local": {
-                "RTX 4090": {"base_price": 0.50, "discount_rates": {"weekly": 0.0, "monthly": 0.0}},
-                "RTX 3090": {"base_price": 0.40, "discount_rates": {"weekly": 0.0, "monthly": 0.0}},
-                "Tesla V100": {"base_price": 0.30, "discount_rates": {"weekly": 0.0, "monthly": 0.0}}
-            }
-        }
-    
-    return {
-        "success": True,
-        "data": pricing_info
-    }
+    content = _ADMIN_PRICING_JSON if current_user.role.value == "admin" else _PRICING_JSON
+    return Response(content=content, media_type="application/json")
 
 
 @router.post("/cost/compare", response_model=dict)
 async def compare_instances(
-    instance_data: dict,
+    instance_data: CompareRequest,
     current_user: User = Depends(current_active_user)
 ):
     """
     比较不同实例的成本效益
     """
-    instance_ids = instance_data.get("instance_ids", [])
+    instance_ids = instance_data.instance_ids
     
     if not instance_ids:
         return {
@@ -285,17 +333,10 @@ async def compare_instances(
     # 模拟比较结果
     comparison_results = []
     
-    # 获取所有GPU型号
-    all_gpus = await get_gpu_models(current_user=current_user)
-    gpu_dict = {gpu.id: gpu for gpu in all_gpus}
-    
     for instance_id in instance_ids:
-        if instance_id in gpu_dict:
-            gpu = gpu_dict[instance_id]
-            
-            # 计算性能分数（简化算法）
-            performance_score = gpu.memory_gb * 10 + float(gpu.compute_capability) * 50
-            cost_efficiency = performance_score / gpu.cost_per_hour
+        if instance_id in _GPU_BY_ID:
+            gpu = _GPU_BY_ID[instance_id]
+            performance_score, cost_efficiency = _GPU_SCORES[instance_id]
             
             comparison_results.append({
                 "instance_id": instance_id,
@@ -303,8 +344,8 @@ async def compare_instances(
                 "provider": gpu.provider,
                 "cost_per_hour": gpu.cost_per_hour,
                 "memory_gb": gpu.memory_gb,
-                "performance_score": round(performance_score, 2),
-                "cost_efficiency": round(cost_efficiency, 2),
+                "performance_score": performance_score,
+                "cost_efficiency": cost_efficiency,
                 "availability": gpu.availability,
                 "recommendations": {
                     "suitable_for": ["机器学习训练", "深度学习推理"] if gpu.memory_gb >= 16 else ["轻量级计算", "开发测试"],
@@ -313,7 +354,7 @@ async def compare_instances(
             })
     
     # 按成本效益排序
-    comparison_results.sort(key=lambda x: x["cost_efficiency"], reverse=True)
+    comparison_results.sort(key=itemgetter("cost_efficiency"), reverse=True)
     
     return {
         "success": True,
@@ -322,73 +363,77 @@ async def compare_instances(
             "summary": {
                 "total_instances": len(comparison_results),
                 "best_value": comparison_results[0]["instance_id"] if comparison_results else None,
-                "lowest_cost": min(comparison_results, key=lambda x: x["cost_per_hour"])["instance_id"] if comparison_results else None,
-                "highest_performance": max(comparison_results, key=lambda x: x["performance_score"])["instance_id"] if comparison_results else None
+                "lowest_cost": min(comparison_results, key=itemgetter("cost_per_hour"))["instance_id"] if comparison_results else None,
+                "highest_performance": max(comparison_results, key=itemgetter("performance_score"))["instance_id"] if comparison_results else None
             }
         }
     }
 
 
-@router.get("/system/status", response_model=dict)
+# 系统状态信息（模拟数据，不随请求变化）
+SYSTEM_STATUS_INFO = {
+    "system": "healthy",
+    "database": "connected",
+    "gpu_providers": {
+        "aws": "available",
+        "gcp": "available", 
+        "azure": "limited",  # 模拟部分不可用
+        "local": "available"
+    },
+    "active_tasks": 12,  # 模拟数据
+    "queued_tasks": 3,
+    "available_gpus": 45,
+    "last_check": "2024-01-01T12:00:00Z"
+}
+
+
+_SYSTEM_STATUS_JSON = _encode_json({"success": True, "data": SYSTEM_STATUS_INFO})
+
+
+@router.get("/system/status")
 async def get_system_status(current_user: User = Depends(current_active_user)):
     """
     获取系统状态信息
     """
-    status_info = {
-        "system": "healthy",
-        "database": "connected",
-        "gpu_providers": {
-            "aws": "available",
-            "gcp": "available", 
-            "azure": "limited",  # 模拟部分不可用
-            "local": "available"
-        },
-        "active_tasks": 12,  # 模拟数据
-        "queued_tasks": 3,
-        "available_gpus": 45,
-        "last_check": "2024-01-01T12:00:00Z"
-    }
-    
-    return {
-        "success": True,
-        "data": status_info
+    return Response(content=_SYSTEM_STATUS_JSON, media_type="application/json")
+
+
+# 系统配置信息（管理员专用）
+SYSTEM_CONFIG_INFO = {
+    "max_concurrent_tasks": 100,
+    "default_timeout": 3600,
+    "supported_regions": {
+        "aws": ["us-east-1", "us-west-2", "eu-west-1"],
+        "gcp": ["us-central1", "europe-west1"],
+        "azure": ["eastus", "westeurope"]
+    },
+    "resource_limits": {
+        "max_gpu_hours_per_user": 168,  # 一周
+        "max_tasks_per_user": 50,
+        "max_budget_per_task": 1000
+    },
+    "features": {
+        "auto_scaling": True,
+        "cost_optimization": True,
+        "real_time_monitoring": True,
+        "multi_region": True
     }
+}
 
+_SYSTEM_CONFIG_JSON = _encode_json({"success": True, "data": SYSTEM_CONFIG_INFO})
+_ADMIN_REQUIRED_JSON = _encode_json({
+    "success": False,
+    "error": "需要管理员权限",
+    "message": "需要管理员权限"
+})
 
-@router.get("/system/config", response_model=dict) 
+
+@router.get("/system/config")
 async def get_system_config(current_user: User = Depends(current_active_user)):
     """
     获取系统配置信息（管理员专用）
     """
     if current_user.role.value != "admin":
-        return {
-            "success": False,
-            "error": "需要管理员权限",
-            "message": "需要管理员权限"
-        }
-    
-    config_info = {
-        "max_concurrent_tasks": 100,
-        "default_timeout": 3600,
-        "supported_regions": {
-            "aws": ["us-east-1", "us-west-2", "eu-west-1"],
-            "gcp": ["us-central1", "europe-west1"],
-            "azure": ["eastus", "westeurope"]
-        },
-        "resource_limits": {
-            "max_gpu_hours_per_user": 168,  # 一周
-            "max_tasks_per_user": 50,
-            "max_budget_per_task": 1000
-        },
-        "features": {
-            "auto_scaling": True,
-            "cost_optimization": True,
-            "real_time_monitoring": True,
-            "multi_region": True
-        }
-    }
+        return Response(content=_ADMIN_REQUIRED_JSON, media_type="application/json")
     
-    return {
-        "success": True,
-        "data": config_info
-    }
+    return Response(content=_SYSTEM_CONFIG_JSON, media_type="application/json")
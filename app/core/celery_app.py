@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from kombu import Queue, Exchange
 from app.core.config import settings
 
 # 创建Celery实例
@@ -13,6 +14,24 @@ celery_app = Celery(
     ]
 )
 
+# 服务等级队列：仅在集群空闲时才被消费，用于可延迟的长时间GPU作业
+BEST_EFFORT_QUEUE = "best_effort"
+# worker利用率低于该阈值时才消费best_effort队列
+BEST_EFFORT_UTILIZATION_THRESHOLD = 0.5
+
+# 任务路由（精确任务名优先于通配规则匹配）
+_TASK_ROUTES = {
+    "app.tasks.gpu_tasks.*": {"queue": "gpu_tasks"},
+    "app.tasks.gpu_tasks.execute_gpu_task": {
+        "queue": "gpu_tasks",
+        "routing_key": "gpu_tasks",
+    },
+    "app.tasks.gpu_tasks.monitor_task_status": {
+        "queue": "default",
+        "routing_key": "default",
+    },
+}
+
 # Celery配置
 celery_app.conf.update(
     # 任务序列化
@@ -23,9 +42,7 @@ celery_app.conf.update(
     enable_utc=True,
     
     # 任务路由
-    task_routes={
-        "app.tasks.gpu_tasks.*": {"queue": "gpu_tasks"},
-    },
+    task_routes=_TASK_ROUTES,
     
     # 任务结果过期时间
     result_expires=3600,
@@ -54,27 +71,14 @@ celery_app.conf.update(
 )
 
 # 定义队列
-from kombu import Queue, Exchange
-
 celery_app.conf.task_queues = (
     Queue("default", Exchange("default"), routing_key="default"),
     Queue("gpu_tasks", Exchange("gpu_tasks"), routing_key="gpu_tasks"),
     Queue("priority_high", Exchange("priority"), routing_key="priority.high"),
     Queue("priority_low", Exchange("priority"), routing_key="priority.low"),
+    Queue(BEST_EFFORT_QUEUE, Exchange("priority"), routing_key="priority.best_effort"),
 )
 
-# 任务优先级路由
-celery_app.conf.task_routes.update({
-    "app.tasks.gpu_tasks.execute_gpu_task": {
-        "queue": "gpu_tasks",
-        "routing_key": "gpu_tasks",
-    },
-    "app.tasks.gpu_tasks.monitor_task_status": {
-        "queue": "default",
-        "routing_key": "default",
-    },
-})
-
 
 def get_celery_app() -> Celery:
     """获取Celery应用实例"""
@@ -92,6 +96,13 @@ def setup_periodic_tasks(sender, **kwargs):
         name="check-running-tasks"
     )
     
+    # 每分钟根据worker负载决定是否消费best_effort队列
+    sender.add_periodic_task(
+        60.0,
+        "app.tasks.gpu_tasks.dispatch_best_effort_tasks",
+        name="dispatch-best-effort-tasks"
+    )
+    
     # 每小时清理过期任务
     sender.add_periodic_task(
         3600.0,
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from typing import List, Optional, Dict
+from functools import lru_cache
 import secrets
 import os
 
@@ -19,6 +20,8 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./gpu_platform.db"
+    # asyncpg每个连接缓存的预编译语句数量（仅postgresql+asyncpg生效，0为关闭）
+    database_prepared_statement_cache_size: int = Field(default=256)
     
     # CORS
     allowed_origins: List[str] = ["http://localhost:3000", "http://localhost:8000"]
@@ -31,6 +34,13 @@ class Settings(BaseSettings):
     mlflow_tracking_uri: str = "http://localhost:5000"
     mlflow_experiment_name: str = "gpu-compute-platform"
     mlflow_artifact_location: str = "./mlruns"
+    # MLflow HTTP客户端连接池与重试（写入MLflow对应的环境变量）
+    mlflow_http_pool_connections: int = Field(default=4)
+    mlflow_http_pool_maxsize: int = Field(default=16)
+    mlflow_http_max_retries: int = Field(default=3)
+    mlflow_http_backoff_factor: float = Field(default=0.2)
+    # 作业配置等JSON工件是否缩进排版（默认紧凑输出）
+    mlflow_pretty_artifacts: bool = Field(default=False)
     
     # Redis配置
     redis_url: str = Field(default="redis://localhost:6379/0")
@@ -61,6 +71,11 @@ class Settings(BaseSettings):
     enable_intelligent_scheduling: bool = Field(default=True)
     scheduling_update_interval_seconds: int = Field(default=300)  # 5分钟
     
+    # WebSocket推送：进度/日志消息的合并窗口（毫秒），0为逐条立即发送
+    websocket_write_delay_ms: int = Field(default=30)
+    # WebSocket permessage-deflate压缩（客户端协商支持时生效，大段日志推送可显著减小流量）
+    websocket_per_message_deflate: bool = Field(default=True)
+    
     # 监控和日志
     enable_mlflow: bool = Field(default=True)
     log_level: str = Field(default="INFO")
@@ -107,4 +122,10 @@ class Settings(BaseSettings):
     model_config = {"env_file": ".env", "case_sensitive": False}
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取全局配置实例（只解析一次环境变量）"""
+    return Settings()
+
+
+settings = get_settings()
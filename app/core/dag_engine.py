@@ -1,18 +1,27 @@
+import ast
+import copy
+import hashlib
 import json
 import logging
 import asyncio
+import re
+import uuid
 from datetime import datetime, timezone
+from types import CodeType
 from typing import Dict, List, Optional, Any, Set, Tuple
-from dataclasses import dataclass
-from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from collections import deque
+from functools import lru_cache
 
 from celery import chain, group, chord
 from celery.result import GroupResult
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from app.core.database import get_async_session
 
 from app.core.celery_app import celery_app
+from app.core.config import settings
 from app.models.dag import (
     TaskDAG, DAGRun, DAGNode, DAGNodeRun, DAGEdge,
     DAGStatus, NodeStatus, NodeType
@@ -21,8 +30,117 @@ from app.models.task import GpuTask, TaskStatus
 from app.tasks.gpu_tasks import execute_gpu_task
 from app.core.mlflow_config import MLflowTaskTracker
 
+# Webhook节点的HTTP/2需要h2依赖，缺失时回退到HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+# 优先使用uvloop驱动Celery worker中的DAG事件循环（uvicorn[standard]已带入该依赖）
+try:
+    import uvloop
+    HAS_UVLOOP = True
+except ImportError:
+    HAS_UVLOOP = False
+
 logger = logging.getLogger(__name__)
 
+# GPU任务节点等待Celery结果的超时时间及轮询退避参数（秒）
+TASK_NODE_TIMEOUT_SECONDS = 3600
+RESULT_POLL_INITIAL_DELAY = 0.1
+RESULT_POLL_MAX_DELAY = 5.0
+
+# 节点结果缓存：配置中声明 "cache": true 的节点在配置和上游输出不变时直接复用上次结果
+NODE_CACHE_KEY_PREFIX = "dag:node_cache:"
+NODE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# 流式加载DAG节点时每批读取的行数
+DAG_NODE_FETCH_BATCH_SIZE = 500
+
+# Webhook节点共享HTTP客户端的超时与连接池配置
+WEBHOOK_TIMEOUT_SECONDS = 30
+WEBHOOK_MAX_KEEPALIVE_CONNECTIONS = 100
+
+
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    """创建新的事件循环，可用时使用uvloop"""
+    if HAS_UVLOOP:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+# 条件表达式允许的语法节点：比较、布尔运算、常量以及对节点输出/变量的属性访问
+_CONDITION_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Constant, ast.Name, ast.Load, ast.Attribute, ast.List, ast.Tuple,
+)
+_CONDITION_NAMES = frozenset({"node_output", "variables"})
+_CONDITION_GLOBALS = {"__builtins__": {}}
+
+
+@lru_cache(maxsize=1024)
+def _compile_condition(condition: str) -> CodeType:
+    """校验并编译条件表达式，同一表达式只解析一次"""
+    tree = ast.parse(condition, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _CONDITION_ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in condition: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in _CONDITION_NAMES:
+            raise ValueError(f"Unknown name in condition: {node.id}")
+        if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+            raise ValueError(f"Private attribute access in condition: {node.attr}")
+    return compile(tree, "<condition>", "eval")
+
+
+class _ConditionView:
+    """以属性方式只读访问字典数据，不存在的键返回空字符串"""
+    
+    __slots__ = ("_data",)
+    
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+    
+    def __getattr__(self, name: str) -> Any:
+        value = self._data.get(name, "")
+        return _ConditionView(value) if isinstance(value, dict) else value
+
+
+# 整个字符串为变量引用时匹配，如 "${node_output.task1.status}"
+_VAR_RE = re.compile(r"\$\{([^}]+)\}")
+
+
+def _parse_variable_ref(value: str) -> Optional[Tuple[str, ...]]:
+    """解析 "${node_output.<node_id>.<key>...}"，返回 (node_id, key, ...)；不是变量引用时返回None"""
+    match = _VAR_RE.fullmatch(value)
+    if match:
+        var_path = match.group(1).split(".")
+        if len(var_path) >= 2 and var_path[0] == "node_output":
+            return tuple(var_path[1:])
+    return None
+
+
+def _collect_substitutions(data: Any, path: Tuple = ()) -> List[Tuple[Tuple, Tuple[str, ...]]]:
+    """遍历数据结构，收集所有变量引用的 (在数据中的路径, 变量路径)"""
+    if isinstance(data, dict):
+        return [sub for k, v in data.items() for sub in _collect_substitutions(v, path + (k,))]
+    if isinstance(data, list):
+        return [sub for i, item in enumerate(data) for sub in _collect_substitutions(item, path + (i,))]
+    if isinstance(data, str):
+        ref = _parse_variable_ref(data)
+        if ref is not None:
+            return [(path, ref)]
+    return []
+
+
+@lru_cache(maxsize=1024)
+def _compile_webhook_payload(node_config: str) -> Tuple[Any, Tuple[Tuple[Tuple, Tuple[str, ...]], ...]]:
+    """按节点原始配置预编译Webhook payload模板，同一配置只遍历一次"""
+    payload = json.loads(node_config).get("payload", {})
+    return payload, tuple(_collect_substitutions(payload))
+
 
 @dataclass
 class DAGExecutionContext:
@@ -48,17 +166,39 @@ class DAGExecutionContext:
         return self.outputs.get(node_id, default)
 
 
+@dataclass
+class PendingWrites:
+    """暂存的节点运行记录写操作，在调度轮次之间一次性提交"""
+    status_updates: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # {node_run_id: 更新字段}
+    
+    def __bool__(self) -> bool:
+        return bool(self.status_updates)
+    
+    def set_status(self, node_run_id: str, status: NodeStatus, **kwargs):
+        """暂存节点状态更新，同一节点的多次更新会合并"""
+        self.status_updates.setdefault(node_run_id, {"id": node_run_id}).update(status=status, **kwargs)
+    
+    async def flush(self, session: AsyncSession):
+        """按主键批量写入暂存的状态并提交一次"""
+        await session.execute(update(DAGNodeRun), list(self.status_updates.values()))
+        await session.commit()
+        self.status_updates = {}
+
+
 class DAGTopologyAnalyzer:
     """DAG拓扑分析器"""
     
     @staticmethod
     def build_dependency_graph(nodes: List[DAGNode]) -> Dict[str, Set[str]]:
-        """构建依赖图"""
-        graph = defaultdict(set)
+        """构建依赖图（依赖节点 -> 依赖它的节点集合），每个节点都有对应的键"""
+        graph = {node.node_id: set() for node in nodes}
         for node in nodes:
-            dependencies = node.get_dependencies()
-            for dep in dependencies:
-                graph[dep].add(node.node_id)
+            for dep in node.get_dependencies():
+                successors = graph.get(dep)
+                if successors is None:
+                    # 保留对不存在节点的依赖边，便于调用方发现无效依赖
+                    successors = graph[dep] = set()
+                successors.add(node.node_id)
         return graph
     
     @staticmethod
@@ -66,24 +206,20 @@ class DAGTopologyAnalyzer:
         """拓扑排序，返回执行顺序。
         忽略对不存在节点的依赖，使其不影响入度计算。
         """
-        # 构建入度表和邻接表
-        in_degree = defaultdict(int)
-        graph = defaultdict(list)
-        node_ids = {n.node_id for n in nodes}
+        # 预先为每个节点分配入度和邻接表项，之后直接按键索引
+        graph = {node.node_id: [] for node in nodes}
+        in_degree = dict.fromkeys(graph, 0)
         
-        # 初始化所有节点的入度为0
+        # 单次遍历构建入度表和邻接表（忽略不存在的依赖），每个节点只解析一次依赖
         for node in nodes:
-            in_degree[node.node_id] = 0
-        
-        # 构建图和计算入度（忽略不存在的依赖）
-        for node in nodes:
-            dependencies = [d for d in node.get_dependencies() if d in node_ids]
-            in_degree[node.node_id] = len(dependencies)
-            for dep in dependencies:
-                graph[dep].append(node.node_id)
+            for dep in node.get_dependencies():
+                successors = graph.get(dep)
+                if successors is not None:
+                    successors.append(node.node_id)
+                    in_degree[node.node_id] += 1
         
         # Kahn算法进行拓扑排序
-        queue = deque([node_id for node_id in in_degree if in_degree[node_id] == 0])
+        queue = deque([node_id for node_id, degree in in_degree.items() if degree == 0])
         result = []
         
         while queue:
@@ -126,6 +262,70 @@ class DAGNodeExecutor:
     
     def __init__(self, session: AsyncSession):
         self.session = session
+        # 同一轮中的节点并发执行，但AsyncSession不支持并发操作，数据库访问需串行化
+        self._session_lock = asyncio.Lock()
+        # 同一次DAG运行中所有Webhook节点复用的HTTP客户端（首次使用时在当前事件循环中创建）
+        self._http_client = None
+        # 暂存的节点状态写操作，由引擎在每轮调度前统一提交
+        self.pending_writes = PendingWrites()
+        # 节点结果缓存使用的Redis客户端（首次使用时创建）
+        self._cache_client = None
+    
+    def _get_http_client(self):
+        """获取共享的HTTP客户端"""
+        if self._http_client is None:
+            import httpx
+            
+            self._http_client = httpx.AsyncClient(
+                http2=HAS_HTTP2,
+                timeout=WEBHOOK_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_keepalive_connections=WEBHOOK_MAX_KEEPALIVE_CONNECTIONS)
+            )
+        return self._http_client
+    
+    async def aclose(self):
+        """释放执行器持有的HTTP和Redis连接"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._cache_client is not None:
+            await self._cache_client.aclose()
+            self._cache_client = None
+    
+    def _node_cache_key(self, node: DAGNode, context: DAGExecutionContext) -> str:
+        """根据节点类型、配置和上游输出计算缓存键"""
+        material = json.dumps(
+            {
+                "node_type": node.node_type,
+                "config": node.node_config,
+                "upstream": {dep: context.get_node_output(dep) for dep in node.get_dependencies()},
+            },
+            sort_keys=True,
+            default=str
+        )
+        return NODE_CACHE_KEY_PREFIX + hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()
+    
+    async def _get_cached_output(self, cache_key: str) -> Tuple[bool, Any]:
+        """读取节点缓存结果，返回(是否命中, 输出)；缓存不可用时视为未命中"""
+        try:
+            if self._cache_client is None:
+                self._cache_client = aioredis.from_url(settings.redis_url)
+            cached = await self._cache_client.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Node cache lookup failed: {e}")
+            return False, None
+        if cached is None:
+            return False, None
+        return True, json.loads(cached)
+    
+    async def _set_cached_output(self, cache_key: str, output: Any):
+        """写入节点缓存结果，失败时仅记录日志"""
+        try:
+            if self._cache_client is None:
+                self._cache_client = aioredis.from_url(settings.redis_url)
+            await self._cache_client.set(cache_key, json.dumps(output, default=str), ex=NODE_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Node cache store failed: {e}")
     
     async def execute_node(
         self, 
@@ -133,15 +333,23 @@ class DAGNodeExecutor:
         node_run: DAGNodeRun, 
         context: DAGExecutionContext
     ) -> bool:
-        """执行DAG节点"""
+        """执行DAG节点
+        只有真正派发GPU任务的节点会写入运行中状态（随GPU任务记录一起提交）；
+        缓存命中、条件判断等快速路径直接从PENDING进入最终状态。
+        最终状态只写入pending_writes，由引擎在下一轮调度前统一提交。
+        """
+        started_at = datetime.now(timezone.utc)
         
         try:
-            # 更新节点状态为运行中
-            await self._update_node_run_status(
-                node_run.id, 
-                NodeStatus.RUNNING, 
-                started_at=datetime.now(timezone.utc)
-            )
+            cache_key = None
+            if node.get_config().get("cache"):
+                cache_key = self._node_cache_key(node, context)
+                hit, output = await self._get_cached_output(cache_key)
+                if hit:
+                    logger.info(f"Node {node.node_id} restored from cache")
+                    context.set_node_output(node.node_id, output)
+                    self._queue_final_status(node_run, NodeStatus.COMPLETED, started_at)
+                    return True
             
             success = False
             
@@ -155,26 +363,44 @@ class DAGNodeExecutor:
                 logger.warning(f"Unsupported node type: {node.node_type}")
                 success = True  # 跳过未支持的节点类型
             
-            # 更新最终状态
+            if success and cache_key is not None:
+                await self._set_cached_output(cache_key, context.get_node_output(node.node_id))
+            
+            # 暂存最终状态
             final_status = NodeStatus.COMPLETED if success else NodeStatus.FAILED
-            await self._update_node_run_status(
-                node_run.id,
-                final_status,
-                completed_at=datetime.now(timezone.utc)
-            )
+            self._queue_final_status(node_run, final_status, started_at)
             
             return success
             
         except Exception as e:
             logger.error(f"Node execution failed: {e}")
-            await self._update_node_run_status(
-                node_run.id,
-                NodeStatus.FAILED,
-                completed_at=datetime.now(timezone.utc),
-                error_message=str(e)
-            )
+            self._queue_final_status(node_run, NodeStatus.FAILED, started_at, error_message=str(e))
             return False
     
+    def _queue_final_status(
+        self,
+        node_run: DAGNodeRun,
+        status: NodeStatus,
+        started_at: datetime,
+        **kwargs
+    ):
+        """暂存节点最终状态；未写过运行中状态的节点一并补上开始时间"""
+        if node_run.started_at is None:
+            kwargs["started_at"] = started_at
+        self._queue_node_run_status(node_run.id, status, completed_at=datetime.now(timezone.utc), **kwargs)
+    
+    def _queue_node_run_status(self, node_run_id: str, status: NodeStatus, **kwargs):
+        """暂存节点运行状态更新"""
+        self.pending_writes.set_status(node_run_id, status, **kwargs)
+    
+    async def flush_pending_writes(self):
+        """提交所有暂存的节点状态写操作（一次提交）"""
+        if not self.pending_writes:
+            return
+        
+        async with self._session_lock:
+            await self.pending_writes.flush(self.session)
+    
     async def _execute_task_node(
         self, 
         node: DAGNode, 
@@ -184,37 +410,46 @@ class DAGNodeExecutor:
         """执行GPU任务节点"""
         try:
             # 解析节点配置
-            config = json.loads(node.node_config)
+            config = node.get_config()
+            
+            # 预先生成GPU任务ID和Celery任务ID，使所有关联字段在派发前一次提交
+            # （worker会按ID读取GPU任务，这次提交不能推迟到pending_writes）
+            celery_task_id = str(uuid.uuid4())
             
             # 创建GPU任务
             gpu_task = GpuTask(
+                id=str(uuid.uuid4()),
                 name=f"{node.node_name}",
                 description=f"DAG节点任务: {node.node_name}",
                 user_id=config.get("user_id"),
                 provider_name=config.get("provider_name"),
                 job_config=json.dumps(config.get("job_config", {})),
-                status=TaskStatus.PENDING
+                status=TaskStatus.PENDING,
+                celery_task_id=celery_task_id
             )
             
-            self.session.add(gpu_task)
-            await self.session.commit()
-            await self.session.refresh(gpu_task)
-            
-            # 关联GPU任务到节点运行
+            # 关联GPU任务和Celery任务到节点运行，并随同一次提交标记为运行中
             node_run.gpu_task_id = gpu_task.id
-            await self.session.commit()
+            node_run.celery_task_id = celery_task_id
+            node_run.status = NodeStatus.RUNNING
+            node_run.started_at = datetime.now(timezone.utc)
+            
+            async with self._session_lock:
+                self.session.add(gpu_task)
+                await self.session.commit()
             
             # 提交Celery任务
             provider_config = config.get("provider_config", {})
-            celery_task = execute_gpu_task.delay(gpu_task.id, provider_config)
-            
-            # 更新Celery任务ID
-            node_run.celery_task_id = celery_task.id
-            gpu_task.celery_task_id = celery_task.id
-            await self.session.commit()
+            celery_task = execute_gpu_task.apply_async(
+                args=[gpu_task.id, provider_config],
+                task_id=celery_task_id
+            )
             
-            # 等待任务完成（这里可以异步轮询）
-            result = celery_task.get(timeout=3600)  # 1小时超时
+            # 异步轮询等待任务完成，不阻塞事件循环上的其他节点
+            result = await asyncio.wait_for(
+                self._wait_for_celery_result(celery_task),
+                timeout=TASK_NODE_TIMEOUT_SECONDS
+            )
             
             # 设置节点输出
             context.set_node_output(node.node_id, result)
@@ -225,6 +460,17 @@ class DAGNodeExecutor:
             logger.error(f"Task node execution failed: {e}")
             return False
     
+    async def _wait_for_celery_result(self, celery_task) -> Any:
+        """以指数退避轮询Celery任务结果"""
+        delay = RESULT_POLL_INITIAL_DELAY
+        while not celery_task.ready():
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, RESULT_POLL_MAX_DELAY)
+        
+        if celery_task.failed():
+            raise RuntimeError(f"Celery task {celery_task.id} failed: {celery_task.result}")
+        return celery_task.result
+    
     async def _execute_condition_node(
         self, 
         node: DAGNode, 
@@ -233,7 +479,7 @@ class DAGNodeExecutor:
     ) -> bool:
         """执行条件节点"""
         try:
-            config = json.loads(node.node_config)
+            config = node.get_config()
             condition = config.get("condition", "")
             
             # 简单的条件评估（可以扩展为更复杂的表达式）
@@ -257,76 +503,83 @@ class DAGNodeExecutor:
     ) -> bool:
         """执行Webhook节点"""
         try:
-            import httpx
-            
-            config = json.loads(node.node_config)
+            config = node.get_config()
             url = config.get("url")
             method = config.get("method", "POST")
             headers = config.get("headers", {})
-            payload = config.get("payload", {})
-            
-            # 替换payload中的变量
-            payload = self._substitute_variables(payload, context)
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.request(
-                    method=method,
-                    url=url,
-                    headers=headers,
-                    json=payload,
-                    timeout=30
-                )
-                
-                success = 200 <= response.status_code < 300
-                
-                # 设置节点输出
-                context.set_node_output(node.node_id, {
-                    "status_code": response.status_code,
-                    "response": response.json() if success else response.text
-                })
-                
-                return success
+            
+            # 替换payload中的变量（模板与替换位置按配置缓存）
+            template, substitutions = _compile_webhook_payload(node.node_config)
+            payload = self._render_template(template, substitutions, context)
+            
+            response = await self._get_http_client().request(
+                method=method,
+                url=url,
+                headers=headers,
+                json=payload
+            )
+            
+            success = 200 <= response.status_code < 300
+            
+            # 设置节点输出
+            context.set_node_output(node.node_id, {
+                "status_code": response.status_code,
+                "response": response.json() if success else response.text
+            })
+            
+            return success
                 
         except Exception as e:
             logger.error(f"Webhook node execution failed: {e}")
             return False
     
     def _evaluate_condition(self, condition: str, context: DAGExecutionContext) -> bool:
-        """评估条件表达式"""
-        # 简单的条件评估实现
-        # 在生产环境中应该使用更安全的表达式评估器
+        """评估条件表达式
+        支持的格式: "node_output.task1.status == 'success'"
+        """
         try:
-            # 替换变量
-            eval_condition = self._substitute_condition_variables(condition, context)
-            return eval(eval_condition)  # 注意：在生产环境中不要使用eval
-        except:
+            code = _compile_condition(condition)
+            names = {
+                "node_output": _ConditionView(context.outputs),
+                "variables": _ConditionView(context.variables),
+            }
+            return bool(eval(code, _CONDITION_GLOBALS, names))
+        except Exception as e:
+            logger.warning(f"Failed to evaluate condition {condition!r}: {e}")
             return False
     
     def _substitute_variables(self, data: Any, context: DAGExecutionContext) -> Any:
         """替换数据中的变量"""
-        if isinstance(data, dict):
-            return {k: self._substitute_variables(v, context) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self._substitute_variables(item, context) for item in data]
-        elif isinstance(data, str):
-            # 简单的变量替换: ${node_output.task1.status}
-            if data.startswith("${") and data.endswith("}"):
-                var_path = data[2:-1].split(".")
-                if len(var_path) >= 2 and var_path[0] == "node_output":
-                    node_id = var_path[1]
-                    output = context.get_node_output(node_id, {})
-                    for key in var_path[2:]:
-                        output = output.get(key, "") if isinstance(output, dict) else ""
-                    return output
-            return data
-        else:
-            return data
-    
-    def _substitute_condition_variables(self, condition: str, context: DAGExecutionContext) -> str:
-        """替换条件表达式中的变量"""
-        # 这里应该实现更安全的变量替换
-        # 暂时使用简单的字符串替换
-        return condition
+        return self._render_template(data, _collect_substitutions(data), context)
+    
+    def _render_template(
+        self,
+        template: Any,
+        substitutions: Tuple[Tuple[Tuple, Tuple[str, ...]], ...],
+        context: DAGExecutionContext
+    ) -> Any:
+        """按预先收集的替换位置填充变量；没有变量时直接返回模板（调用方不得修改）"""
+        if not substitutions:
+            return template
+        
+        result = copy.deepcopy(template)
+        for dst, ref in substitutions:
+            value = self._resolve_variable(ref, context)
+            if not dst:
+                # 模板本身就是变量引用
+                return value
+            target = result
+            for key in dst[:-1]:
+                target = target[key]
+            target[dst[-1]] = value
+        return result
+    
+    def _resolve_variable(self, ref: Tuple[str, ...], context: DAGExecutionContext) -> Any:
+        """解析变量引用: ${node_output.task1.status}"""
+        output = context.get_node_output(ref[0], {})
+        for key in ref[1:]:
+            output = output.get(key, "") if isinstance(output, dict) else ""
+        return output
     
     async def _update_node_run_status(
         self, 
@@ -337,8 +590,9 @@ class DAGNodeExecutor:
         """更新节点运行状态"""
         update_data = {"status": status, **kwargs}
         stmt = update(DAGNodeRun).where(DAGNodeRun.id == node_run_id).values(**update_data)
-        await self.session.execute(stmt)
-        await self.session.commit()
+        async with self._session_lock:
+            await self.session.execute(stmt)
+            await self.session.commit()
 
 
 class DAGEngine:
@@ -356,8 +610,7 @@ class DAGEngine:
                 raise ValueError(f"DAG run {dag_run_id} not found")
             
             # 获取DAG定义
-            dag = dag_run.dag
-            nodes = dag.dag_nodes
+            nodes = await self._load_dag_nodes(session, dag_run.dag_id)
             
             # 验证DAG
             if not DAGTopologyAnalyzer.validate_dag(nodes):
@@ -382,7 +635,10 @@ class DAGEngine:
             node_executor = DAGNodeExecutor(session)
             
             # 执行DAG
-            success = await self._execute_dag_nodes(session, nodes, node_executor, context)
+            try:
+                success = await self._execute_dag_nodes(session, nodes, node_executor, context)
+            finally:
+                await node_executor.aclose()
             
             # 更新最终状态
             final_status = DAGStatus.COMPLETED if success else DAGStatus.FAILED
@@ -419,49 +675,68 @@ class DAGEngine:
         failed_nodes = set()
         node_map = {node.node_id: node for node in nodes}
         
-        # 创建节点运行记录
-        node_runs = {}
-        for node in nodes:
-            node_run = DAGNodeRun(
+        # 批量创建节点运行记录（一次flush以executemany方式写入）
+        node_runs = {
+            node.node_id: DAGNodeRun(
                 dag_run_id=context.dag_run_id,
                 node_id=node.id,
                 status=NodeStatus.PENDING
             )
-            session.add(node_run)
-            node_runs[node.node_id] = node_run
-        
+            for node in nodes
+        }
+        session.add_all(node_runs.values())
         await session.commit()
         
+        # 构建入度表和后继表（忽略对不存在节点的依赖，与拓扑排序保持一致）
+        in_degree = {}
+        successors = {node.node_id: [] for node in nodes}
+        for node in nodes:
+            dependencies = {d for d in node.get_dependencies() if d in node_map}
+            in_degree[node.node_id] = len(dependencies)
+            for dep in dependencies:
+                successors[dep].append(node.node_id)
+        
+        # Kahn算法：节点完成时递减后继入度，入度归零的节点进入下一轮
+        ready_nodes = [node_id for node_id, degree in in_degree.items() if degree == 0]
+        
         # 循环执行直到所有节点完成
         while len(completed_nodes) + len(failed_nodes) < len(nodes):
-            # 查找可以执行的节点
-            ready_nodes = DAGTopologyAnalyzer.find_ready_nodes(nodes, completed_nodes)
-            ready_nodes = [nid for nid in ready_nodes if nid not in failed_nodes]
-            
             if not ready_nodes:
                 # 没有可执行的节点，可能存在循环依赖或者所有剩余节点都被阻塞
                 logger.error("No ready nodes found, DAG execution stuck")
+                await node_executor.flush_pending_writes()
                 return False
             
+            # 上一轮所有节点的最终状态在本轮执行前一次提交
+            await node_executor.flush_pending_writes()
+            
             # 并行执行准备就绪的节点
-            tasks = []
-            for node_id in ready_nodes:
-                node = node_map[node_id]
-                node_run = node_runs[node_id]
-                task = node_executor.execute_node(node, node_run, context)
-                tasks.append((node_id, task))
-            
-            # 等待所有任务完成
-            for node_id, task in tasks:
-                try:
-                    success = await task
-                    if success:
-                        completed_nodes.add(node_id)
-                    else:
-                        failed_nodes.add(node_id)
-                except Exception as e:
-                    logger.error(f"Node {node_id} execution failed: {e}")
+            results = await asyncio.gather(
+                *(
+                    node_executor.execute_node(node_map[node_id], node_runs[node_id], context)
+                    for node_id in ready_nodes
+                ),
+                return_exceptions=True
+            )
+            
+            next_ready_nodes = []
+            for node_id, result in zip(ready_nodes, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Node {node_id} execution failed: {result}")
+                    failed_nodes.add(node_id)
+                elif result:
+                    completed_nodes.add(node_id)
+                    for successor in successors[node_id]:
+                        in_degree[successor] -= 1
+                        if in_degree[successor] == 0:
+                            next_ready_nodes.append(successor)
+                else:
                     failed_nodes.add(node_id)
+            
+            ready_nodes = next_ready_nodes
+        
+        # 写入最后一轮的最终状态
+        await node_executor.flush_pending_writes()
         
         # 检查是否所有节点都成功完成
         return len(failed_nodes) == 0
@@ -472,6 +747,16 @@ class DAGEngine:
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
     
+    async def _load_dag_nodes(self, session: AsyncSession, dag_id: str) -> List[DAGNode]:
+        """按批流式读取DAG节点，避免一次缓冲整个结果集"""
+        stmt = (
+            select(DAGNode)
+            .where(DAGNode.dag_id == dag_id)
+            .execution_options(yield_per=DAG_NODE_FETCH_BATCH_SIZE)
+        )
+        result = await session.stream_scalars(stmt)
+        return [node async for node in result]
+    
     async def _update_dag_run_status(
         self, 
         session: AsyncSession, 
@@ -503,20 +788,9 @@ def execute_dag_task(self, dag_run_id: str):
         finally:
             await session.close()
     
-    # 在Celery任务中运行异步函数
-    try:
-        # 如果已有事件循环在运行（例如pytest-asyncio环境），避免嵌套运行
-        running_loop = asyncio.get_running_loop()
-        running_loop.create_task(_execute())
-        return True
-    except RuntimeError:
-        # 无运行中的loop，创建新的事件循环执行
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_execute())
-        finally:
-            loop.close()
+    # 在独立的事件循环中运行到DAG结束，任务结果反映真实的执行结果
+    with asyncio.Runner(loop_factory=_new_event_loop) as runner:
+        return runner.run(_execute())
 
 
 # 全局DAG引擎实例
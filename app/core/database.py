@@ -3,11 +3,18 @@ from sqlalchemy.orm import DeclarativeBase
 from app.core.config import settings
 
 
+# asyncpg keeps a per-connection cache of server-side prepared statements, so
+# fixed-shape queries (e.g. the task stats aggregate) are parsed and planned once
+_connect_args = {}
+if settings.database_url.startswith("postgresql+asyncpg"):
+    _connect_args["prepared_statement_cache_size"] = settings.database_prepared_statement_cache_size
+
 # Create async engine
 engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
-    future=True
+    future=True,
+    connect_args=_connect_args
 )
 
 # Create async session factory
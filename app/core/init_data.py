@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime, timezone
 from fastapi_users.password import PasswordHelper
+import asyncio
 import json
 import uuid
 
@@ -13,92 +14,71 @@ from app.models.task import GpuTask, TaskStatus, TaskPriority
 from app.core.database import get_async_session
 
 
+# 演示用户（前两个分别作为管理员和普通用户返回给任务创建）
+DEMO_USERS = [
+    {
+        "email": "admin@example.com",
+        "password": "admin123",
+        "nickname": "管理员",
+        "role": UserRole.ADMIN
+    },
+    {
+        "email": "user@example.com",
+        "password": "user123",
+        "nickname": "测试用户",
+        "role": UserRole.USER
+    },
+    {
+        "email": "alice@example.com",
+        "password": "alice123",
+        "nickname": "Alice",
+        "role": UserRole.USER
+    },
+    {
+        "email": "bob@example.com",
+        "password": "bob123",
+        "nickname": "Bob",
+        "role": UserRole.USER
+    }
+]
+
+
 async def create_demo_users(session: AsyncSession):
     """创建演示用户"""
     password_helper = PasswordHelper()
     
-    # 检查管理员用户是否已存在
-    admin_stmt = select(User).where(User.email == "admin@example.com")
-    admin_result = await session.execute(admin_stmt)
-    admin_user = admin_result.scalar_one_or_none()
+    # 一次查询所有演示用户是否已存在
+    emails = [user_data["email"] for user_data in DEMO_USERS]
+    existing_stmt = select(User.email, User.id).where(User.email.in_(emails))
+    existing = {row.email: row.id for row in (await session.execute(existing_stmt)).all()}
     
-    if not admin_user:
-        # 创建管理员用户
-        admin_user = User(
-            email="admin@example.com",
-            hashed_password=password_helper.hash("admin123"),
-            nickname="管理员",
-            role=UserRole.ADMIN,
-            is_active=True,
-            is_verified=True,
-            created_at=datetime.now(timezone.utc)
-        )
-        session.add(admin_user)
-        print("✓ 创建管理员用户: admin@example.com / admin123")
+    missing_users = [user_data for user_data in DEMO_USERS if user_data["email"] not in existing]
     
-    # 检查普通用户是否已存在
-    user_stmt = select(User).where(User.email == "user@example.com")
-    user_result = await session.execute(user_stmt)
-    regular_user = user_result.scalar_one_or_none()
+    # 密码哈希是CPU密集操作，放到线程池并行计算，避免串行阻塞事件循环
+    hashed_passwords = await asyncio.gather(*(
+        asyncio.to_thread(password_helper.hash, user_data["password"])
+        for user_data in missing_users
+    ))
     
-    if not regular_user:
-        # 创建普通用户
-        regular_user = User(
-            email="user@example.com",
-            hashed_password=password_helper.hash("user123"),
-            nickname="测试用户",
-            role=UserRole.USER,
+    for user_data, hashed_password in zip(missing_users, hashed_passwords):
+        new_user = User(
+            id=uuid.uuid4(),
+            email=user_data["email"],
+            hashed_password=hashed_password,
+            nickname=user_data["nickname"],
+            role=user_data["role"],
             is_active=True,
             is_verified=True,
             created_at=datetime.now(timezone.utc)
         )
-        session.add(regular_user)
-        print("✓ 创建普通用户: user@example.com / user123")
-    
-    # 创建额外的测试用户
-    test_users = [
-        {
-            "email": "alice@example.com",
-            "password": "alice123",
-            "nickname": "Alice",
-            "role": UserRole.USER
-        },
-        {
-            "email": "bob@example.com", 
-            "password": "bob123",
-            "nickname": "Bob",
-            "role": UserRole.USER
-        }
-    ]
-    
-    for user_data in test_users:
-        stmt = select(User).where(User.email == user_data["email"])
-        result = await session.execute(stmt)
-        existing_user = result.scalar_one_or_none()
-        
-        if not existing_user:
-            new_user = User(
-                email=user_data["email"],
-                hashed_password=password_helper.hash(user_data["password"]),
-                nickname=user_data["nickname"],
-                role=user_data["role"],
-                is_active=True,
-                is_verified=True,
-                created_at=datetime.now(timezone.utc)
-            )
-            session.add(new_user)
-            print(f"✓ 创建用户: {user_data['email']} / {user_data['password']}")
+        session.add(new_user)
+        existing[new_user.email] = new_user.id
+        print(f"✓ 创建用户: {user_data['email']} / {user_data['password']}")
     
     await session.commit()
     
     # 返回用户ID用于创建任务
-    admin_result = await session.execute(select(User).where(User.email == "admin@example.com"))
-    admin_user = admin_result.scalar_one()
-    
-    user_result = await session.execute(select(User).where(User.email == "user@example.com"))
-    regular_user = user_result.scalar_one()
-    
-    return str(admin_user.id), str(regular_user.id)
+    return str(existing["admin@example.com"]), str(existing["user@example.com"])
 
 
 async def create_demo_tasks(session: AsyncSession, admin_id: str, user_id: str):
@@ -289,5 +269,4 @@ async def initialize_demo_data():
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(initialize_demo_data())
@@ -0,0 +1,503 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from enum import Enum
+from functools import cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from mlflow.entities import Metric, Param, RunTag
+
+logger = logging.getLogger(__name__)
+
+# 任务日志写入MLflow时保留的最大字符数（保留末尾部分）
+TASK_LOG_MAX_LENGTH = 10000
+LOG_TRUNCATED_MARKER = "\n[... truncated ...]"
+
+# 作业配置中作为MLflow参数记录的字段
+JOB_CONFIG_PARAM_KEYS = (
+    "provider",
+    "gpu_model",
+    "image",
+    "scheduling_strategy",
+    "max_duration",
+    "budget_limit",
+)
+
+# 任务结束前等待后台日志写完的最长时间（秒）
+MLFLOW_FLUSH_TIMEOUT_SECONDS = 30
+
+# 后台线程遇到临时性错误（网络错误、服务端5xx/429）时的最大重试次数及退避基数（秒）
+MLFLOW_WORKER_MAX_RETRIES = 3
+MLFLOW_WORKER_RETRY_BACKOFF_SECONDS = 0.5
+
+# 实验ID缓存有效期（秒），过期后重新按名称查询，以发现被删除重建的实验
+EXPERIMENT_ID_CACHE_TTL_SECONDS = 300
+
+
+@cache
+def _get_mlflow_module():
+    """延迟导入mlflow
+    
+    mlflow依赖较多，只在创建MLflowManager时才加载，
+    未启用MLflow的进程（如测试）导入本模块不会加载它。
+    """
+    import mlflow
+    import mlflow.entities
+    import mlflow.tracking
+    return mlflow
+
+
+def _configure_http_client():
+    """配置MLflow REST客户端的连接池和重试策略
+    
+    MLflow在每个进程内缓存一个带keep-alive连接池的requests.Session，
+    这里通过其环境变量调整池大小和重试次数；已显式设置的环境变量优先。
+    """
+    os.environ.setdefault("MLFLOW_HTTP_POOL_CONNECTIONS", str(settings.mlflow_http_pool_connections))
+    os.environ.setdefault("MLFLOW_HTTP_POOL_MAXSIZE", str(settings.mlflow_http_pool_maxsize))
+    os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", str(settings.mlflow_http_max_retries))
+    os.environ.setdefault("MLFLOW_HTTP_REQUEST_BACKOFF_FACTOR", str(settings.mlflow_http_backoff_factor))
+
+
+def _iter_job_params(job_config: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    """依次产出作业配置中需要记录为参数的非空字段"""
+    for key in JOB_CONFIG_PARAM_KEYS:
+        value = job_config.get(key)
+        if value is not None:
+            yield key, value
+
+
+def _json_default(value: Any) -> Any:
+    """JSON序列化时转换非原生类型（仅在json遇到无法序列化的对象时调用）"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def _dump_artifact_json(data: Any) -> str:
+    """序列化JSON工件；默认紧凑格式，settings.mlflow_pretty_artifacts开启时缩进排版"""
+    if settings.mlflow_pretty_artifacts:
+        return json.dumps(data, indent=2, ensure_ascii=False, default=_json_default)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+
+def _read_log_tail(logs: Union[str, bytes, os.PathLike], max_length: int) -> str:
+    """取任务日志末尾max_length部分，被截断时追加截断标记
+    
+    字符串按字符截取；bytes和文件路径按字节截取，文件只读取末尾部分，
+    不把整个日志加载到内存。截断处被切开的多字节字符以替换符显示。
+    """
+    if isinstance(logs, str):
+        if len(logs) <= max_length:
+            return logs
+        return logs[-max_length:] + LOG_TRUNCATED_MARKER
+    if isinstance(logs, (bytes, bytearray)):
+        if len(logs) <= max_length:
+            return str(logs, "utf-8", "replace")
+        # memoryview切片不复制底层缓冲区
+        return str(memoryview(logs)[-max_length:], "utf-8", "replace") + LOG_TRUNCATED_MARKER
+    with open(logs, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        truncated = size > max_length
+        f.seek(size - max_length if truncated else 0)
+        tail = str(f.read(), "utf-8", "replace")
+    return tail + LOG_TRUNCATED_MARKER if truncated else tail
+
+
+def _is_transient_error(exc: Exception) -> bool:
+    """判断MLflow记录失败是否为可重试的临时性错误"""
+    # requests的网络异常均继承自OSError
+    if isinstance(exc, OSError):
+        return True
+    get_status = getattr(exc, "get_http_status_code", None)
+    if get_status is None:
+        return False
+    status = get_status()
+    return status == 429 or status >= 500
+
+
+class _AsyncMlflowWorker:
+    """后台MLflow日志写入线程
+    
+    记录操作按提交顺序在守护线程中执行，调用方不再等待跟踪服务器的网络往返。
+    所有记录操作的错误处理集中在这里：临时性错误按指数退避原地重试
+    （不重新入队，保证与flush标记及后续操作的先后顺序），其余错误只记录日志。
+    """
+    
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="mlflow-logger", daemon=True)
+                    self._thread.start()
+    
+    def submit(self, op, *args, **kwargs):
+        """提交一个记录操作"""
+        self._ensure_started()
+        self._queue.put((op, args, kwargs))
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的操作全部执行完毕，超时返回False"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put((done.set, (), {}))
+        return done.wait(timeout)
+    
+    def _run(self):
+        while True:
+            op, args, kwargs = self._queue.get()
+            try:
+                self._execute(op, args, kwargs)
+            finally:
+                self._queue.task_done()
+    
+    @staticmethod
+    def _execute(op, args, kwargs):
+        for attempt in range(MLFLOW_WORKER_MAX_RETRIES + 1):
+            try:
+                op(*args, **kwargs)
+                return
+            except Exception as e:
+                if attempt < MLFLOW_WORKER_MAX_RETRIES and _is_transient_error(e):
+                    delay = MLFLOW_WORKER_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+                    logger.warning(f"MLflow logging operation failed, retrying in {delay}s: {e}")
+                    time.sleep(delay)
+                    continue
+                logger.error(f"MLflow logging operation failed: {e}", exc_info=True)
+                return
+
+
+class MLflowManager:
+    """MLflow实验跟踪管理器
+    
+    参数、指标和标签通过MlflowClient.log_batch批量写入，
+    每次调用只产生一次到跟踪服务器的请求。
+    非测试环境下所有记录操作由后台线程异步执行。
+    """
+    
+    def __init__(
+        self,
+        tracking_uri: Optional[str] = None,
+        experiment_name: Optional[str] = None
+    ):
+        self.tracking_uri = tracking_uri or settings.mlflow_tracking_uri
+        self.experiment_name = experiment_name or settings.mlflow_experiment_name
+        self._active_run_id: Optional[str] = None
+        # 按名称查询到的实验ID及查询时间（time.monotonic）
+        self._experiment_id: Optional[str] = None
+        self._experiment_id_fetched_at = 0.0
+        
+        _configure_http_client()
+        self._mlflow = _get_mlflow_module()
+        self._mlflow.set_tracking_uri(self.tracking_uri)
+        self.client = self._mlflow.tracking.MlflowClient(tracking_uri=self.tracking_uri)
+        # 测试环境下同步写入，便于断言
+        self._worker = None if settings.is_testing else _AsyncMlflowWorker()
+        
+        if not settings.is_testing:
+            self._ensure_experiment()
+            # 管理器是进程级单例，实验只需设置一次
+            if self._experiment_id is not None:
+                self._mlflow.set_experiment(experiment_id=self._experiment_id)
+    
+    def _ensure_experiment(self):
+        """确保实验存在"""
+        try:
+            experiment_id = self._get_experiment_id()
+            if experiment_id is None:
+                experiment_id = self._mlflow.create_experiment(
+                    self.experiment_name,
+                    artifact_location=settings.mlflow_artifact_location
+                )
+                self._cache_experiment_id(experiment_id)
+                logger.info(f"Created MLflow experiment: {self.experiment_name}")
+        except Exception as e:
+            logger.error(f"Failed to ensure MLflow experiment: {e}")
+    
+    def _cache_experiment_id(self, experiment_id: str):
+        self._experiment_id = experiment_id
+        self._experiment_id_fetched_at = time.monotonic()
+    
+    def _get_experiment_id(self) -> Optional[str]:
+        """获取实验ID，在缓存有效期内不再请求跟踪服务器"""
+        if (
+            self._experiment_id is not None
+            and time.monotonic() - self._experiment_id_fetched_at < EXPERIMENT_ID_CACHE_TTL_SECONDS
+        ):
+            return self._experiment_id
+        experiment = self._mlflow.get_experiment_by_name(self.experiment_name)
+        if experiment is None:
+            self._experiment_id = None
+            return None
+        self._cache_experiment_id(experiment.experiment_id)
+        return self._experiment_id
+    
+    def _submit(self, op, *args, **kwargs):
+        """执行记录操作：有后台线程时入队，否则同步执行"""
+        if self._worker is not None:
+            self._worker.submit(op, *args, **kwargs)
+            return
+        try:
+            op(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"MLflow logging operation failed: {e}")
+    
+    def flush(self, timeout: Optional[float] = MLFLOW_FLUSH_TIMEOUT_SECONDS) -> bool:
+        """等待所有已提交的记录操作完成"""
+        if self._worker is None:
+            return True
+        return self._worker.flush(timeout)
+    
+    @property
+    def active_run_id(self) -> Optional[str]:
+        """当前活动运行的ID"""
+        return self._active_run_id
+    
+    def start_run(self, run_name: Optional[str] = None, tags: Optional[Dict[str, Any]] = None):
+        """开始新的运行（使用缓存的实验ID，不再每次调用set_experiment）"""
+        experiment_id = self._get_experiment_id()
+        if experiment_id is None:
+            # 实验尚不存在（如测试环境跳过了初始化），由set_experiment创建
+            experiment_id = self._mlflow.set_experiment(self.experiment_name).experiment_id
+            self._cache_experiment_id(experiment_id)
+        run = self._mlflow.start_run(experiment_id=experiment_id, run_name=run_name, tags=tags)
+        self._active_run_id = run.info.run_id
+        return run
+    
+    def end_run(self, status: str = "FINISHED"):
+        """结束当前运行（先等待后台记录操作写完）"""
+        if not self.flush():
+            logger.warning("Timed out waiting for pending MLflow logging operations")
+        self._mlflow.end_run(status=status)
+        self._active_run_id = None
+    
+    def log_bundle(
+        self,
+        run_id: Optional[str] = None,
+        params: Optional[Union[Dict[str, Any], Iterable[Tuple[str, Any]]]] = None,
+        metrics: Optional[Dict[str, float]] = None,
+        tags: Optional[Dict[str, Any]] = None,
+        texts: Optional[Dict[str, str]] = None,
+        artifacts: Optional[Dict[str, Optional[str]]] = None,
+        step: Optional[int] = None
+    ):
+        """作为一个操作提交一组记录
+        
+        参数、指标和标签合并为一次log_batch请求，随后依次上传文本工件
+        （{工件文件名: 文本}）和文件工件（{本地路径: 工件目录}）。
+        params可以是字典或(键, 值)序列，后者直接转换为Param，不再构造中间字典。
+        同一批指标共用一个时间戳。
+        """
+        run_id = run_id or self._active_run_id
+        if run_id is None or not (params or metrics or tags or texts or artifacts):
+            return
+        timestamp = int(time.time() * 1000)
+        entities = self._mlflow.entities
+        Param, Metric, RunTag = entities.Param, entities.Metric, entities.RunTag
+        param_items = params.items() if isinstance(params, dict) else (params or ())
+        self._submit(
+            self._write_bundle,
+            run_id,
+            [Param(key, str(value)) for key, value in param_items],
+            [Metric(key, float(value), timestamp, step or 0) for key, value in (metrics or {}).items()],
+            [RunTag(key, str(value)) for key, value in (tags or {}).items()],
+            texts or {},
+            artifacts or {}
+        )
+    
+    def _write_bundle(
+        self,
+        run_id: str,
+        params: List["Param"],
+        metrics: List["Metric"],
+        tags: List["RunTag"],
+        texts: Dict[str, str],
+        artifacts: Dict[str, Optional[str]]
+    ):
+        """写入一组记录（在后台线程或同步执行）"""
+        if params or metrics or tags:
+            self.client.log_batch(run_id=run_id, metrics=metrics, params=params, tags=tags)
+        for artifact_file, text in texts.items():
+            self.client.log_text(run_id, text, artifact_file)
+        for local_path, artifact_path in artifacts.items():
+            self.client.log_artifact(run_id, local_path, artifact_path)
+    
+    def log_params(self, params: Dict[str, Any], run_id: Optional[str] = None):
+        """批量记录参数"""
+        self.log_bundle(run_id, params=params)
+    
+    def log_metrics(
+        self,
+        metrics: Dict[str, float],
+        step: Optional[int] = None,
+        run_id: Optional[str] = None
+    ):
+        """批量记录指标"""
+        self.log_bundle(run_id, metrics=metrics, step=step)
+    
+    def set_tags(self, tags: Dict[str, Any], run_id: Optional[str] = None):
+        """批量设置标签"""
+        self.log_bundle(run_id, tags=tags)
+    
+    def log_text(self, text: str, artifact_file: str, run_id: Optional[str] = None):
+        """记录文本工件"""
+        self.log_bundle(run_id, texts={artifact_file: text})
+    
+    def log_artifact(
+        self,
+        local_path: str,
+        artifact_path: Optional[str] = None,
+        run_id: Optional[str] = None
+    ):
+        """记录文件工件"""
+        self.log_bundle(run_id, artifacts={local_path: artifact_path})
+    
+    def search_runs(self, filter_string: str = "", max_results: int = 100) -> List[Any]:
+        """在当前实验中搜索运行"""
+        try:
+            experiment_id = self._get_experiment_id()
+            if experiment_id is None:
+                return []
+            return self.client.search_runs(
+                [experiment_id],
+                filter_string=filter_string,
+                max_results=max_results
+            )
+        except Exception as e:
+            logger.error(f"Failed to search MLflow runs: {e}")
+            return []
+
+
+# 全局MLflow管理器实例（首次使用时创建）
+_mlflow_manager: Optional[MLflowManager] = None
+_mlflow_manager_lock = threading.Lock()
+
+
+def get_mlflow_manager() -> MLflowManager:
+    """获取MLflow管理器实例
+    
+    双重检查加锁，多线程并发首次调用时只创建一个实例（只检查一次实验是否存在）。
+    """
+    global _mlflow_manager
+    if _mlflow_manager is None:
+        with _mlflow_manager_lock:
+            if _mlflow_manager is None:
+                _mlflow_manager = MLflowManager()
+    return _mlflow_manager
+
+
+class MLflowTaskTracker:
+    """GPU任务的MLflow追踪上下文
+    
+    MLflow未启用或运行创建失败时，所有记录方法均为空操作，不影响任务执行。
+    """
+    
+    def __init__(self, task_id: str, task_name: str, provider_name: str):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.provider_name = provider_name
+        self.run_id: Optional[str] = None
+        self.manager: Optional[MLflowManager] = None
+    
+    def __enter__(self) -> "MLflowTaskTracker":
+        if not settings.enable_mlflow:
+            return self
+        try:
+            self.manager = get_mlflow_manager()
+            run = self.manager.start_run(
+                run_name=f"{self.task_name}-{self.task_id[:8]}",
+                tags={"task_id": self.task_id, "provider": self.provider_name}
+            )
+            self.run_id = run.info.run_id
+        except Exception as e:
+            logger.warning(f"Failed to start MLflow run for task {self.task_id}: {e}")
+            self.run_id = None
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.run_id is not None:
+            try:
+                self.manager.end_run(status="FAILED" if exc_type else "FINISHED")
+            except Exception as e:
+                logger.warning(f"Failed to end MLflow run {self.run_id}: {e}")
+        return False
+    
+    def log_job_config(self, job_config: Dict[str, Any]):
+        """记录作业配置"""
+        if self.run_id is None:
+            return
+        # 参数和配置工件作为一个操作提交
+        self.manager.log_bundle(
+            self.run_id,
+            params=_iter_job_params(job_config),
+            texts={"job_config.json": _dump_artifact_json(job_config)}
+        )
+    
+    def log_execution_metrics(
+        self,
+        duration_seconds: Optional[float] = None,
+        cost: Optional[float] = None,
+        exit_code: Optional[int] = None,
+        **extra_metrics
+    ):
+        """记录执行指标"""
+        if self.run_id is None:
+            return
+        metrics = {
+            "duration_seconds": duration_seconds,
+            "cost": cost,
+            "exit_code": exit_code,
+            **extra_metrics
+        }
+        self.manager.log_metrics(
+            {k: float(v) for k, v in metrics.items() if v is not None},
+            run_id=self.run_id
+        )
+    
+    def log_task_logs(
+        self,
+        logs: Union[str, bytes, os.PathLike],
+        max_length: int = TASK_LOG_MAX_LENGTH
+    ):
+        """记录任务日志（过长时只保留末尾部分）
+        
+        logs可以是日志文本、字节缓冲区或日志文件路径；文件只读取末尾部分。
+        """
+        if self.run_id is None or not logs:
+            return
+        try:
+            text = _read_log_tail(logs, max_length)
+        except OSError as e:
+            logger.warning(f"Failed to read task logs {logs}: {e}")
+            return
+        self.manager.log_text(text, "task_logs.txt", run_id=self.run_id)
+    
+    def log_error(self, error_message: str):
+        """记录错误信息"""
+        if self.run_id is None:
+            return
+        self.manager.log_bundle(
+            self.run_id,
+            tags={"error": error_message[:500]},
+            texts={"error.txt": error_message}
+        )
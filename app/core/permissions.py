@@ -2,8 +2,7 @@
 权限控制中间件
 实现基于角色的权限控制
 """
-from functools import wraps
-from typing import List, Optional, Callable
+from typing import Iterable, Optional
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -23,39 +22,26 @@ class PermissionError(HTTPException):
         )
 
 
-def require_roles(allowed_roles: List[UserRole]):
+# 普通用户或管理员角色集合
+_USER_OR_ADMIN_ROLES = frozenset({UserRole.USER, UserRole.ADMIN})
+
+
+def require_roles(allowed_roles: Iterable[UserRole]):
     """
-    角色权限装饰器
-    只允许指定角色的用户访问
+    角色权限依赖工厂
+    只允许指定角色的用户访问，用法: Depends(require_roles([UserRole.ADMIN]))
+    当前用户由FastAPI依赖注入，角色集合和错误信息在创建依赖时计算一次
     """
-    def decorator(func: Callable):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # 从参数中获取当前用户
-            current_user = None
-            for arg in args:
-                if isinstance(arg, User):
-                    current_user = arg
-                    break
-            
-            # 如果没有找到用户参数，从kwargs中查找
-            if not current_user:
-                for key, value in kwargs.items():
-                    if isinstance(value, User):
-                        current_user = value
-                        break
-            
-            if not current_user:
-                raise PermissionError("无法获取用户信息")
-            
-            if current_user.role not in allowed_roles:
-                raise PermissionError(
-                    f"需要以下角色权限之一: {[role.value for role in allowed_roles]}"
-                )
-            
-            return await func(*args, **kwargs)
-        return wrapper
-    return decorator
+    allowed_roles = list(allowed_roles)
+    allowed = frozenset(allowed_roles)
+    detail = f"需要以下角色权限之一: {[role.value for role in allowed_roles]}"
+    
+    def dependency(current_user: User = Depends(get_current_user)) -> User:
+        if current_user.role not in allowed:
+            raise PermissionError(detail)
+        return current_user
+    
+    return dependency
 
 
 def require_admin(current_user: User = Depends(get_current_user)):
@@ -73,7 +59,7 @@ def require_user_or_admin(current_user: User = Depends(get_current_user)):
     普通用户或管理员权限依赖
     允许普通用户和管理员访问
     """
-    if current_user.role not in [UserRole.USER, UserRole.ADMIN]:
+    if current_user.role not in _USER_OR_ADMIN_ROLES:
         raise PermissionError("需要用户或管理员权限")
     return current_user
 
@@ -90,6 +76,13 @@ def require_active_user(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+def _same_user_id(user_id, other_user_id) -> bool:
+    """比较用户ID；类型相同（均为UUID或均为字符串）时直接比较，避免生成临时字符串"""
+    if type(user_id) is type(other_user_id):
+        return user_id == other_user_id
+    return str(user_id) == str(other_user_id)
+
+
 def check_resource_ownership(
     resource_user_id: str,
     current_user: User,
@@ -111,7 +104,7 @@ def check_resource_ownership(
         return True
     
     # 用户只能访问自己的资源
-    return str(current_user.id) == str(resource_user_id)
+    return _same_user_id(current_user.id, resource_user_id)
 
 
 def require_resource_access(
@@ -144,7 +137,7 @@ class PermissionChecker:
         # 只有管理员或用户本人可以修改
         if current_user.role == UserRole.ADMIN:
             return True
-        return str(current_user.id) == str(target_user_id)
+        return _same_user_id(current_user.id, target_user_id)
     
     @staticmethod
     def can_delete_user(target_user_id: str, current_user: User) -> bool:
@@ -1,14 +1,37 @@
 import logging
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+from typing import Any, ClassVar, Dict, FrozenSet, List, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
 import asyncio
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+# 优先级名称（含TaskPriority枚举值）到数值优先级的映射
+_PRIORITY_STR_MAP: Dict[str, int] = {
+    "low": 2,
+    "normal": 5,
+    "high": 8,
+    "urgent": 10,
+}
+
+
+# GPU类型的任务时长因子（相对A100），未知类型按1.2计
+_GPU_TYPE_FACTORS: Dict[str, float] = {
+    "A100": 1.0,
+    "RTX4090": 1.1,
+    "V100": 1.3,
+    "T4": 1.5,
+    "A6000": 1.1,
+}
+
+# 未指定支持的GPU类型时的默认值
+DEFAULT_GPU_TYPES: Tuple[str, ...] = ("A100", "V100", "T4")
+
+
+@dataclass(slots=True)
 class TaskRequirement:
     """任务需求"""
     gpu_type: str
@@ -22,52 +45,122 @@ class TaskRequirement:
         if self.gpu_count <= 0:
             raise ValueError("GPU count must be greater than 0")
         
-        # 确保priority是整数
-        if hasattr(self.priority, 'value'):
-            # TaskPriority 枚举类型
-            from app.models.task import TaskPriority
-            priority_map = {
-                TaskPriority.LOW: 2,
-                TaskPriority.NORMAL: 5,
-                TaskPriority.HIGH: 8,
-                TaskPriority.URGENT: 10
-            }
-            self.priority = priority_map.get(self.priority, 5)
-        elif isinstance(self.priority, str):
-            # 字符串类型
-            priority_map = {
-                'low': 2,
-                'normal': 5, 
-                'high': 8,
-                'urgent': 10
-            }
-            self.priority = priority_map.get(self.priority.lower(), 5)
-        elif not isinstance(self.priority, int):
-            # 其他类型，设为默认值
-            self.priority = 5
+        # 确保priority是整数；绝大多数调用已传入int，优先按类型快速判断
+        priority = self.priority
+        priority_type = type(priority)
+        if priority_type is not int:
+            if hasattr(priority, 'value'):
+                # TaskPriority 枚举类型（其值即优先级名称）
+                self.priority = _PRIORITY_STR_MAP.get(priority.value, 5)
+            elif priority_type is str:
+                self.priority = _PRIORITY_STR_MAP.get(priority.lower(), 5)
+            elif not isinstance(priority, int):
+                # 其他类型，设为默认值
+                self.priority = 5
         
         if not (1 <= self.priority <= 10):
             raise ValueError("Priority must be between 1 and 10")
 
 
-@dataclass
+@dataclass(slots=True)
 class ProviderMetrics:
-    """Provider指标"""
+    """Provider指标
+    
+    任一实例的字段被赋值（包括创建实例）时递增类级版本号，调度器据此判断缓存的评分是否失效。
+    """
+    # 所有ProviderMetrics实例共享的修改版本号
+    version: ClassVar[int] = 0
+    
     provider_name: str
     availability_score: float = 0.9
     avg_cost_per_hour: float = 2.5
     avg_queue_time_minutes: float = 5.0
     success_rate: float = 0.95
     current_load: float = 0.5
-    supported_gpu_types: List[str] = None
+    # 按注册顺序（去重）保存的GPU类型，用于输出；由supported_gpu_types赋值时同步更新，须声明在其之前
+    gpu_type_order: Tuple[str, ...] = field(default=(), init=False, repr=False, compare=False)
+    supported_gpu_types: FrozenSet[str] = None
     
-    def __post_init__(self):
-        if self.supported_gpu_types is None:
-            self.supported_gpu_types = ["A100", "V100", "T4"]
+    def __setattr__(self, name: str, value: Any):
+        if name == "supported_gpu_types":
+            # 使用frozenset，支持判断为O(1)；同时保留原始顺序
+            gpu_type_order = tuple(dict.fromkeys(value or DEFAULT_GPU_TYPES))
+            object.__setattr__(self, "gpu_type_order", gpu_type_order)
+            value = frozenset(gpu_type_order)
+        object.__setattr__(self, name, value)
+        ProviderMetrics.version += 1
+
+
+@dataclass(slots=True)
+class ProviderRecommendation:
+    """某调度策略下推荐的Provider"""
+    provider: str
+    routing_key: str
+    score: float
+
+
+# 各调度策略的评分权重: (成本, 性能, 可用性, 排队)；未知策略按balanced处理
+STRATEGY_WEIGHTS: Dict[str, Tuple[float, float, float, float]] = {
+    "cost": (0.6, 0.2, 0.2, 0.0),
+    "performance": (0.0, 0.5, 0.2, 0.3),
+    "availability": (0.0, 0.3, 0.5, 0.2),
+    "balanced": (0.25, 0.25, 0.25, 0.25),
+}
+
+
+# 按优先级（0-10）索引的路由键后缀
+_PRIORITY_SUFFIX: Tuple[str, ...] = (
+    "_low", "_low", "_low", "", "", "", "", "", "_high", "_urgent", "_urgent",
+)
+
+
+# 按Provider注册顺序排列的 (Provider名称, 评分)
+ProviderScores = Tuple[Tuple[str, float], ...]
+
+
+@lru_cache(maxsize=512)
+def _routing_key(provider: str, gpu_type: str, gpu_count: int, priority: int) -> str:
+    """生成Celery路由键；(provider, gpu_type, gpu_count, priority)组合有限，结果按参数缓存"""
+    # 超出0-10的优先级按端点处理；大规模任务（>4 GPU）至少使用高优先级队列
+    priority_suffix = _PRIORITY_SUFFIX[min(max(priority, 0), 10)]
+    if gpu_count > 4 and priority_suffix != "_urgent":
+        priority_suffix = "_high"
+    
+    return f"{provider}_{gpu_type}_{gpu_count}{priority_suffix}"
+
+
+@lru_cache(maxsize=256)
+def _estimate_duration(gpu_type: str, gpu_count: int, base_duration: int) -> float:
+    """按GPU类型、数量和基础时长估算任务持续时间；提交的作业配置多有重复，结果按参数缓存"""
+    # GPU类型因子
+    gpu_factor = _GPU_TYPE_FACTORS.get(gpu_type, 1.2)
+    gpu_count_factor = 1.0 + (gpu_count - 1) * 0.1
+    
+    estimated = base_duration * gpu_factor * gpu_count_factor
+    return max(estimated, 5)  # 最少5分钟
+
+
+def _score_metrics(metrics: ProviderMetrics, strategy: str) -> float:
+    """根据Provider指标和调度策略计算评分"""
+    cost_weight, performance_weight, availability_weight, queue_weight = STRATEGY_WEIGHTS.get(
+        strategy, STRATEGY_WEIGHTS["balanced"]
+    )
+    
+    # 基础评分按策略权重加权求和
+    return (
+        cost_weight / (1.0 + metrics.avg_cost_per_hour / 10.0)
+        + performance_weight * metrics.success_rate * (1.0 - metrics.current_load)
+        + availability_weight * metrics.availability_score
+        + queue_weight / (1.0 + metrics.avg_queue_time_minutes / 10.0)
+    )
 
 
 class IntelligentScheduler:
-    """智能任务调度器"""
+    """智能任务调度器
+    
+    各GPU类型在各策略下的候选评分和最优Provider按需计算并缓存，
+    任一Provider指标被修改（ProviderMetrics.version变化）后重建索引并重新计算。
+    """
     
     def __init__(self):
         self.provider_metrics = {
@@ -99,61 +192,76 @@ class IntelligentScheduler:
                 supported_gpu_types=["T4", "V100", "A100"]
             )
         }
+        self._rebuild_gpu_index()
+    
+    def _rebuild_gpu_index(self):
+        """重建 GPU类型 -> 支持该类型的Provider 反向索引（保持Provider注册顺序）"""
+        gpu_to_providers: Dict[str, List[str]] = {}
+        for name, metrics in self.provider_metrics.items():
+            for gpu_type in metrics.supported_gpu_types:
+                gpu_to_providers.setdefault(gpu_type, []).append(name)
+        self._gpu_to_providers: Dict[str, Tuple[str, ...]] = {
+            gpu_type: tuple(names) for gpu_type, names in gpu_to_providers.items()
+        }
+        # (GPU类型, 策略) -> (各候选Provider评分, 最优Provider, 最优评分)；指标变化后重新计算
+        self._score_cache: Dict[Tuple[str, str], Tuple[ProviderScores, Optional[str], float]] = {}
+        # 构建索引和缓存时的指标版本号
+        self._metrics_version = ProviderMetrics.version
+    
+    def _scores_for(self, gpu_type: str, strategy: str) -> Tuple[ProviderScores, Optional[str], float]:
+        """返回支持该GPU类型的各Provider评分（按注册顺序）及评分最高且大于0的Provider和其评分"""
+        if strategy not in STRATEGY_WEIGHTS:
+            strategy = "balanced"
+        if self._metrics_version != ProviderMetrics.version:
+            # 指标被直接修改过（未经update_provider_metrics），索引和评分缓存均已失效
+            self._rebuild_gpu_index()
+        key = (gpu_type, strategy)
+        cached = self._score_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        provider_metrics = self.provider_metrics
+        scores = tuple(
+            (name, _score_metrics(provider_metrics[name], strategy))
+            for name in self._gpu_to_providers.get(gpu_type, ())
+        )
+        best_provider = None
+        best_score = 0.0
+        for name, score in scores:
+            if score > best_score:
+                best_provider, best_score = name, score
+        
+        result = (scores, best_provider, best_score)
+        # 只缓存已知GPU类型，避免任意输入撑大缓存
+        if gpu_type in self._gpu_to_providers:
+            self._score_cache[key] = result
+        return result
     
     def update_provider_metrics(self, provider_name: str, metrics: ProviderMetrics):
         """更新Provider指标"""
         self.provider_metrics[provider_name] = metrics
+        self._rebuild_gpu_index()
     
-    async def estimate_task_duration(self, task_req: TaskRequirement) -> float:
+    def estimate_task_duration(self, task_req: TaskRequirement) -> float:
         """估算任务持续时间"""
-        base_duration = task_req.estimated_duration_minutes
-        
-        # GPU类型因子
-        gpu_factors = {
-            "A100": 1.0,
-            "RTX4090": 1.1,
-            "V100": 1.3,
-            "T4": 1.5,
-            "A6000": 1.1
-        }
-        
-        gpu_factor = gpu_factors.get(task_req.gpu_type, 1.2)
-        gpu_count_factor = 1.0 + (task_req.gpu_count - 1) * 0.1
-        
-        estimated = base_duration * gpu_factor * gpu_count_factor
-        return max(estimated, 5)  # 最少5分钟
+        return _estimate_duration(task_req.gpu_type, task_req.gpu_count, task_req.estimated_duration_minutes)
     
-    async def calculate_provider_score(
+    def calculate_provider_score(
         self, 
         provider_name: str, 
         task_req: TaskRequirement, 
         strategy: str = "balanced"
     ) -> float:
-        """计算Provider评分"""
-        if provider_name not in self.provider_metrics:
-            return 0.0
-        
-        metrics = self.provider_metrics[provider_name]
-        
-        # 检查GPU类型支持
-        if not await self._provider_supports_gpu_type(provider_name, task_req.gpu_type):
+        """计算Provider评分（Provider不存在或不支持该GPU类型时为0）"""
+        metrics = self.provider_metrics.get(provider_name)
+        if metrics is None or task_req.gpu_type not in metrics.supported_gpu_types:
             return 0.0
         
-        # 基础评分
-        cost_score = 1.0 / (1.0 + metrics.avg_cost_per_hour / 10.0)
-        performance_score = metrics.success_rate * (1.0 - metrics.current_load)
-        availability_score = metrics.availability_score
-        queue_score = 1.0 / (1.0 + metrics.avg_queue_time_minutes / 10.0)
-        
-        # 根据策略调整权重
-        if strategy == "cost":
-            return cost_score * 0.6 + performance_score * 0.2 + availability_score * 0.2
-        elif strategy == "performance":
-            return performance_score * 0.5 + queue_score * 0.3 + availability_score * 0.2
-        elif strategy == "availability":
-            return availability_score * 0.5 + performance_score * 0.3 + queue_score * 0.2
-        else:  # balanced
-            return (cost_score + performance_score + availability_score + queue_score) / 4.0
+        return _score_metrics(metrics, strategy)
+    
+    def calculate_all_scores(self, task_req: TaskRequirement, strategy: str = "balanced") -> Dict[str, float]:
+        """计算所有支持该GPU类型的Provider评分（只遍历反向索引中的候选Provider）"""
+        return dict(self._scores_for(task_req.gpu_type, strategy)[0])
     
     async def select_optimal_provider(
         self, 
@@ -163,56 +271,49 @@ class IntelligentScheduler:
     ) -> Tuple[Optional[str], Optional[str]]:
         """选择最优Provider"""
         
-        # 如果指定了首选Provider且支持该GPU类型，优先考虑
-        if preferred_provider and preferred_provider in self.provider_metrics:
-            if await self._provider_supports_gpu_type(preferred_provider, task_req.gpu_type):
-                score = await self.calculate_provider_score(preferred_provider, task_req, strategy)
-                if score > 0.3:  # 最低可接受分数
-                    routing_key = self._get_routing_key(preferred_provider, task_req.gpu_type, task_req.gpu_count, task_req.priority)
-                    return preferred_provider, routing_key
+        # 如果指定了首选Provider且支持该GPU类型，优先考虑（不支持时评分为0）
+        if preferred_provider:
+            score = self.calculate_provider_score(preferred_provider, task_req, strategy)
+            if score > 0.3:  # 最低可接受分数
+                routing_key = self._get_routing_key(preferred_provider, task_req.gpu_type, task_req.gpu_count, task_req.priority)
+                return preferred_provider, routing_key
         
-        # 计算所有Provider的评分
-        provider_scores = {}
-        for provider_name in self.provider_metrics:
-            score = await self.calculate_provider_score(provider_name, task_req, strategy)
-            if score > 0:
-                provider_scores[provider_name] = score
-        
-        if not provider_scores:
+        # 评分最高且大于0的Provider（指标未变化时直接取缓存结果）
+        best_provider = self._scores_for(task_req.gpu_type, strategy)[1]
+        if best_provider is None:
             return None, None
         
-        # 选择最佳Provider
-        best_provider = max(provider_scores.items(), key=lambda x: x[1])[0]
         routing_key = self._get_routing_key(best_provider, task_req.gpu_type, task_req.gpu_count, task_req.priority)
         
         return best_provider, routing_key
     
-    async def _provider_supports_gpu_type(self, provider_name: str, gpu_type: str) -> bool:
+    def recommend_provider(
+        self,
+        task_req: TaskRequirement,
+        strategy: str = "balanced"
+    ) -> Optional[ProviderRecommendation]:
+        """给出某策略下的推荐Provider、路由键及评分，无可用Provider时返回None"""
+        _, best_provider, best_score = self._scores_for(task_req.gpu_type, strategy)
+        if best_provider is None:
+            return None
+        routing_key = self._get_routing_key(best_provider, task_req.gpu_type, task_req.gpu_count, task_req.priority)
+        return ProviderRecommendation(best_provider, routing_key, best_score)
+    
+    def _provider_supports_gpu_type(self, provider_name: str, gpu_type: str) -> bool:
         """检查Provider是否支持指定GPU类型"""
-        if provider_name not in self.provider_metrics:
-            return False
-        
-        metrics = self.provider_metrics[provider_name]
-        return gpu_type in metrics.supported_gpu_types
+        metrics = self.provider_metrics.get(provider_name)
+        return metrics is not None and gpu_type in metrics.supported_gpu_types
     
     def _get_routing_key(self, provider: str, gpu_type: str, gpu_count: int, priority: int = 5) -> str:
         """生成Celery路由键"""
-        # 确保priority是整数
+        # 确保priority是整数，使缓存键规范化
         if isinstance(priority, str):
             try:
                 priority = int(priority)
             except (ValueError, TypeError):
                 priority = 5
         
-        priority_suffix = ""
-        if priority >= 9:
-            priority_suffix = "_urgent"
-        elif priority >= 8 or gpu_count > 4:
-            priority_suffix = "_high"
-        elif priority <= 2:
-            priority_suffix = "_low"
-        
-        return f"{provider}_{gpu_type}_{gpu_count}{priority_suffix}"
+        return _routing_key(provider, gpu_type, gpu_count, priority)
     
     def get_all_provider_metrics(self) -> Dict[str, Dict]:
         """获取所有Provider指标"""
@@ -224,7 +325,7 @@ class IntelligentScheduler:
                 "avg_queue_time_minutes": metrics.avg_queue_time_minutes,
                 "success_rate": metrics.success_rate,
                 "current_load": metrics.current_load,
-                "supported_gpu_types": metrics.supported_gpu_types
+                "supported_gpu_types": list(metrics.gpu_type_order)
             }
             for name, metrics in self.provider_metrics.items()
         }
@@ -1,8 +1,121 @@
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Tuple, Union, Any
 from enum import Enum
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime, timezone
-import json
+from operator import attrgetter
+import threading
+
+
+# 编译后的规则条件：接收上下文字典，返回是否满足
+ConditionPredicate = Callable[[Dict[str, Any]], bool]
+
+# 多条件规则每累计拒绝这么多次，按各条件的拒绝次数重新排列检查顺序
+CONDITION_REORDER_INTERVAL = 1024
+
+# 配置管理器按条件内容缓存的编译结果数量上限，超出时清空重建
+CONDITION_CACHE_MAXSIZE = 256
+
+
+def _always_true(context: Dict[str, Any]) -> bool:
+    return True
+
+
+def _compile_operator(key: str, op: str, value: Any) -> Optional[ConditionPredicate]:
+    """将单个比较操作编译为判断函数，未知操作符返回None（忽略）"""
+    if op == "eq":
+        return lambda context: context.get(key) == value
+    if op == "gt":
+        return lambda context: (v := context.get(key)) is not None and v > value
+    if op == "lt":
+        return lambda context: (v := context.get(key)) is not None and v < value
+    if op == "gte":
+        return lambda context: (v := context.get(key)) is not None and v >= value
+    if op == "lte":
+        return lambda context: (v := context.get(key)) is not None and v <= value
+    if op == "in":
+        def check_in(context: Dict[str, Any]) -> bool:
+            context_value = context.get(key)
+            if isinstance(context_value, (list, set, tuple)):
+                # 至少有一个元素在期望集合中
+                return any(elem in value for elem in context_value)
+            return context_value in value
+        return check_in
+    return None
+
+
+def _freeze(value: Any) -> Any:
+    """将条件、列表等转换为可哈希的快照，内容相同的值快照相等（用作编译结果的缓存键）"""
+    if isinstance(value, dict):
+        return (dict, tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(item) for item in value))
+    if isinstance(value, set):
+        return (set, frozenset(_freeze(item) for item in value))
+    return value
+
+
+def _bitmask(values: Optional[List[int]]) -> Optional[int]:
+    """将小时/星期列表转换为位掩码；列表为空表示不限制，返回None"""
+    if not values:
+        return None
+    mask = 0
+    for value in values:
+        # 负数无法对应任何时间，忽略；全部无效时掩码为0，规则永不生效
+        if value >= 0:
+            mask |= 1 << value
+    return mask
+
+
+def compile_conditions(conditions: Dict[str, Any]) -> ConditionPredicate:
+    """将规则条件编译为判断函数
+    
+    条件字典只在编译时遍历一次，之后每次评估只需依次调用各条件的判断函数，
+    不再逐次比较操作符字符串。
+    多个条件时统计每个条件导致拒绝的次数，定期把最常失败的条件调到最前，
+    使不满足的上下文尽早短路（条件之间是“与”关系且无副作用，顺序不影响结果）。
+    """
+    checks: List[ConditionPredicate] = []
+    for key, expected_value in (conditions or {}).items():
+        if isinstance(expected_value, dict):
+            # 支持比较操作符
+            for op, value in expected_value.items():
+                check = _compile_operator(key, op, value)
+                if check is not None:
+                    checks.append(check)
+        else:
+            # 直接比较
+            checks.append(lambda context, key=key, expected=expected_value: context.get(key) == expected)
+    
+    if not checks:
+        return _always_true
+    if len(checks) == 1:
+        return checks[0]
+    
+    # (条件下标, 判断函数)，按拒绝次数从多到少排列；只在拒绝时计数，通过时无额外开销
+    ordered_checks = list(enumerate(checks))
+    reject_counts = [0] * len(checks)
+    rejections_since_reorder = 0
+    
+    def reorder():
+        nonlocal ordered_checks, rejections_since_reorder
+        # 生成新列表后整体替换（不原地排序），其他线程正在遍历的旧列表不受影响
+        ordered_checks = sorted(ordered_checks, key=lambda item: reject_counts[item[0]], reverse=True)
+        # 计数减半，使顺序能随上下文分布的变化而调整
+        for index in range(len(reject_counts)):
+            reject_counts[index] >>= 1
+        rejections_since_reorder = 0
+    
+    def predicate(context: Dict[str, Any]) -> bool:
+        nonlocal rejections_since_reorder
+        for index, check in ordered_checks:
+            if not check(context):
+                reject_counts[index] += 1
+                rejections_since_reorder += 1
+                if rejections_since_reorder >= CONDITION_REORDER_INTERVAL:
+                    reorder()
+                return False
+        return True
+    return predicate
 
 
 class SchedulingStrategy(str, Enum):
@@ -50,6 +163,38 @@ class SchedulingRule(BaseModel):
     # 时间限制
     active_hours: Optional[List[int]] = Field(None, description="生效时间(小时，24小时制)")
     active_days: Optional[List[int]] = Field(None, description="生效日期(1-7，1=周一)")
+    
+    # 编译后的条件判断函数及编译时conditions的内容快照（conditions被替换或原地修改后重新编译）
+    _predicate: Optional[ConditionPredicate] = PrivateAttr(default=None)
+    _predicate_source: Any = PrivateAttr(default=None)
+    
+    # 生效时间/日期位掩码及计算时两个列表的内容快照（列表被替换或原地修改后重新计算）
+    _time_masks: Optional[Tuple[Optional[int], Optional[int]]] = PrivateAttr(default=None)
+    _time_masks_source: Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]] = PrivateAttr(default=None)
+    
+    def is_active_at(self, hour_bit: int, day_bit: int) -> bool:
+        """判断规则在给定时间是否生效
+        
+        hour_bit为1 << 小时，day_bit为1 << 星期(1-7)，由调用方每次评估只计算一次。
+        """
+        source = (tuple(self.active_hours or ()), tuple(self.active_days or ()))
+        if self._time_masks is None or self._time_masks_source != source:
+            self._time_masks = (_bitmask(self.active_hours), _bitmask(self.active_days))
+            self._time_masks_source = source
+        hours_mask, days_mask = self._time_masks
+        if hours_mask is not None and not hours_mask & hour_bit:
+            return False
+        if days_mask is not None and not days_mask & day_bit:
+            return False
+        return True
+    
+    def matches(self, context: Dict[str, Any]) -> bool:
+        """判断上下文是否满足规则条件"""
+        source = _freeze(self.conditions)
+        if self._predicate is None or self._predicate_source != source:
+            self._predicate = compile_conditions(self.conditions)
+            self._predicate_source = source
+        return self._predicate(context)
 
 
 class CostOptimizationConfig(BaseModel):
@@ -122,15 +267,82 @@ class SchedulingPolicy(BaseModel):
     created_by: Optional[str] = Field(None, description="创建者")
     is_active: bool = Field(True, description="是否激活")
     is_default: bool = Field(False, description="是否为默认策略")
+    
+    # 提供商名称 -> 优先级配置的索引，及建索引时各配置的 (对象, 名称) 快照
+    # （列表被替换、增删、替换元素或修改名称后重建；快照持有对象引用，比较时按对象身份）
+    _provider_priority_index: Optional[Dict[str, ProviderPriority]] = PrivateAttr(default=None)
+    _provider_priority_source: Tuple[Tuple[ProviderPriority, str], ...] = PrivateAttr(default=())
+    
+    @property
+    def weights(self) -> Tuple[float, float, float]:
+        """(成本, 性能, 可用性) 权重，评分时一次取出，与各项评分按位相乘求和"""
+        return (self.cost_weight, self.performance_weight, self.availability_weight)
+    
+    def weighted_score(self, cost_score: float, performance_score: float, availability_score: float) -> float:
+        """按策略权重合并成本、性能、可用性评分"""
+        cost_weight, performance_weight, availability_weight = self.weights
+        return (
+            cost_weight * cost_score
+            + performance_weight * performance_score
+            + availability_weight * availability_score
+        )
+    
+    def get_provider_priority(self, provider_name: str) -> Optional[ProviderPriority]:
+        """按名称查找提供商优先级配置（同名时取第一个）"""
+        priorities = self.provider_priorities
+        source = self._provider_priority_source
+        if (
+            self._provider_priority_index is None
+            or len(source) != len(priorities)
+            or not all(
+                cached is priority and cached_name == priority.provider_name
+                for (cached, cached_name), priority in zip(source, priorities)
+            )
+        ):
+            index: Dict[str, ProviderPriority] = {}
+            for priority in priorities:
+                index.setdefault(priority.provider_name, priority)
+            self._provider_priority_index = index
+            self._provider_priority_source = tuple((priority, priority.provider_name) for priority in priorities)
+        return self._provider_priority_index.get(provider_name)
 
 
 class SchedulingConfigManager:
-    """调度配置管理器"""
+    """调度配置管理器
+    
+    默认策略在首次访问策略时才构建，避免导入模块时即完成全部pydantic校验。
+    """
     
     def __init__(self):
-        self._policies: Dict[str, SchedulingPolicy] = {}
-        self._default_policy_id: Optional[str] = None
-        self._load_default_policies()
+        self._policy_store: Dict[str, SchedulingPolicy] = {}
+        self._default_id: Optional[str] = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        # 条件快照 -> 编译后的判断函数（同一条件复用，拒绝计数和检查顺序得以累积）
+        self._condition_predicates: Dict[Any, ConditionPredicate] = {}
+    
+    def _ensure_initialized(self):
+        """首次访问时加载默认策略（双重检查，多线程下只加载一次）"""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._load_default_policies()
+                    self._initialized = True
+    
+    @property
+    def _policies(self) -> Dict[str, SchedulingPolicy]:
+        self._ensure_initialized()
+        return self._policy_store
+    
+    @property
+    def _default_policy_id(self) -> Optional[str]:
+        self._ensure_initialized()
+        return self._default_id
+    
+    @_default_policy_id.setter
+    def _default_policy_id(self, policy_id: Optional[str]):
+        self._ensure_initialized()
+        self._default_id = policy_id
     
     def _load_default_policies(self):
         """加载默认策略"""
@@ -219,9 +431,9 @@ class SchedulingConfigManager:
         
         # 添加到策略字典
         for policy in [cost_policy, performance_policy, availability_policy, balanced_policy]:
-            self._policies[policy.policy_id] = policy
+            self._policy_store[policy.policy_id] = policy
             if policy.is_default:
-                self._default_policy_id = policy.policy_id
+                self._default_id = policy.policy_id
     
     def get_policy(self, policy_id: str) -> Optional[SchedulingPolicy]:
         """获取调度策略"""
@@ -275,11 +487,7 @@ class SchedulingConfigManager:
         policy = self.get_policy(policy_id)
         if not policy:
             return None
-        
-        for priority in policy.provider_priorities:
-            if priority.provider_name == provider_name:
-                return priority
-        return None
+        return policy.get_provider_priority(provider_name)
     
     def evaluate_scheduling_rules(self, policy_id: str, context: Dict[str, Any]) -> List[SchedulingRule]:
         """评估调度规则"""
@@ -289,27 +497,23 @@ class SchedulingConfigManager:
         
         applicable_rules = []
         current_time = datetime.now(timezone.utc)
+        hour_bit = 1 << current_time.hour
+        day_bit = 1 << current_time.isoweekday()  # 1=周一, 7=周日
         
         for rule in policy.scheduling_rules:
             if not rule.enabled:
                 continue
             
             # 检查时间限制
-            if rule.active_hours:
-                if current_time.hour not in rule.active_hours:
-                    continue
-            
-            if rule.active_days:
-                weekday = current_time.isoweekday()  # 1=周一, 7=周日
-                if weekday not in rule.active_days:
-                    continue
+            if not rule.is_active_at(hour_bit, day_bit):
+                continue
             
             # 检查条件
-            if self._evaluate_conditions(rule.conditions, context):
+            if rule.matches(context):
                 applicable_rules.append(rule)
         
         # 按优先级排序
-        applicable_rules.sort(key=lambda r: r.priority, reverse=True)
+        applicable_rules.sort(key=attrgetter("priority"), reverse=True)
         return applicable_rules
     
     def _evaluate_conditions(self, conditions: Dict[str, Any], context: Dict[str, Any]) -> bool:
@@ -317,51 +521,30 @@ class SchedulingConfigManager:
         if not conditions:
             return True
         
-        # 简单的条件评估实现
-        # 在生产环境中可以使用更复杂的规则引擎
-        for key, expected_value in conditions.items():
-            context_value = context.get(key)
-            
-            if isinstance(expected_value, dict):
-                # 支持比较操作符
-                for op, value in expected_value.items():
-                    if op == "eq" and context_value != value:
-                        return False
-                    elif op == "gt" and (context_value is None or context_value <= value):
-                        return False
-                    elif op == "lt" and (context_value is None or context_value >= value):
-                        return False
-                    elif op == "gte" and (context_value is None or context_value < value):
-                        return False
-                    elif op == "lte" and (context_value is None or context_value > value):
-                        return False
-                    elif op == "in":
-                        if isinstance(context_value, (list, set, tuple)):
-                            # 至少有一个元素在期望集合中
-                            if not any(elem in value for elem in context_value):
-                                return False
-                        else:
-                            if context_value not in value:
-                                return False
-            else:
-                # 直接比较
-                if context_value != expected_value:
-                    return False
-        
-        return True
+        try:
+            key = _freeze(conditions)
+            predicate = self._condition_predicates.get(key)
+        except TypeError:
+            # 条件中含不可哈希的值，不缓存
+            return compile_conditions(conditions)(context)
+        if predicate is None:
+            if len(self._condition_predicates) >= CONDITION_CACHE_MAXSIZE:
+                self._condition_predicates.clear()
+            predicate = self._condition_predicates[key] = compile_conditions(conditions)
+        return predicate(context)
     
-    def export_policy(self, policy_id: str) -> Optional[str]:
-        """导出策略为JSON"""
+    def export_policy(self, policy_id: str, indent: Optional[int] = 2) -> Optional[str]:
+        """导出策略为JSON（配置同步等机器读取场景可传indent=None输出紧凑JSON）"""
         policy = self.get_policy(policy_id)
         if not policy:
             return None
-        return policy.model_dump_json(indent=2)
+        return policy.model_dump_json(indent=indent)
     
-    def import_policy(self, policy_json: str) -> bool:
+    def import_policy(self, policy_json: Union[str, bytes]) -> bool:
         """从JSON导入策略"""
         try:
-            policy_data = json.loads(policy_json)
-            policy = SchedulingPolicy(**policy_data)
+            # 由pydantic-core直接解析并校验JSON，不经过中间dict
+            policy = SchedulingPolicy.model_validate_json(policy_json)
             return self.add_policy(policy)
         except Exception:
             return False
@@ -1,14 +1,25 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime, timezone
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from enum import Enum
 
-from app.core.websocket_manager import websocket_manager
+from app.core.config import settings
+from app.core.websocket import manager as connection_manager
+from app.core.websocket_manager import (
+    HEARTBEAT_TEMPLATE,
+    encode_json_string,
+    now_iso,
+    websocket_manager
+)
 from app.models.task import TaskStatus
 
 logger = logging.getLogger(__name__)
 
+# 合并窗口内单个任务最多缓存的日志消息数，达到后立即发送
+MAX_PENDING_LOG_MESSAGES = 100
+
 
 class MessageType(str, Enum):
     """WebSocket消息类型"""
@@ -21,14 +32,206 @@ class MessageType(str, Enum):
     HEARTBEAT = "heartbeat"
 
 
+# 各消息类型的普通字符串值：构造消息时直接使用，编码时无需经过枚举成员
+TASK_STATUS_UPDATE: str = MessageType.TASK_STATUS_UPDATE.value
+TASK_PROGRESS: str = MessageType.TASK_PROGRESS.value
+TASK_LOGS: str = MessageType.TASK_LOGS.value
+TASK_ERROR: str = MessageType.TASK_ERROR.value
+TASK_COMPLETED: str = MessageType.TASK_COMPLETED.value
+TASK_CANCELLED: str = MessageType.TASK_CANCELLED.value
+
+# 任务生命周期消息：发送前先发出已缓存的进度和日志，并按INFO级别记录
+_LIFECYCLE_MESSAGE_TYPES = frozenset({TASK_STATUS_UPDATE, TASK_ERROR, TASK_COMPLETED, TASK_CANCELLED})
+
+# 与该任务上一条同类消息内容相同时不再重复广播的消息类型
+_DEDUP_MESSAGE_TYPES = frozenset({TASK_STATUS_UPDATE, TASK_PROGRESS})
+
+# 任务结束消息：发送后清理该任务的去重记录
+_FINAL_MESSAGE_TYPES = frozenset({TASK_COMPLETED, TASK_CANCELLED})
+
+# 去重记录最多保留的任务数，超出时淘汰最久未更新的任务（未正常结束的任务不会一直占用）
+MAX_DEDUP_TASKS = 1024
+
+
+def _clamp_progress(progress: float) -> float:
+    """将进度限制在0-100之间（比较分支代替max/min两次函数调用）"""
+    return 0 if progress < 0 else 100 if progress > 100 else progress
+
+
 class TaskStatusBroadcaster:
     """任务状态广播服务
     
-    负责将任务状态变化实时推送到WebSocket客户端
+    负责将任务状态变化实时推送到WebSocket客户端。
+    write_delay大于0时，进度和日志消息在该窗口内按任务合并后再发送：
+    进度只保留最新一条，相邻的同级别同来源日志拼接为一条；
+    状态、错误、完成、取消等消息发送前先发出该任务已缓存的消息，保证顺序。
+    状态和进度消息与该任务上一条状态/进度消息内容（时间戳除外）相同时直接丢弃。
+    任务没有订阅连接时，各广播方法直接返回，不构造消息。
     """
     
-    def __init__(self):
+    def __init__(self, write_delay: float = 0.0):
         self.ws_manager = websocket_manager
+        # 通用WebSocket连接中订阅了任务更新的客户端同样接收任务消息
+        self.connection_manager = connection_manager
+        self.write_delay = write_delay
+        # 待发送的最新进度消息 {task_id: message}
+        self._pending_progress: Dict[str, Dict[str, Any]] = {}
+        # 待发送的日志消息 {task_id: [message, ...]}
+        self._pending_logs: Dict[str, List[Dict[str, Any]]] = {}
+        # 各任务的延迟发送协程 {task_id: asyncio.Task}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        # 各任务最近一条消息的类型和字段，用于丢弃连续重复的状态/进度 {task_id: (type, fields)}，按更新顺序排列
+        self._last_emitted: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+    
+    def _has_subscribers(self, task_id: str) -> bool:
+        """任务是否有订阅连接；没有时清理该任务的去重记录，之后的新订阅者能收到当前状态"""
+        if self.ws_manager.has_subscribers(task_id) or self.connection_manager.has_task_subscribers(task_id):
+            return True
+        self._last_emitted.pop(task_id, None)
+        return False
+    
+    async def _broadcast(self, task_id: str, message: Dict[str, Any]):
+        """发送消息到任务专用连接，以及通用连接中订阅了该任务的客户端"""
+        await self.ws_manager.broadcast_to_task(task_id, message)
+        if self.connection_manager.has_task_subscribers(task_id):
+            await self.connection_manager.broadcast_to_task(task_id, message)
+    
+    def _schedule_flush(self, task_id: str):
+        """为任务在当前事件循环上安排一次延迟发送（已安排时不重复）
+        
+        Celery任务每次在新的事件循环中运行：已结束或属于其他事件循环的延迟发送视为失效，重新安排。
+        """
+        loop = asyncio.get_running_loop()
+        flush_task = self._flush_tasks.get(task_id)
+        if flush_task is not None and not flush_task.done() and flush_task.get_loop() is loop:
+            return
+        self._flush_tasks[task_id] = loop.create_task(self._delayed_flush(task_id))
+    
+    async def _delayed_flush(self, task_id: str):
+        """等待合并窗口结束后发送任务缓存的消息"""
+        try:
+            await asyncio.sleep(self.write_delay)
+        finally:
+            # 只移除自己的记录（期间可能已在其他事件循环上重新安排）
+            if self._flush_tasks.get(task_id) is asyncio.current_task():
+                del self._flush_tasks[task_id]
+        await self.flush(task_id)
+    
+    async def flush_all(self):
+        """立即发送所有任务缓存的消息，并取消当前事件循环上的延迟发送
+        
+        在事件循环关闭前调用（如Celery任务结束时），避免合并窗口内的消息丢失。
+        """
+        loop = asyncio.get_running_loop()
+        cancelled = []
+        for task_id, flush_task in list(self._flush_tasks.items()):
+            if flush_task.get_loop() is loop:
+                flush_task.cancel()
+                cancelled.append(flush_task)
+                del self._flush_tasks[task_id]
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+        
+        for task_id in set(self._pending_logs) | set(self._pending_progress):
+            await self.flush(task_id)
+    
+    @staticmethod
+    def _merge_logs(log_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """将相邻的同级别、同来源日志消息拼接为一条（时间戳取最后一条）
+        
+        每条合并消息的日志内容先收集到列表，最后一次性拼接，避免逐条拼接产生中间字符串。
+        """
+        merged: List[Dict[str, Any]] = []
+        parts: List[List[str]] = []
+        for log_message in log_messages:
+            last = merged[-1] if merged else None
+            if (last is not None and last["level"] == log_message["level"]
+                    and last["source"] == log_message["source"]):
+                parts[-1].append(log_message["logs"])
+                last["timestamp"] = log_message["timestamp"]
+            else:
+                merged.append(dict(log_message))
+                parts.append([log_message["logs"]])
+        for message, message_parts in zip(merged, parts):
+            if len(message_parts) > 1:
+                message["logs"] = "\n".join(message_parts)
+        return merged
+    
+    async def flush(self, task_id: str):
+        """立即发送任务缓存的日志和进度消息
+        
+        Args:
+            task_id: 任务ID
+        """
+        log_messages = self._pending_logs.pop(task_id, None)
+        progress_message = self._pending_progress.pop(task_id, None)
+        
+        # 循环外取一次绑定方法，避免每条消息都查找属性
+        broadcast = self._broadcast
+        try:
+            if log_messages:
+                for log_message in self._merge_logs(log_messages):
+                    await broadcast(task_id, log_message)
+            if progress_message is not None:
+                await broadcast(task_id, progress_message)
+        except Exception as e:
+            logger.error(f"Failed to flush pending messages for task {task_id}: {e}")
+    
+    async def _emit(self, task_id: str, message_type: str, fields: Dict[str, Any]):
+        """构建并广播一条任务消息（所有广播方法的公共路径，发送失败只记录日志）
+        
+        Args:
+            task_id: 任务ID
+            message_type: 消息类型
+            fields: 消息字段
+        """
+        try:
+            if message_type in _DEDUP_MESSAGE_TYPES:
+                last_emitted = (message_type, fields)
+                if self._last_emitted.get(task_id) == last_emitted:
+                    return
+                self._last_emitted[task_id] = last_emitted
+                self._last_emitted.move_to_end(task_id)
+                if len(self._last_emitted) > MAX_DEDUP_TASKS:
+                    self._last_emitted.popitem(last=False)
+            elif message_type in _FINAL_MESSAGE_TYPES:
+                self._last_emitted.pop(task_id, None)
+            
+            message = {
+                "type": message_type,
+                "task_id": task_id,
+                "timestamp": now_iso(),
+                **fields
+            }
+            
+            if self.write_delay > 0:
+                if message_type == TASK_PROGRESS:
+                    # 合并窗口内只保留最新进度
+                    self._pending_progress[task_id] = message
+                    self._schedule_flush(task_id)
+                    return
+                if message_type == TASK_LOGS:
+                    pending_logs = self._pending_logs.setdefault(task_id, [])
+                    pending_logs.append(message)
+                    if len(pending_logs) >= MAX_PENDING_LOG_MESSAGES:
+                        await self.flush(task_id)
+                    else:
+                        self._schedule_flush(task_id)
+                    return
+                if message_type in _LIFECYCLE_MESSAGE_TYPES:
+                    # 先发出已缓存的进度和日志，保证消息顺序
+                    await self.flush(task_id)
+            
+            # 广播到所有订阅该任务的连接
+            await self._broadcast(task_id, message)
+            
+            logger.log(
+                logging.INFO if message_type in _LIFECYCLE_MESSAGE_TYPES else logging.DEBUG,
+                "Broadcasted %s for task %s", message_type, task_id
+            )
+            
+        except Exception as e:
+            logger.error(f"Failed to broadcast {message_type} for task {task_id}: {e}")
     
     async def broadcast_status_update(
         self,
@@ -47,29 +250,18 @@ class TaskStatusBroadcaster:
             progress: 进度百分比 (0-100)
             additional_data: 额外数据
         """
-        try:
-            # 构建状态更新消息
-            status_message = {
-                "type": MessageType.TASK_STATUS_UPDATE,
-                "task_id": task_id,
-                "status": status.value if hasattr(status, 'value') else str(status),
-                "message": message or f"Task status updated to {status}",
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            if progress is not None:
-                status_message["progress"] = max(0, min(100, progress))
-            
-            if additional_data:
-                status_message["data"] = additional_data
-            
-            # 广播到所有订阅该任务的连接
-            await self.ws_manager.broadcast_to_task(task_id, status_message)
-            
-            logger.info(f"Broadcasted status update for task {task_id}: {status}")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast status update for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        fields = {
+            "status": status.value if hasattr(status, 'value') else str(status),
+            "message": message or f"Task status updated to {status}"
+        }
+        if progress is not None:
+            fields["progress"] = _clamp_progress(progress)
+        if additional_data:
+            fields["data"] = additional_data
+        await self._emit(task_id, TASK_STATUS_UPDATE, fields)
     
     async def broadcast_progress_update(
         self,
@@ -86,24 +278,16 @@ class TaskStatusBroadcaster:
             message: 进度消息
             step_info: 步骤信息
         """
-        try:
-            progress_message = {
-                "type": MessageType.TASK_PROGRESS,
-                "task_id": task_id,
-                "progress": max(0, min(100, progress)),
-                "message": message or f"Task progress: {progress:.1f}%",
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            if step_info:
-                progress_message["step_info"] = step_info
-            
-            await self.ws_manager.broadcast_to_task(task_id, progress_message)
-            
-            logger.debug(f"Broadcasted progress update for task {task_id}: {progress}%")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast progress update for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        fields = {
+            "progress": _clamp_progress(progress),
+            "message": message or f"Task progress: {progress:.1f}%"
+        }
+        if step_info:
+            fields["step_info"] = step_info
+        await self._emit(task_id, TASK_PROGRESS, fields)
     
     async def broadcast_logs(
         self,
@@ -120,22 +304,10 @@ class TaskStatusBroadcaster:
             level: 日志级别
             source: 日志来源
         """
-        try:
-            log_message = {
-                "type": MessageType.TASK_LOGS,
-                "task_id": task_id,
-                "logs": logs,
-                "level": level.upper(),
-                "source": source,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            await self.ws_manager.broadcast_to_task(task_id, log_message)
-            
-            logger.debug(f"Broadcasted logs for task {task_id} ({len(logs)} chars)")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast logs for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        await self._emit(task_id, TASK_LOGS, {"logs": logs, "level": level.upper(), "source": source})
     
     async def broadcast_error(
         self,
@@ -152,26 +324,15 @@ class TaskStatusBroadcaster:
             error_code: 错误代码
             error_details: 错误详情
         """
-        try:
-            error_msg = {
-                "type": MessageType.TASK_ERROR,
-                "task_id": task_id,
-                "error_message": error_message,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            if error_code:
-                error_msg["error_code"] = error_code
-            
-            if error_details:
-                error_msg["error_details"] = error_details
-            
-            await self.ws_manager.broadcast_to_task(task_id, error_msg)
-            
-            logger.info(f"Broadcasted error for task {task_id}: {error_message}")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast error for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        fields: Dict[str, Any] = {"error_message": error_message}
+        if error_code:
+            fields["error_code"] = error_code
+        if error_details:
+            fields["error_details"] = error_details
+        await self._emit(task_id, TASK_ERROR, fields)
     
     async def broadcast_task_completed(
         self,
@@ -190,29 +351,17 @@ class TaskStatusBroadcaster:
             execution_time: 执行时间（秒）
             cost_info: 成本信息
         """
-        try:
-            completion_message = {
-                "type": MessageType.TASK_COMPLETED,
-                "task_id": task_id,
-                "success": success,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            if result_data:
-                completion_message["result_data"] = result_data
-            
-            if execution_time is not None:
-                completion_message["execution_time"] = execution_time
-            
-            if cost_info:
-                completion_message["cost_info"] = cost_info
-            
-            await self.ws_manager.broadcast_to_task(task_id, completion_message)
-            
-            logger.info(f"Broadcasted completion for task {task_id}: success={success}")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast completion for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        fields: Dict[str, Any] = {"success": success}
+        if result_data:
+            fields["result_data"] = result_data
+        if execution_time is not None:
+            fields["execution_time"] = execution_time
+        if cost_info:
+            fields["cost_info"] = cost_info
+        await self._emit(task_id, TASK_COMPLETED, fields)
     
     async def broadcast_task_cancelled(
         self,
@@ -225,20 +374,10 @@ class TaskStatusBroadcaster:
             task_id: 任务ID
             reason: 取消原因
         """
-        try:
-            cancellation_message = {
-                "type": MessageType.TASK_CANCELLED,
-                "task_id": task_id,
-                "reason": reason or "Task was cancelled by user",
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            
-            await self.ws_manager.broadcast_to_task(task_id, cancellation_message)
-            
-            logger.info(f"Broadcasted cancellation for task {task_id}")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast cancellation for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        await self._emit(task_id, TASK_CANCELLED, {"reason": reason or "Task was cancelled by user"})
     
     async def send_heartbeat(self, task_id: str):
         """发送心跳消息
@@ -246,15 +385,15 @@ class TaskStatusBroadcaster:
         Args:
             task_id: 任务ID
         """
+        if not self._has_subscribers(task_id):
+            return
+        
         try:
-            heartbeat_message = {
-                "type": MessageType.HEARTBEAT,
-                "task_id": task_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "message": "heartbeat"
-            }
-            
-            await self.ws_manager.broadcast_to_task(task_id, heartbeat_message)
+            # 心跳结构固定，直接按模板拼出消息文本
+            payload = HEARTBEAT_TEMPLATE % (encode_json_string(task_id), now_iso())
+            await self.ws_manager.broadcast_payload_to_task(task_id, payload, sheddable=True)
+            if self.connection_manager.has_task_subscribers(task_id):
+                await self.connection_manager.broadcast_payload_to_task(task_id, payload)
             
         except Exception as e:
             logger.error(f"Failed to send heartbeat for task {task_id}: {e}")
@@ -272,20 +411,10 @@ class TaskStatusBroadcaster:
             message_type: 消息类型
             data: 消息数据
         """
-        try:
-            custom_message = {
-                "type": message_type,
-                "task_id": task_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                **data
-            }
-            
-            await self.ws_manager.broadcast_to_task(task_id, custom_message)
-            
-            logger.debug(f"Broadcasted custom message for task {task_id}: {message_type}")
-            
-        except Exception as e:
-            logger.error(f"Failed to broadcast custom message for task {task_id}: {e}")
+        if not self._has_subscribers(task_id):
+            return
+        
+        await self._emit(task_id, message_type, data)
     
     def get_connection_count(self, task_id: str) -> int:
         """获取指定任务的连接数量
@@ -311,17 +440,22 @@ class TaskStatusBroadcaster:
 
 
 # 全局任务状态广播器实例
-task_broadcaster = TaskStatusBroadcaster()
+task_broadcaster = TaskStatusBroadcaster(write_delay=settings.websocket_write_delay_ms / 1000)
 
 
 # 便捷函数
-import inspect
-
-async def _maybe_await(result):
-    """在需要时等待协程结果，兼容被MagicMock替换的情况（非异步）"""
-    if inspect.isawaitable(result):
+if settings.environment == "production":
+    async def _maybe_await(result):
+        """生产环境中广播方法总是返回协程，直接等待"""
         return await result
-    return result
+else:
+    import inspect
+    
+    async def _maybe_await(result):
+        """在需要时等待协程结果，兼容被MagicMock替换的情况（非异步）"""
+        if inspect.isawaitable(result):
+            return await result
+        return result
 
 
 async def broadcast_task_status(
@@ -329,11 +463,14 @@ async def broadcast_task_status(
     status: TaskStatus,
     message: Optional[str] = None,
     progress: Optional[float] = None,
+    additional_data: Optional[Dict[str, Any]] = None,
     **kwargs
 ):
-    """便捷函数：广播任务状态更新"""
+    """便捷函数：广播任务状态更新（其余关键字参数并入additional_data）"""
+    if kwargs:
+        additional_data = {**additional_data, **kwargs} if additional_data else kwargs
     result = task_broadcaster.broadcast_status_update(
-        task_id, status, message, progress, kwargs
+        task_id, status, message, progress, additional_data
     )
     return await _maybe_await(result)
 
@@ -342,11 +479,14 @@ async def broadcast_task_progress(
     task_id: str,
     progress: float,
     message: Optional[str] = None,
+    step_info: Optional[Dict[str, Any]] = None,
     **kwargs
 ):
-    """便捷函数：广播任务进度更新"""
+    """便捷函数：广播任务进度更新（其余关键字参数并入step_info）"""
+    if kwargs:
+        step_info = {**step_info, **kwargs} if step_info else kwargs
     result = task_broadcaster.broadcast_progress_update(
-        task_id, progress, message, kwargs
+        task_id, progress, message, step_info
     )
     return await _maybe_await(result)
 
@@ -366,10 +506,13 @@ async def broadcast_task_error(
     task_id: str,
     error_message: str,
     error_code: Optional[str] = None,
+    error_details: Optional[Dict[str, Any]] = None,
     **kwargs
 ):
-    """便捷函数：广播任务错误"""
+    """便捷函数：广播任务错误（其余关键字参数并入error_details）"""
+    if kwargs:
+        error_details = {**error_details, **kwargs} if error_details else kwargs
     result = task_broadcaster.broadcast_error(
-        task_id, error_message, error_code, kwargs
+        task_id, error_message, error_code, error_details
     )
     return await _maybe_await(result)
@@ -2,16 +2,31 @@
 WebSocket 实时推送功能
 用于实时推送任务状态更新、系统通知等
 """
+import asyncio
 import json
+import logging
 import uuid
 from datetime import datetime
-from typing import Dict, List, Set, Optional, Any
+from typing import Dict, List, Sequence, Set, Tuple, Optional, Any
 from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.user import User, UserRole
+from app.models.task import GpuTask
 from app.core.auth import get_current_user_websocket
 from app.core.database import get_async_session
+from app.core.websocket_manager import encode_message, now_iso
+
+logger = logging.getLogger(__name__)
+
+# 单次广播同时进行的最大发送数
+FAN_OUT_CONCURRENCY = 100
+
+# 心跳回复的预编码模板，只拼入时间戳
+_PONG_TEMPLATE = '{"type":"pong","data":{"timestamp":"%s"}}'
+
+# 发送失败累计达到该数量的整数倍时输出一次汇总警告（单次失败只记DEBUG日志）
+SEND_FAILURE_LOG_INTERVAL = 100
 
 
 class ConnectionManager:
@@ -20,10 +35,16 @@ class ConnectionManager:
     def __init__(self):
         # 存储所有活跃连接: {connection_id: {'websocket': WebSocket, 'user': User}}
         self.active_connections: Dict[str, Dict[str, Any]] = {}
-        # 按用户ID分组连接: {user_id: set(connection_ids)}
-        self.user_connections: Dict[str, Set[str]] = {}
-        # 管理员连接单独管理
-        self.admin_connections: Set[str] = set()
+        # 按用户ID分组连接，直接保存WebSocket对象: {user_id: {connection_id: WebSocket}}
+        self.user_connections: Dict[str, Dict[str, WebSocket]] = {}
+        # 管理员连接单独管理: {connection_id: WebSocket}
+        self.admin_connections: Dict[str, WebSocket] = {}
+        # 按任务ID索引订阅连接: {task_id: {connection_id: WebSocket}}
+        self.task_connections: Dict[str, Dict[str, WebSocket]] = {}
+        # 连接订阅的任务（断开时据此清理任务索引）: {connection_id: set(task_ids)}
+        self.connection_tasks: Dict[str, Set[str]] = {}
+        # 累计发送失败次数
+        self.send_failures = 0
     
     async def connect(self, websocket: WebSocket, user: User) -> str:
         """接受WebSocket连接"""
@@ -41,15 +62,13 @@ class ConnectionManager:
         }
         
         # 按用户分组
-        if user_id not in self.user_connections:
-            self.user_connections[user_id] = set()
-        self.user_connections[user_id].add(connection_id)
+        self.user_connections.setdefault(user_id, {})[connection_id] = websocket
         
         # 如果是管理员，加入管理员连接组
         if user.role == UserRole.ADMIN:
-            self.admin_connections.add(connection_id)
+            self.admin_connections[connection_id] = websocket
         
-        print(f"🔗 WebSocket连接建立: {user.nickname} ({user.email}) - {connection_id}")
+        logger.info("WebSocket连接建立: %s (%s) - %s", user.nickname, user.email, connection_id)
         return connection_id
     
     def disconnect(self, connection_id: str):
@@ -63,66 +82,124 @@ class ConnectionManager:
             del self.active_connections[connection_id]
             
             # 从用户连接组中移除
-            if user_id in self.user_connections:
-                self.user_connections[user_id].discard(connection_id)
-                if not self.user_connections[user_id]:
+            user_websockets = self.user_connections.get(user_id)
+            if user_websockets is not None:
+                user_websockets.pop(connection_id, None)
+                if not user_websockets:
                     del self.user_connections[user_id]
             
             # 从管理员连接组中移除
-            self.admin_connections.discard(connection_id)
+            self.admin_connections.pop(connection_id, None)
             
-            print(f"❌ WebSocket连接断开: {user.nickname} ({user.email}) - {connection_id}")
+            # 从订阅的任务中移除
+            for task_id in self.connection_tasks.pop(connection_id, ()):
+                self._remove_task_subscriber(task_id, connection_id)
+            
+            logger.info("WebSocket连接断开: %s (%s) - %s", user.nickname, user.email, connection_id)
+    
+    def subscribe_task(self, connection_id: str, task_id: str) -> bool:
+        """订阅任务更新，连接不存在时返回False"""
+        connection_info = self.active_connections.get(connection_id)
+        if connection_info is None:
+            return False
+        self.task_connections.setdefault(task_id, {})[connection_id] = connection_info['websocket']
+        self.connection_tasks.setdefault(connection_id, set()).add(task_id)
+        return True
+    
+    def unsubscribe_task(self, connection_id: str, task_id: str):
+        """取消订阅任务更新"""
+        task_ids = self.connection_tasks.get(connection_id)
+        if task_ids is not None:
+            task_ids.discard(task_id)
+            if not task_ids:
+                del self.connection_tasks[connection_id]
+        self._remove_task_subscriber(task_id, connection_id)
+    
+    def _remove_task_subscriber(self, task_id: str, connection_id: str):
+        """从任务订阅索引中移除连接，任务没有订阅者时清理该任务"""
+        subscribers = self.task_connections.get(task_id)
+        if subscribers is not None:
+            subscribers.pop(connection_id, None)
+            if not subscribers:
+                del self.task_connections[task_id]
+    
+    def has_task_subscribers(self, task_id: str) -> bool:
+        """指定任务是否有订阅连接（没有订阅者的任务不在索引中）"""
+        return task_id in self.task_connections
+    
+    async def broadcast_to_task(self, task_id: str, message: dict):
+        """发送消息给订阅该任务的所有连接（只遍历该任务的订阅者）"""
+        if task_id not in self.task_connections:
+            return
+        await self.broadcast_payload_to_task(task_id, encode_message(message))
+    
+    async def broadcast_payload_to_task(self, task_id: str, payload: str):
+        """发送已序列化的消息给订阅该任务的所有连接"""
+        subscribers = self.task_connections.get(task_id)
+        if not subscribers:
+            return
+        await self._fan_out(tuple(subscribers.items()), payload, "发送任务消息失败")
     
     async def send_personal_message(self, message: dict, user_id: str):
         """发送个人消息给特定用户的所有连接"""
-        if user_id in self.user_connections:
-            disconnected_connections = []
+        user_websockets = self.user_connections.get(user_id)
+        if not user_websockets:
+            return
+        
+        # 消息只序列化一次，该用户的所有连接复用同一份负载
+        payload = encode_message(message)
+        await self._fan_out(tuple(user_websockets.items()), payload, "发送消息失败")
+    
+    async def _fan_out(self, targets: Sequence[Tuple[str, WebSocket]], payload: str, error_prefix: str):
+        """将已序列化的消息并发发送给一组 (连接ID, WebSocket)，并清理发送失败的连接
+        
+        targets是调用方取的一次性快照（发送期间连接可能增减，不能直接遍历索引字典）；
+        广播耗时取决于最慢的连接而非所有连接之和；连接数较多时用信号量限制同时进行的发送数。
+        """
+        if len(targets) > FAN_OUT_CONCURRENCY:
+            semaphore = asyncio.Semaphore(FAN_OUT_CONCURRENCY)
             
-            for connection_id in self.user_connections[user_id].copy():
-                if connection_id in self.active_connections:
-                    websocket = self.active_connections[connection_id]['websocket']
-                    try:
-                        await websocket.send_text(json.dumps(message, ensure_ascii=False))
-                    except Exception as e:
-                        print(f"❌ 发送消息失败: {e}")
-                        disconnected_connections.append(connection_id)
+            async def send(websocket: WebSocket):
+                async with semaphore:
+                    await websocket.send_text(payload)
             
-            # 清理断开的连接
-            for conn_id in disconnected_connections:
-                self.disconnect(conn_id)
+            sends = (send(websocket) for _, websocket in targets)
+        else:
+            sends = (websocket.send_text(payload) for _, websocket in targets)
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        
+        # 先标记发送失败的连接，全部发送结束后统一清理
+        failed = [
+            (conn_id, result) for (conn_id, _), result in zip(targets, results) if isinstance(result, Exception)
+        ]
+        if not failed:
+            return
+        for conn_id, error in failed:
+            logger.debug("%s: cid=%s err=%s", error_prefix, conn_id, error)
+            self.disconnect(conn_id)
+        
+        previous_failures = self.send_failures
+        self.send_failures += len(failed)
+        if self.send_failures // SEND_FAILURE_LOG_INTERVAL > previous_failures // SEND_FAILURE_LOG_INTERVAL:
+            logger.warning("WebSocket发送失败累计 %d 次，最近一次 %s: %s", self.send_failures, error_prefix, failed[-1][1])
     
     async def send_to_admins(self, message: dict):
         """发送消息给所有管理员"""
-        disconnected_connections = []
+        if not self.admin_connections:
+            return
         
-        for connection_id in self.admin_connections.copy():
-            if connection_id in self.active_connections:
-                websocket = self.active_connections[connection_id]['websocket']
-                try:
-                    await websocket.send_text(json.dumps(message, ensure_ascii=False))
-                except Exception as e:
-                    print(f"❌ 发送管理员消息失败: {e}")
-                    disconnected_connections.append(connection_id)
-        
-        # 清理断开的连接
-        for conn_id in disconnected_connections:
-            self.disconnect(conn_id)
+        # 消息只序列化一次，所有连接复用同一份负载
+        payload = encode_message(message)
+        await self._fan_out(tuple(self.admin_connections.items()), payload, "发送管理员消息失败")
     
     async def broadcast_to_all(self, message: dict):
         """广播消息给所有连接"""
-        disconnected_connections = []
+        if not self.active_connections:
+            return
         
-        for connection_id, connection_info in self.active_connections.items():
-            websocket = connection_info['websocket']
-            try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
-            except Exception as e:
-                print(f"❌ 广播消息失败: {e}")
-                disconnected_connections.append(connection_id)
-        
-        # 清理断开的连接
-        for conn_id in disconnected_connections:
-            self.disconnect(conn_id)
+        payload = encode_message(message)
+        targets = tuple((cid, info['websocket']) for cid, info in self.active_connections.items())
+        await self._fan_out(targets, payload, "广播消息失败")
     
     def get_connection_stats(self) -> dict:
         """获取连接统计信息"""
@@ -130,6 +207,8 @@ class ConnectionManager:
             "total_connections": len(self.active_connections),
             "total_users": len(self.user_connections),
             "admin_connections": len(self.admin_connections),
+            "subscribed_tasks": len(self.task_connections),
+            "send_failures": self.send_failures,
             "users_online": list(self.user_connections.keys())
         }
 
@@ -150,7 +229,7 @@ class WebSocketNotificationService:
                 "task_id": task_id,
                 "status": status,
                 "message": message or f"任务状态更新为: {status}",
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         await manager.send_personal_message(notification, user_id)
@@ -163,7 +242,7 @@ class WebSocketNotificationService:
             "data": {
                 "task_id": task_id,
                 "log_content": log_content,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         await manager.send_personal_message(notification, user_id)
@@ -176,7 +255,7 @@ class WebSocketNotificationService:
             "data": {
                 "message": message,
                 "alert_type": alert_type,  # info, warning, error, success
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         
@@ -194,7 +273,7 @@ class WebSocketNotificationService:
                 "title": title,
                 "content": content,
                 "message_type": message_type,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         await manager.send_personal_message(notification, user_id)
@@ -207,7 +286,7 @@ class WebSocketNotificationService:
             "data": {
                 "message": message,
                 "start_time": start_time,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         await manager.broadcast_to_all(notification)
@@ -219,7 +298,7 @@ class WebSocketNotificationService:
             "type": "realtime_stats",
             "data": {
                 "stats": stats,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
         await manager.send_to_admins(notification)
@@ -258,10 +337,10 @@ async def handle_websocket_connection(
             "data": {
                 "message": f"欢迎, {user.nickname}！WebSocket连接已建立。",
                 "connection_id": connection_id,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso()
             }
         }
-        await websocket.send_text(json.dumps(welcome_message, ensure_ascii=False))
+        await websocket.send_text(encode_message(welcome_message))
         
         # 发送连接统计信息给管理员
         if user.role == UserRole.ADMIN:
@@ -277,41 +356,52 @@ async def handle_websocket_connection(
                 
                 # 处理心跳检测
                 if message.get("type") == "ping":
-                    pong_message = {
-                        "type": "pong",
-                        "data": {"timestamp": datetime.utcnow().isoformat()}
-                    }
-                    await websocket.send_text(json.dumps(pong_message))
+                    await websocket.send_text(_PONG_TEMPLATE % now_iso())
                     continue
                 
                 # 处理其他消息类型
-                await handle_client_message(message, user, session)
+                await handle_client_message(message, user, session, connection_id)
                 
             except json.JSONDecodeError:
                 error_message = {
                     "type": "error",
                     "data": {"message": "无效的JSON消息格式"}
                 }
-                await websocket.send_text(json.dumps(error_message))
+                await websocket.send_text(encode_message(error_message))
                 
     except WebSocketDisconnect:
-        print(f"🔌 WebSocket客户端断开连接: {user.nickname}")
+        logger.debug("WebSocket客户端断开连接: %s", user.nickname)
     except Exception as e:
-        print(f"❌ WebSocket连接错误: {e}")
+        logger.error("WebSocket连接错误: %s", e)
     finally:
         manager.disconnect(connection_id)
 
 
-async def handle_client_message(message: dict, user: User, session: AsyncSession):
+async def handle_client_message(
+    message: dict,
+    user: User,
+    session: AsyncSession,
+    connection_id: Optional[str] = None
+):
     """处理客户端发送的消息"""
     message_type = message.get("type")
     
     if message_type == "subscribe_task_updates":
-        # 客户端订阅任务更新
+        # 客户端订阅任务更新（只能订阅自己的任务，管理员不限）
+        task_id = message.get("data", {}).get("task_id")
+        if task_id and connection_id:
+            task = await session.get(GpuTask, task_id)
+            if task is None or (user.role != UserRole.ADMIN and str(task.user_id) != str(user.id)):
+                logger.warning("用户 %s 无权订阅任务 %s", user.nickname, task_id)
+                return
+            manager.subscribe_task(connection_id, task_id)
+            logger.debug("用户 %s 订阅任务 %s 的更新", user.nickname, task_id)
+    
+    elif message_type == "unsubscribe_task_updates":
+        # 客户端取消订阅任务更新
         task_id = message.get("data", {}).get("task_id")
-        if task_id:
-            # 这里可以实现任务更新订阅逻辑
-            print(f"📊 用户 {user.nickname} 订阅任务 {task_id} 的更新")
+        if task_id and connection_id:
+            manager.unsubscribe_task(connection_id, task_id)
     
     elif message_type == "request_stats" and user.role == UserRole.ADMIN:
         # 管理员请求实时统计
@@ -1,14 +1,66 @@
 import json
 import logging
-from typing import Dict, List, Set, Any
-from datetime import datetime, timezone
+from collections import deque
+from typing import Deque, Dict, List, Set, Tuple, Any
+from datetime import date, datetime, timezone
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
+import time
 from contextlib import asynccontextmanager
 
 logger = logging.getLogger(__name__)
 
 
+def _json_default(value: Any) -> str:
+    """消息中非JSON原生类型的编码：日期时间输出ISO-8601，其余按str输出"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+# WebSocket消息共用的JSON编码器：紧凑分隔符、直接输出UTF-8字符（不做\u转义），减小消息体积
+_MESSAGE_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def encode_message(message: Dict[str, Any]) -> str:
+    """将WebSocket消息编码为JSON文本"""
+    return _MESSAGE_ENCODER.encode(message)
+
+
+# 将字符串编码为带引号、已转义的JSON字符串字面量（可安全拼入消息模板）
+encode_json_string = json.encoder.encode_basestring
+
+# 固定结构消息的预编码模板，只拼入动态字段，不构造字典也不经过JSON编码器
+PONG_TEMPLATE = '{"type":"pong","timestamp":"%s"}'
+HEARTBEAT_TEMPLATE = '{"type":"heartbeat","task_id":%s,"timestamp":"%s","message":"heartbeat"}'
+
+
+# 时间戳字符串的缓存粒度（秒）：同一毫秒内的消息复用同一个ISO-8601字符串
+TIMESTAMP_CACHE_SECONDS = 0.001
+
+# 最近一次生成的时间戳 (monotonic时间, ISO-8601字符串)
+_last_timestamp: Tuple[float, str] = (float("-inf"), "")
+
+
+def now_iso() -> str:
+    """当前UTC时间的ISO-8601字符串（按毫秒粒度缓存，避免同一批广播重复格式化）"""
+    global _last_timestamp
+    now = time.monotonic()
+    cached_at, cached = _last_timestamp
+    if now - cached_at < TIMESTAMP_CACHE_SECONDS:
+        return cached
+    value = datetime.now(timezone.utc).isoformat()
+    _last_timestamp = (now, value)
+    return value
+
+
+# 每个连接在发送中时最多积压的待发送消息数
+SEND_BUFFER_MAXSIZE = 256
+
+# 积压已满时可丢弃的消息类型（只需最新一条即可的进度、心跳）
+SHEDDABLE_MESSAGE_TYPES = frozenset({"task_progress", "heartbeat"})
+
+
 class WebSocketManager:
     """WebSocket连接管理器
     
@@ -23,6 +75,10 @@ class WebSocketManager:
         self.connection_metadata: Dict[str, Dict[str, Any]] = {}
         # 全局连接映射 {connection_id: task_id}
         self.connection_task_mapping: Dict[str, str] = {}
+        # 发送中的连接，其后续消息进入积压队列 {connection_id}
+        self._sending: Set[str] = set()
+        # 积压的待发送消息 {connection_id: deque[(payload, 可丢弃)]}
+        self._pending_sends: Dict[str, Deque[Tuple[str, bool]]] = {}
         # 连接计数器
         self._connection_counter = 0
         # 锁保护并发操作
@@ -79,7 +135,7 @@ class WebSocketManager:
                 "type": "connection_established",
                 "connection_id": connection_id,
                 "task_id": task_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": now_iso(),
                 "message": "WebSocket connection established"
             })
             
@@ -106,8 +162,9 @@ class WebSocketManager:
                 # 清理元数据
                 del self.connection_metadata[connection_id]
                 
-                # 清理连接映射
+                # 清理连接映射和积压消息
                 self.connection_task_mapping.pop(connection_id, None)
+                self._pending_sends.pop(connection_id, None)
                 
                 logger.info(f"WebSocket disconnected: {connection_id} for task {task_id}")
     
@@ -125,22 +182,35 @@ class WebSocketManager:
         # 添加时间戳
         message_with_timestamp = {
             **message,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": now_iso()
         }
         
+        # 消息只序列化一次，所有连接复用同一份负载
+        await self.broadcast_payload_to_task(
+            task_id,
+            encode_message(message_with_timestamp),
+            sheddable=message.get("type") in SHEDDABLE_MESSAGE_TYPES
+        )
+    
+    async def broadcast_payload_to_task(self, task_id: str, payload: str, sheddable: bool = False):
+        """向指定任务的所有连接广播已序列化的消息
+        
+        Args:
+            task_id: 任务ID
+            payload: 已编码的JSON文本
+            sheddable: 连接积压已满时是否可丢弃该消息
+        """
         # 获取所有连接
-        connections = list(self.active_connections[task_id].items())
+        connections = list(self.active_connections.get(task_id, {}).items())
+        if not connections:
+            return
         
         # 并发发送给所有连接
-        send_tasks = []
-        for connection_id, websocket in connections:
-            send_tasks.append(
-                self._send_to_websocket(websocket, connection_id, message_with_timestamp)
-            )
-        
-        if send_tasks:
-            await asyncio.gather(*send_tasks, return_exceptions=True)
-            logger.info(f"Broadcasted message to {len(send_tasks)} connections for task {task_id}")
+        await asyncio.gather(
+            *(self._send_payload(websocket, connection_id, payload, sheddable) for connection_id, websocket in connections),
+            return_exceptions=True
+        )
+        logger.info(f"Broadcasted message to {len(connections)} connections for task {task_id}")
     
     async def send_to_connection(self, connection_id: str, message: Dict[str, Any]):
         """向指定连接发送消息
@@ -153,6 +223,10 @@ class WebSocketManager:
     
     async def _send_to_connection(self, connection_id: str, message: Dict[str, Any]):
         """内部方法：向指定连接发送消息"""
+        await self._send_payload_to_connection(connection_id, encode_message(message))
+    
+    async def _send_payload_to_connection(self, connection_id: str, payload: str):
+        """内部方法：向指定连接发送已序列化的消息"""
         if connection_id not in self.connection_metadata:
             logger.warning(f"Connection {connection_id} not found")
             return
@@ -162,7 +236,7 @@ class WebSocketManager:
         if (task_id in self.active_connections and 
             connection_id in self.active_connections[task_id]):
             websocket = self.active_connections[task_id][connection_id]
-            await self._send_to_websocket(websocket, connection_id, message)
+            await self._send_payload(websocket, connection_id, payload)
     
     async def _send_to_websocket(
         self, 
@@ -171,14 +245,74 @@ class WebSocketManager:
         message: Dict[str, Any]
     ):
         """内部方法：向WebSocket发送消息"""
+        await self._send_payload(websocket, connection_id, encode_message(message))
+    
+    async def _send_payload(
+        self,
+        websocket: WebSocket,
+        connection_id: str,
+        payload: str,
+        sheddable: bool = False
+    ):
+        """内部方法：向WebSocket发送已序列化的消息，发送失败时断开连接
+        
+        同一连接同时只有一个发送者：连接正在发送时，新消息进入有界积压队列并立即返回，
+        由当前发送者按序发出。积压已满时丢弃最早的可丢弃消息；
+        仍无法放入的重要消息说明客户端消费过慢，直接断开该连接。
+        """
+        if connection_id in self._sending:
+            await self._buffer_payload(websocket, connection_id, payload, sheddable)
+            return
+        
+        self._sending.add(connection_id)
         try:
-            await websocket.send_text(json.dumps(message, default=str))
+            await websocket.send_text(payload)
+            # 发出发送期间积压的消息
+            while True:
+                pending = self._pending_sends.get(connection_id)
+                if not pending:
+                    break
+                await websocket.send_text(pending.popleft()[0])
         except WebSocketDisconnect:
             logger.info(f"WebSocket {connection_id} disconnected during send")
             await self.disconnect(connection_id)
         except Exception as e:
             logger.error(f"Failed to send message to WebSocket {connection_id}: {e}")
             await self.disconnect(connection_id)
+        finally:
+            self._sending.discard(connection_id)
+            self._pending_sends.pop(connection_id, None)
+    
+    async def _buffer_payload(
+        self,
+        websocket: WebSocket,
+        connection_id: str,
+        payload: str,
+        sheddable: bool
+    ):
+        """内部方法：将消息放入连接的积压队列，积压已满时丢弃或断开慢连接"""
+        pending = self._pending_sends.setdefault(connection_id, deque())
+        if len(pending) < SEND_BUFFER_MAXSIZE:
+            pending.append((payload, sheddable))
+            return
+        
+        # 丢弃最早的一条可丢弃消息，为新消息腾出位置
+        for index, (_, entry_sheddable) in enumerate(pending):
+            if entry_sheddable:
+                del pending[index]
+                pending.append((payload, sheddable))
+                return
+        
+        if sheddable:
+            logger.debug(f"Send buffer full for WebSocket {connection_id}, dropped message")
+            return
+        
+        logger.warning(f"Send buffer full for WebSocket {connection_id}, disconnecting slow client")
+        await self.disconnect(connection_id)
+        try:
+            await websocket.close(code=1013, reason="Client too slow")
+        except Exception:
+            pass
     
     async def handle_ping(self, connection_id: str):
         """处理连接心跳
@@ -189,10 +323,7 @@ class WebSocketManager:
         if connection_id in self.connection_metadata:
             self.connection_metadata[connection_id]["last_ping"] = datetime.now(timezone.utc)
             
-            await self._send_to_connection(connection_id, {
-                "type": "pong",
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            })
+            await self._send_payload_to_connection(connection_id, PONG_TEMPLATE % now_iso())
     
     def get_task_connections(self, task_id: str) -> List[str]:
         """获取指定任务的所有连接ID
@@ -207,6 +338,10 @@ class WebSocketManager:
             return list(self.active_connections[task_id].keys())
         return []
     
+    def has_subscribers(self, task_id: str) -> bool:
+        """指定任务是否有订阅连接"""
+        return bool(self.active_connections.get(task_id))
+    
     def get_connection_count(self, task_id: str = None) -> int:
         """获取连接数量
         
@@ -279,7 +414,7 @@ class WebSocketManager:
             "total_connections": total_connections,
             "active_tasks": active_tasks,
             "task_connection_counts": task_connection_counts,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": now_iso()
         }
 
 
@@ -42,6 +42,12 @@ class NodeStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+# 节点终态集合（frozenset，成员判断为O(1)哈希查找）
+TERMINAL_NODE_STATUSES = frozenset({
+    NodeStatus.COMPLETED, NodeStatus.FAILED, NodeStatus.SKIPPED, NodeStatus.CANCELLED
+})
+
+
 class TaskDAG(Base):
     """任务DAG（有向无环图）"""
     __tablename__ = "task_dags"
@@ -164,16 +170,31 @@ class DAGNode(Base):
     def __repr__(self):
         return f"<DAGNode(id='{self.id}', node_id='{self.node_id}', node_type='{self.node_type}')>"
     
+    def get_config(self) -> Dict[str, Any]:
+        """获取节点配置。
+        解析结果按原始JSON字符串缓存，node_config被重新赋值后自动失效。
+        """
+        cached = getattr(self, "_config_cache", None)
+        if cached is None or cached[0] is not self.node_config:
+            cached = (self.node_config, json.loads(self.node_config))
+            self._config_cache = cached
+        return cached[1]
+    
     def get_dependencies(self) -> List[str]:
         """获取依赖节点ID列表。
         优先从depends_on读取；若为空则回退到dependencies。
         如果JSON无效，则抛出JSONDecodeError。
+        解析结果按原始JSON字符串缓存，依赖被重新设置后自动失效。
         """
         source = self.depends_on if self.depends_on not in (None, "") else self.dependencies
         if not source:
             return []
-        # 让json.loads抛出异常以便上层测试捕获
-        return json.loads(source)
+        cached = getattr(self, "_dependencies_cache", None)
+        if cached is None or cached[0] is not source:
+            # 让json.loads抛出异常以便上层测试捕获
+            cached = (source, json.loads(source))
+            self._dependencies_cache = cached
+        return cached[1]
     
     def set_dependencies(self, deps: List[str]):
         """设置依赖节点ID列表"""
@@ -227,7 +248,7 @@ class DAGNodeRun(Base):
     @property
     def is_terminal_state(self) -> bool:
         """是否为终态"""
-        return self.status in [NodeStatus.COMPLETED, NodeStatus.FAILED, NodeStatus.SKIPPED, NodeStatus.CANCELLED]
+        return self.status in TERMINAL_NODE_STATUSES
 
 
 class DAGEdge(Base):
@@ -24,6 +24,13 @@ class TaskStatus(str, Enum):
     TIMEOUT = "timeout"         # 超时
 
 
+# 终态和活跃状态集合（frozenset，成员判断为O(1)哈希查找）
+TERMINAL_TASK_STATUSES = frozenset({
+    TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED, TaskStatus.TIMEOUT
+})
+ACTIVE_TASK_STATUSES = frozenset({TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING})
+
+
 class TaskPriority(str, Enum):
     """任务优先级"""
     LOW = "low"
@@ -95,12 +102,12 @@ class GpuTask(Base):
     @property
     def is_terminal_state(self) -> bool:
         """检查是否为终态（不再变化的状态）"""
-        return self.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED, TaskStatus.TIMEOUT]
+        return self.status in TERMINAL_TASK_STATUSES
     
     @property
     def is_active(self) -> bool:
         """检查是否为活跃状态"""
-        return self.status in [TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.RUNNING]
+        return self.status in ACTIVE_TASK_STATUSES
 
 
 class TaskLog(Base):
@@ -211,6 +211,8 @@ class TaskStats(BaseModel):
 # Provider 相关 Schema
 class Provider(BaseModel):
     """云服务商Schema"""
+    model_config = {"frozen": True, "from_attributes": True}
+    
     id: str
     name: str
     display_name: str
@@ -220,6 +222,8 @@ class Provider(BaseModel):
 
 class GPUModel(BaseModel):
     """GPU型号Schema"""
+    model_config = {"frozen": True, "from_attributes": True}
+    
     id: str
     name: str
     provider: str
@@ -229,6 +233,11 @@ class GPUModel(BaseModel):
     availability: str = Field("medium", pattern="^(high|medium|low)$")
 
 
+class CompareRequest(BaseModel):
+    """实例成本比较请求Schema"""
+    instance_ids: List[str] = Field(default_factory=list, description="要比较的实例ID列表")
+
+
 class DockerImage(BaseModel):
     """Docker镜像Schema"""
     name: str
@@ -2,13 +2,13 @@ import json
 import logging
 import asyncio
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Type
 from celery import Task
 from celery.signals import task_prerun, task_postrun, task_failure
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 
-from app.core.celery_app import celery_app
+from app.core.celery_app import celery_app, BEST_EFFORT_QUEUE, BEST_EFFORT_UTILIZATION_THRESHOLD
 from app.core.database import get_async_session
 from app.core.mlflow_config import MLflowTaskTracker
 from app.core.task_status_broadcaster import task_broadcaster, broadcast_task_status, broadcast_task_progress, broadcast_task_logs, broadcast_task_error
@@ -22,16 +22,20 @@ from app.gpu.providers.alibaba import AlibabaCloudAdapter
 logger = logging.getLogger(__name__)
 
 
+# 提供商名称 -> 适配器类
+PROVIDER_ADAPTERS: Dict[str, Type[GpuProviderInterface]] = {
+    "runpod": RunPodAdapter,
+    "tencent": TencentCloudAdapter,
+    "alibaba": AlibabaCloudAdapter,
+}
+
+
 def get_provider_adapter(provider_name: str, config: Dict[str, Any]) -> GpuProviderInterface:
     """获取GPU提供商适配器"""
-    if provider_name == "runpod":
-        return RunPodAdapter(config)
-    elif provider_name == "tencent":
-        return TencentCloudAdapter(config)
-    elif provider_name == "alibaba":
-        return AlibabaCloudAdapter(config)
-    else:
+    adapter_class = PROVIDER_ADAPTERS.get(provider_name)
+    if adapter_class is None:
         raise ValueError(f"Unsupported provider: {provider_name}")
+    return adapter_class(config)
 
 
 async def update_task_status(
@@ -397,6 +401,8 @@ def execute_gpu_task(self, task_id: str, provider_config: Dict[str, Any]):
     try:
         return loop.run_until_complete(_execute_task())
     finally:
+        # 事件循环关闭前发出合并窗口内缓存的广播消息
+        loop.run_until_complete(task_broadcaster.flush_all())
         loop.close()
 
 
@@ -532,9 +538,39 @@ def check_running_tasks():
     try:
         loop.run_until_complete(_check_tasks())
     finally:
+        # 事件循环关闭前发出合并窗口内缓存的广播消息
+        loop.run_until_complete(task_broadcaster.flush_all())
         loop.close()
 
 
+@celery_app.task(name="app.tasks.gpu_tasks.dispatch_best_effort_tasks")
+def dispatch_best_effort_tasks():
+    """按worker负载开关best_effort队列的消费（定期任务）
+    
+    利用率低于阈值的worker开始消费best_effort队列，繁忙的worker停止消费，
+    使可延迟的作业只在集群空闲时执行。
+    """
+    inspect = celery_app.control.inspect()
+    stats = inspect.stats() or {}
+    active = inspect.active() or {}
+    active_queues = inspect.active_queues() or {}
+    
+    for worker_name, worker_stats in stats.items():
+        concurrency = worker_stats.get("pool", {}).get("max-concurrency") or 1
+        utilization = len(active.get(worker_name, [])) / concurrency
+        consuming = any(
+            queue.get("name") == BEST_EFFORT_QUEUE
+            for queue in active_queues.get(worker_name, [])
+        )
+        
+        if utilization < BEST_EFFORT_UTILIZATION_THRESHOLD and not consuming:
+            celery_app.control.add_consumer(BEST_EFFORT_QUEUE, destination=[worker_name])
+            logger.info(f"Worker {worker_name} utilization {utilization:.0%}, start consuming {BEST_EFFORT_QUEUE}")
+        elif utilization >= BEST_EFFORT_UTILIZATION_THRESHOLD and consuming:
+            celery_app.control.cancel_consumer(BEST_EFFORT_QUEUE, destination=[worker_name])
+            logger.info(f"Worker {worker_name} utilization {utilization:.0%}, stop consuming {BEST_EFFORT_QUEUE}")
+
+
 @celery_app.task(name="app.tasks.gpu_tasks.cleanup_expired_tasks")
 def cleanup_expired_tasks():
     """清理过期任务（定期任务）"""
@@ -560,6 +596,8 @@ def cleanup_expired_tasks():
     try:
         loop.run_until_complete(_cleanup_tasks())
     finally:
+        # 事件循环关闭前发出合并窗口内缓存的广播消息
+        loop.run_until_complete(task_broadcaster.flush_all())
         loop.close()
 
 
@@ -616,6 +654,8 @@ def cancel_gpu_task(self, task_id: str, provider_config: Dict[str, Any]):
     try:
         return loop.run_until_complete(_cancel_task())
     finally:
+        # 事件循环关闭前发出合并窗口内缓存的广播消息
+        loop.run_until_complete(task_broadcaster.flush_all())
         loop.close()
 
 
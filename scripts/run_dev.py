@@ -10,5 +10,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
+        ws_per_message_deflate=settings.websocket_per_message_deflate,
         log_level="info" if not settings.debug else "debug"
     )
@@ -1,5 +1,4 @@
 import pytest
-import asyncio
 import json
 import uuid
 from unittest.mock import Mock, patch, AsyncMock
@@ -387,7 +386,14 @@ class TestDAGNodeExecutor:
         data = "${node_output.nonexistent.status}"
         result = node_executor._substitute_variables(data, sample_context)
         assert result == ""  # 不存在的变量应返回空字符串
-    
+
+    def test_substitute_variables_nested_keeps_template(self, node_executor, sample_context):
+        """测试嵌套结构的变量替换不会修改原始模板"""
+        template = {"body": {"items": ["${node_output.upstream_node.status}", 1]}}
+        result = node_executor._substitute_variables(template, sample_context)
+        assert result == {"body": {"items": ["success", 1]}}
+        assert template == {"body": {"items": ["${node_output.upstream_node.status}", 1]}}
+
     @pytest.mark.asyncio
     async def test_update_node_run_status(self, node_executor, mock_session):
         """测试更新节点运行状态"""
@@ -655,8 +661,7 @@ class TestDAGIntegration:
         assert ready_nodes == ["end"]
 
 
-@pytest.mark.asyncio
-async def test_celery_dag_execution_task():
+def test_celery_dag_execution_task():
     """测试Celery DAG执行任务"""
     with patch('app.core.database.get_async_session') as mock_get_session:
         with patch('app.core.dag_engine.DAGEngine.execute_dag') as mock_execute:
@@ -670,9 +675,6 @@ async def test_celery_dag_execution_task():
             # 执行任务
             result = execute_dag_task("dag_run_123")
             
-            # 让事件循环有机会调度任务
-            await asyncio.sleep(0)
-            
             # 验证执行
             assert result is True
             mock_execute.assert_called_once_with(mock_session, "dag_run_123")
@@ -0,0 +1,139 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import mlflow
+import pytest
+
+from app.core.config import settings
+from app.core.mlflow_config import (
+    LOG_TRUNCATED_MARKER,
+    MLFLOW_WORKER_MAX_RETRIES,
+    MLflowManager,
+    _AsyncMlflowWorker,
+    _read_log_tail
+)
+
+
+class HttpStatusError(Exception):
+    """模拟带HTTP状态码的MLflow异常"""
+    
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+    
+    def get_http_status_code(self) -> int:
+        return self.status
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """创建使用临时文件存储、后台线程写入的MLflow管理器"""
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    monkeypatch.delenv("TESTING", raising=False)
+    monkeypatch.setattr(settings, "mlflow_artifact_location", str(tmp_path / "artifacts"))
+    previous_uri = mlflow.get_tracking_uri()
+    
+    manager = MLflowManager(tracking_uri=(tmp_path / "mlruns").as_uri(), experiment_name="test-experiment")
+    yield manager
+    
+    if mlflow.active_run() is not None:
+        mlflow.end_run()
+    mlflow.set_tracking_uri(previous_uri)
+
+
+class TestMLflowManager:
+    """MLflow管理器测试"""
+    
+    def test_log_bundle_single_log_batch(self, manager):
+        """测试参数、指标和标签合并为一次log_batch请求"""
+        run = manager.start_run(run_name="batch")
+        
+        with patch.object(manager.client, "log_batch", wraps=manager.client.log_batch) as log_batch:
+            manager.log_bundle(
+                params={"gpu_model": "A100"},
+                metrics={"cost": 1.5, "duration_seconds": 60},
+                tags={"provider": "runpod"},
+                texts={"notes.txt": "hello"}
+            )
+            assert manager.flush()
+        
+        log_batch.assert_called_once()
+        data = manager.client.get_run(run.info.run_id).data
+        assert data.params == {"gpu_model": "A100"}
+        assert data.metrics == {"cost": 1.5, "duration_seconds": 60.0}
+        assert data.tags["provider"] == "runpod"
+        assert [artifact.path for artifact in manager.client.list_artifacts(run.info.run_id)] == ["notes.txt"]
+        manager.end_run()
+    
+    def test_end_run_flushes_queued_operations(self, manager):
+        """测试结束运行前等待后台线程写完已提交的记录"""
+        run = manager.start_run(run_name="flush")
+        
+        # 先排入一个耗时操作，使后续记录在end_run时仍在队列中
+        manager._submit(time.sleep, 0.2)
+        manager.log_metrics({"cost": 2.0})
+        manager.end_run()
+        
+        finished_run = manager.client.get_run(run.info.run_id)
+        assert finished_run.data.metrics == {"cost": 2.0}
+        assert finished_run.info.status == "FINISHED"
+        assert manager.active_run_id is None
+
+
+class TestAsyncMlflowWorker:
+    """后台写入线程测试"""
+    
+    def test_retries_transient_errors(self, monkeypatch):
+        """测试网络错误和服务端5xx/429错误会重试"""
+        monkeypatch.setattr("app.core.mlflow_config.MLFLOW_WORKER_RETRY_BACKOFF_SECONDS", 0)
+        
+        op = MagicMock(side_effect=[ConnectionError("reset"), HttpStatusError(429), None])
+        _AsyncMlflowWorker._execute(op, ("run-id",), {})
+        assert op.call_count == 3
+        
+        # 一直失败时最多重试MLFLOW_WORKER_MAX_RETRIES次
+        op = MagicMock(side_effect=HttpStatusError(503))
+        _AsyncMlflowWorker._execute(op, (), {})
+        assert op.call_count == MLFLOW_WORKER_MAX_RETRIES + 1
+    
+    def test_does_not_retry_permanent_errors(self, monkeypatch):
+        """测试客户端错误和其他异常不重试"""
+        monkeypatch.setattr("app.core.mlflow_config.MLFLOW_WORKER_RETRY_BACKOFF_SECONDS", 0)
+        
+        for error in (HttpStatusError(400), ValueError("invalid metric")):
+            op = MagicMock(side_effect=error)
+            _AsyncMlflowWorker._execute(op, (), {})
+            assert op.call_count == 1
+    
+    def test_flush_waits_for_submitted_operations(self):
+        """测试flush等待此前提交的操作执行完毕"""
+        worker = _AsyncMlflowWorker()
+        results = []
+        
+        worker.submit(time.sleep, 0.05)
+        worker.submit(results.append, "done")
+        assert worker.flush(timeout=5)
+        assert results == ["done"]
+
+
+class TestReadLogTail:
+    """任务日志截取测试"""
+    
+    def test_str_logs(self):
+        """测试字符串日志按字符截取"""
+        assert _read_log_tail("short log", 100) == "short log"
+        assert _read_log_tail("任务日志" * 10, 4) == "任务日志" + LOG_TRUNCATED_MARKER
+    
+    def test_bytes_logs(self):
+        """测试字节日志按字节截取，被切开的多字节字符以替换符显示"""
+        assert _read_log_tail(b"short log", 100) == "short log"
+        assert _read_log_tail(bytearray(b"0123456789"), 4) == "6789" + LOG_TRUNCATED_MARKER
+        assert _read_log_tail("日志".encode("utf-8"), 4) == "�志" + LOG_TRUNCATED_MARKER
+    
+    def test_path_logs(self, tmp_path):
+        """测试日志文件只读取末尾部分"""
+        log_file = tmp_path / "task.log"
+        log_file.write_bytes(b"line 1\nline 2\nline 3\n")
+        
+        assert _read_log_tail(log_file, 100) == "line 1\nline 2\nline 3\n"
+        assert _read_log_tail(log_file, 7) == "line 3\n" + LOG_TRUNCATED_MARKER
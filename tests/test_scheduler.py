@@ -126,19 +126,17 @@ class TestIntelligentScheduler:
         assert "test_provider" in scheduler.provider_metrics
         assert scheduler.provider_metrics["test_provider"].availability_score == 0.85
     
-    @pytest.mark.asyncio
-    async def test_estimate_task_duration(self, scheduler, sample_task_requirement):
+    def test_estimate_task_duration(self, scheduler, sample_task_requirement):
         """测试任务持续时间估算"""
-        duration = await scheduler.estimate_task_duration(sample_task_requirement)
+        duration = scheduler.estimate_task_duration(sample_task_requirement)
         
         # 应该基于GPU类型和数量调整
         assert duration > 0
         assert isinstance(duration, (int, float))
     
-    @pytest.mark.asyncio
-    async def test_calculate_provider_score_cost_strategy(self, scheduler, sample_task_requirement):
+    def test_calculate_provider_score_cost_strategy(self, scheduler, sample_task_requirement):
         """测试成本策略下的Provider评分"""
-        score = await scheduler.calculate_provider_score(
+        score = scheduler.calculate_provider_score(
             "runpod", 
             sample_task_requirement, 
             "cost"
@@ -147,10 +145,9 @@ class TestIntelligentScheduler:
         assert 0 <= score <= 1
         assert isinstance(score, float)
     
-    @pytest.mark.asyncio
-    async def test_calculate_provider_score_performance_strategy(self, scheduler, sample_task_requirement):
+    def test_calculate_provider_score_performance_strategy(self, scheduler, sample_task_requirement):
         """测试性能策略下的Provider评分"""
-        score = await scheduler.calculate_provider_score(
+        score = scheduler.calculate_provider_score(
             "runpod", 
             sample_task_requirement, 
             "performance"
@@ -159,10 +156,9 @@ class TestIntelligentScheduler:
         assert 0 <= score <= 1
         assert isinstance(score, float)
     
-    @pytest.mark.asyncio
-    async def test_calculate_provider_score_availability_strategy(self, scheduler, sample_task_requirement):
+    def test_calculate_provider_score_availability_strategy(self, scheduler, sample_task_requirement):
         """测试可用性策略下的Provider评分"""
-        score = await scheduler.calculate_provider_score(
+        score = scheduler.calculate_provider_score(
             "runpod", 
             sample_task_requirement, 
             "availability"
@@ -171,10 +167,9 @@ class TestIntelligentScheduler:
         assert 0 <= score <= 1
         assert isinstance(score, float)
     
-    @pytest.mark.asyncio
-    async def test_calculate_provider_score_balanced_strategy(self, scheduler, sample_task_requirement):
+    def test_calculate_provider_score_balanced_strategy(self, scheduler, sample_task_requirement):
         """测试均衡策略下的Provider评分"""
-        score = await scheduler.calculate_provider_score(
+        score = scheduler.calculate_provider_score(
             "runpod", 
             sample_task_requirement, 
             "balanced"
@@ -183,10 +178,9 @@ class TestIntelligentScheduler:
         assert 0 <= score <= 1
         assert isinstance(score, float)
     
-    @pytest.mark.asyncio
-    async def test_calculate_provider_score_invalid_provider(self, scheduler, sample_task_requirement):
+    def test_calculate_provider_score_invalid_provider(self, scheduler, sample_task_requirement):
         """测试无效Provider的评分"""
-        score = await scheduler.calculate_provider_score(
+        score = scheduler.calculate_provider_score(
             "invalid_provider", 
             sample_task_requirement, 
             "cost"
@@ -194,6 +188,70 @@ class TestIntelligentScheduler:
         
         assert score == 0.0
     
+    def test_calculate_all_scores(self, scheduler):
+        """测试批量评分与单个Provider评分一致"""
+        task_req = TaskRequirement(gpu_type="RTX4090")
+        scores = scheduler.calculate_all_scores(task_req, "performance")
+        
+        # 只有runpod支持RTX4090
+        assert list(scores) == ["runpod"]
+        assert scores["runpod"] == scheduler.calculate_provider_score("runpod", task_req, "performance")
+    
+    @pytest.mark.asyncio
+    async def test_recommend_provider(self, scheduler, sample_task_requirement):
+        """测试推荐结果与最优Provider选择一致"""
+        recommendation = scheduler.recommend_provider(sample_task_requirement, "cost")
+        provider, routing_key = await scheduler.select_optimal_provider(sample_task_requirement, "cost")
+        
+        assert recommendation.provider == provider
+        assert recommendation.routing_key == routing_key
+        assert recommendation.score == scheduler.calculate_provider_score(provider, sample_task_requirement, "cost")
+        
+        # 不支持的GPU类型没有推荐
+        assert scheduler.recommend_provider(TaskRequirement(gpu_type="H100"), "cost") is None
+    
+    @pytest.mark.asyncio
+    async def test_select_optimal_provider_after_metrics_update(self, scheduler):
+        """测试更新Provider指标后重新选择最优Provider"""
+        task_req = TaskRequirement(gpu_type="A100")
+        provider, _ = await scheduler.select_optimal_provider(task_req, "cost")
+        assert provider is not None
+        
+        # 新增一个成本极低的Provider，缓存的选择结果应失效
+        scheduler.update_provider_metrics("cheap_provider", ProviderMetrics(
+            provider_name="cheap_provider",
+            avg_cost_per_hour=0.1,
+            availability_score=0.99,
+            success_rate=0.99,
+            current_load=0.0,
+            supported_gpu_types=["A100"]
+        ))
+        provider, routing_key = await scheduler.select_optimal_provider(task_req, "cost")
+        assert provider == "cheap_provider"
+        assert routing_key.startswith("cheap_provider_")
+    
+    @pytest.mark.asyncio
+    async def test_select_optimal_provider_after_in_place_metrics_change(self, scheduler):
+        """测试直接修改Provider指标后缓存的评分失效"""
+        task_req = TaskRequirement(gpu_type="A100")
+        cached_scores = scheduler.calculate_all_scores(task_req, "availability")
+        provider, _ = await scheduler.select_optimal_provider(task_req, "availability")
+        assert provider == "runpod"
+        
+        metrics = scheduler.provider_metrics["runpod"]
+        metrics.availability_score = 0.1
+        metrics.current_load = 0.99
+        
+        scores = scheduler.calculate_all_scores(task_req, "availability")
+        assert scores["runpod"] < cached_scores["runpod"]
+        assert scores["runpod"] == scheduler.calculate_provider_score("runpod", task_req, "availability")
+        provider, _ = await scheduler.select_optimal_provider(task_req, "availability")
+        assert provider == "tencent"
+        
+        # 直接修改支持的GPU类型后，反向索引同样重建
+        metrics.supported_gpu_types = frozenset({"A100", "H100"})
+        assert list(scheduler.calculate_all_scores(TaskRequirement(gpu_type="H100"), "availability")) == ["runpod"]
+    
     @pytest.mark.asyncio
     async def test_select_optimal_provider_cost_strategy(self, scheduler, sample_task_requirement):
         """测试成本策略选择最优Provider"""
@@ -262,6 +320,9 @@ class TestIntelligentScheduler:
         assert "runpod" in all_metrics
         assert "tencent" in all_metrics
         assert "alibaba" in all_metrics
+        # 支持的GPU类型按注册顺序输出
+        assert all_metrics["runpod"]["supported_gpu_types"] == ["A100", "RTX4090", "A6000", "T4"]
+        assert all_metrics["tencent"]["supported_gpu_types"] == ["T4", "V100", "A100"]
     
     def test_get_routing_key(self, scheduler):
         """测试生成路由键"""
@@ -270,15 +331,14 @@ class TestIntelligentScheduler:
         assert routing_key == "runpod_A100_2"
         assert isinstance(routing_key, str)
     
-    @pytest.mark.asyncio
-    async def test_provider_supports_gpu_type(self, scheduler):
+    def test_provider_supports_gpu_type(self, scheduler):
         """测试Provider GPU类型支持检查"""
         # runpod支持A100
-        supports = await scheduler._provider_supports_gpu_type("runpod", "A100")
+        supports = scheduler._provider_supports_gpu_type("runpod", "A100")
         assert supports is True
         
         # 测试不存在的Provider
-        supports = await scheduler._provider_supports_gpu_type("nonexistent", "A100")
+        supports = scheduler._provider_supports_gpu_type("nonexistent", "A100")
         assert supports is False
     
     @pytest.mark.asyncio
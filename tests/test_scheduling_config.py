@@ -3,10 +3,11 @@ import json
 from datetime import datetime, timezone
 from unittest.mock import patch
 
-from app.core.scheduling_config import (
+from app.core.scheduling import (
     SchedulingStrategy, ProviderPriority, GPUTypeMapping, SchedulingRule,
     CostOptimizationConfig, PerformanceConfig, AvailabilityConfig,
-    SchedulingPolicy, SchedulingConfigManager, get_scheduling_config_manager
+    SchedulingPolicy, SchedulingConfigManager, get_scheduling_config_manager,
+    compile_conditions
 )
 
 
@@ -149,6 +150,8 @@ class TestSchedulingModels:
         assert policy.cost_weight == 0.3
         assert policy.performance_weight == 0.4
         assert policy.availability_weight == 0.3
+        assert policy.weights == (0.3, 0.4, 0.3)
+        assert policy.weighted_score(1.0, 0.5, 0.0) == pytest.approx(0.5)
         assert policy.is_active is True
         assert policy.is_default is False
 
@@ -194,6 +197,15 @@ class TestSchedulingConfigManager:
         assert default_policy.is_default is True
         assert default_policy.policy_id == "cost_optimized"
     
+    def test_default_policies_loaded_on_first_access(self):
+        """测试默认策略在首次访问时才加载"""
+        manager = SchedulingConfigManager()
+        assert manager._initialized is False
+        
+        assert manager.get_policy("balanced") is not None
+        assert manager._initialized is True
+        assert len(manager.list_policies()) == 4
+    
     def test_list_policies(self, config_manager):
         """测试列出所有策略"""
         policies = config_manager.list_policies()
@@ -328,6 +340,25 @@ class TestSchedulingConfigManager:
         none_policy = config_manager.get_provider_priority("nonexistent", "alibaba")
         assert none_policy is None
     
+    def test_get_provider_priority_after_priorities_change(self, config_manager):
+        """测试提供商优先级列表增加或替换后仍能查到"""
+        policy = config_manager.get_policy("cost_optimized")
+        assert policy.get_provider_priority("extra") is None
+        
+        policy.provider_priorities.append(ProviderPriority(provider_name="extra", priority=3))
+        assert config_manager.get_provider_priority("cost_optimized", "extra").priority == 3
+        
+        policy.provider_priorities = [ProviderPriority(provider_name="alibaba", priority=1)]
+        assert config_manager.get_provider_priority("cost_optimized", "alibaba").priority == 1
+        assert config_manager.get_provider_priority("cost_optimized", "extra") is None
+        
+        # 原地替换元素或修改名称后同样重建索引
+        policy.provider_priorities[0] = ProviderPriority(provider_name="tencent", priority=2)
+        assert config_manager.get_provider_priority("cost_optimized", "tencent").priority == 2
+        policy.provider_priorities[0].provider_name = "runpod"
+        assert config_manager.get_provider_priority("cost_optimized", "runpod").priority == 2
+        assert config_manager.get_provider_priority("cost_optimized", "tencent") is None
+    
     def test_evaluate_scheduling_rules_basic(self, config_manager):
         """测试基本规则评估"""
         # 添加测试规则到策略
@@ -370,7 +401,7 @@ class TestSchedulingConfigManager:
         context = {"priority": 5}
         
         # 模拟工作时间
-        with patch('app.core.scheduling_config.datetime') as mock_datetime:
+        with patch('app.core.scheduling.datetime') as mock_datetime:
             mock_now = datetime(2024, 1, 15, 10, 0, 0, tzinfo=timezone.utc)  # 周一上午10点
             mock_datetime.now.return_value = mock_now
             mock_datetime.timezone = timezone
@@ -381,7 +412,7 @@ class TestSchedulingConfigManager:
             assert "work_hours_rule" in rule_ids
         
         # 模拟非工作时间
-        with patch('app.core.scheduling_config.datetime') as mock_datetime:
+        with patch('app.core.scheduling.datetime') as mock_datetime:
             mock_now = datetime(2024, 1, 13, 22, 0, 0, tzinfo=timezone.utc)  # 周六晚上10点
             mock_datetime.now.return_value = mock_now
             mock_datetime.timezone = timezone
@@ -435,6 +466,77 @@ class TestSchedulingConfigManager:
         )
         assert result is False
     
+    def test_evaluate_conditions_reuses_compiled_predicate(self, config_manager):
+        """测试相同条件复用编译结果，条件内容变化后重新编译"""
+        conditions = {"priority": {"gte": 5}, "gpu_type": "A100"}
+        context = {"priority": 7, "gpu_type": "A100"}
+        
+        assert config_manager._evaluate_conditions(conditions, context) is True
+        assert config_manager._evaluate_conditions(dict(conditions), context) is True
+        assert len(config_manager._condition_predicates) == 1
+        
+        conditions["gpu_type"] = "T4"
+        assert config_manager._evaluate_conditions(conditions, context) is False
+        assert len(config_manager._condition_predicates) == 2
+    
+    def test_condition_reorder_does_not_mutate_iterated_checks(self, monkeypatch):
+        """测试评估过程中触发重新排列时，正在进行的评估仍检查全部条件"""
+        monkeypatch.setattr("app.core.scheduling.CONDITION_REORDER_INTERVAL", 1)
+        predicate = compile_conditions({"a": 1, "b": 1})
+        
+        class NestedContext(dict):
+            """读取条件a时插入一次会被条件b拒绝的评估，从而触发重新排列"""
+            triggered = False
+            
+            def get(self, key, default=None):
+                if key == "a" and not self.triggered:
+                    self.triggered = True
+                    assert predicate({"a": 1, "b": 0}) is False
+                return super().get(key, default)
+        
+        assert predicate(NestedContext(a=1, b=0)) is False
+        assert predicate({"a": 1, "b": 1}) is True
+    
+    def test_rule_matches_recompiles_replaced_conditions(self):
+        """测试规则条件编译后替换conditions会重新编译"""
+        rule = SchedulingRule(
+            rule_id="compiled_rule",
+            name="Compiled Rule",
+            conditions={"priority": {"gte": 5, "lt": 9}},
+            action="prioritize"
+        )
+        
+        assert rule.matches({"priority": 5}) is True
+        assert rule.matches({"priority": 9}) is False
+        assert rule.matches({}) is False
+        
+        rule.conditions = {"gpu_type": "A100"}
+        assert rule.matches({"gpu_type": "A100", "priority": 1}) is True
+        assert "_predicate" not in rule.model_dump()
+        
+        # 原地修改条件后同样重新编译
+        rule.conditions["gpu_type"] = "T4"
+        assert rule.matches({"gpu_type": "A100"}) is False
+        assert rule.matches({"gpu_type": "T4"}) is True
+    
+    def test_rule_active_time_masks_follow_in_place_changes(self):
+        """测试原地修改生效时间/日期后重新计算位掩码"""
+        rule = SchedulingRule(
+            rule_id="timed_rule",
+            name="Timed Rule",
+            action="prioritize",
+            active_hours=[9, 10],
+            active_days=[1]
+        )
+        
+        assert rule.is_active_at(1 << 9, 1 << 1) is True
+        assert rule.is_active_at(1 << 11, 1 << 1) is False
+        
+        rule.active_hours.append(11)
+        rule.active_days[0] = 2
+        assert rule.is_active_at(1 << 11, 1 << 2) is True
+        assert rule.is_active_at(1 << 11, 1 << 1) is False
+
     def test_export_policy(self, config_manager):
         """测试导出策略"""
         policy_json = config_manager.export_policy("cost_optimized")
@@ -475,6 +577,15 @@ class TestSchedulingConfigManager:
         result = config_manager.import_policy("invalid json")
         assert result is False
     
+    def test_import_compact_exported_policy(self, config_manager):
+        """测试导入紧凑格式（bytes）的导出策略"""
+        exported_json = config_manager.export_policy("performance_optimized", indent=None)
+        assert "\n" not in exported_json
+        
+        assert config_manager.delete_policy("performance_optimized") is True
+        assert config_manager.import_policy(exported_json.encode()) is True
+        assert config_manager.export_policy("performance_optimized", indent=None) == exported_json
+    
     def test_import_invalid_policy_structure(self, config_manager):
         """测试导入无效策略结构"""
         invalid_policy = json.dumps({"invalid": "structure"})
@@ -570,7 +681,7 @@ class TestConfigManagerSingleton:
     
     def test_global_config_manager_consistency(self):
         """测试全局配置管理器一致性"""
-        from app.core.scheduling_config import scheduling_config_manager
+        from app.core.scheduling import scheduling_config_manager
         
         manager1 = get_scheduling_config_manager()
         
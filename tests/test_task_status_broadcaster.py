@@ -22,6 +22,7 @@ def mock_ws_manager():
     mock_manager = AsyncMock()
     mock_manager.broadcast_to_task = AsyncMock()
     mock_manager.get_connection_count = MagicMock(return_value=2)
+    mock_manager.has_subscribers = MagicMock(return_value=True)
     return mock_manager
 
 
@@ -58,6 +59,7 @@ class TestTaskStatusBroadcaster:
         # 验证消息内容
         message_data = call_args[0][1]
         assert message_data["type"] == MessageType.TASK_STATUS_UPDATE
+        assert type(message_data["type"]) is str
         assert message_data["task_id"] == task_id
         assert message_data["status"] == status.value
         assert message_data["message"] == message
@@ -222,8 +224,11 @@ class TestTaskStatusBroadcaster:
         
         await broadcaster.send_heartbeat(task_id)
         
-        call_args = mock_ws_manager.broadcast_to_task.call_args
-        message_data = call_args[0][1]
+        # 心跳按模板直接生成消息文本，作为可丢弃消息广播
+        call_args = mock_ws_manager.broadcast_payload_to_task.call_args
+        assert call_args[0][0] == task_id
+        assert call_args[1]["sheddable"] is True
+        message_data = json.loads(call_args[0][1])
         
         assert message_data["type"] == MessageType.HEARTBEAT
         assert message_data["task_id"] == task_id
@@ -267,6 +272,84 @@ class TestTaskStatusBroadcaster:
         mock_ws_manager.get_connection_count.return_value = 0
         assert broadcaster.has_active_connections(task_id) == False
     
+    async def test_coalesce_progress_and_logs(self, mock_ws_manager):
+        """测试合并窗口内的进度只发送最新一条、日志拼接为一条"""
+        broadcaster = TaskStatusBroadcaster(write_delay=0.01)
+        broadcaster.ws_manager = mock_ws_manager
+        task_id = "test-task-123"
+        
+        await broadcaster.broadcast_progress_update(task_id, 10.0)
+        await broadcaster.broadcast_progress_update(task_id, 20.0)
+        await broadcaster.broadcast_logs(task_id, "line 1")
+        await broadcaster.broadcast_logs(task_id, "line 2")
+        mock_ws_manager.broadcast_to_task.assert_not_called()
+        
+        await asyncio.sleep(0.05)
+        
+        sent = [call[0][1] for call in mock_ws_manager.broadcast_to_task.call_args_list]
+        assert len(sent) == 2
+        assert sent[0]["type"] == MessageType.TASK_LOGS
+        assert sent[0]["logs"] == "line 1\nline 2"
+        assert sent[1]["type"] == MessageType.TASK_PROGRESS
+        assert sent[1]["progress"] == 20.0
+    
+    async def test_coalesced_messages_sent_before_completion(self, mock_ws_manager):
+        """测试完成消息发送前先发出已缓存的进度"""
+        broadcaster = TaskStatusBroadcaster(write_delay=10.0)
+        broadcaster.ws_manager = mock_ws_manager
+        task_id = "test-task-123"
+        
+        await broadcaster.broadcast_progress_update(task_id, 99.0)
+        await broadcaster.broadcast_task_completed(task_id, True)
+        
+        sent = [call[0][1] for call in mock_ws_manager.broadcast_to_task.call_args_list]
+        assert [message["type"] for message in sent] == [MessageType.TASK_PROGRESS, MessageType.TASK_COMPLETED]
+        broadcaster._flush_tasks[task_id].cancel()
+    
+    async def test_duplicate_progress_and_status_suppressed(self, broadcaster, mock_ws_manager):
+        """测试连续重复的进度和状态消息不再广播"""
+        task_id = "test-task-123"
+        
+        await broadcaster.broadcast_progress_update(task_id, 50.0)
+        await broadcaster.broadcast_progress_update(task_id, 50.0)
+        await broadcaster.broadcast_status_update(task_id, TaskStatus.RUNNING)
+        await broadcaster.broadcast_status_update(task_id, TaskStatus.RUNNING)
+        await broadcaster.broadcast_progress_update(task_id, 50.0)
+        assert mock_ws_manager.broadcast_to_task.call_count == 3
+        
+        # 任务结束后清理去重记录
+        await broadcaster.broadcast_task_completed(task_id, True)
+        assert task_id not in broadcaster._last_emitted
+    
+    async def test_dedupe_records_bounded(self, broadcaster, mock_ws_manager, monkeypatch):
+        """测试去重记录在任务无订阅者时清理，且数量有上限"""
+        monkeypatch.setattr("app.core.task_status_broadcaster.MAX_DEDUP_TASKS", 2)
+        
+        for task_id in ("task-1", "task-2", "task-3"):
+            await broadcaster.broadcast_progress_update(task_id, 50.0)
+        assert list(broadcaster._last_emitted) == ["task-2", "task-3"]
+        
+        # 订阅者全部断开后清理记录，重新订阅后相同进度会再次发送
+        mock_ws_manager.has_subscribers.return_value = False
+        await broadcaster.broadcast_progress_update("task-3", 50.0)
+        assert "task-3" not in broadcaster._last_emitted
+        
+        mock_ws_manager.has_subscribers.return_value = True
+        await broadcaster.broadcast_progress_update("task-3", 50.0)
+        assert mock_ws_manager.broadcast_to_task.call_count == 4
+    
+    async def test_no_subscribers_skips_broadcast(self, broadcaster, mock_ws_manager):
+        """测试任务没有订阅连接时不广播"""
+        task_id = "test-task-123"
+        mock_ws_manager.has_subscribers.return_value = False
+        
+        await broadcaster.broadcast_status_update(task_id, TaskStatus.RUNNING)
+        await broadcaster.broadcast_progress_update(task_id, 50.0)
+        await broadcaster.send_heartbeat(task_id)
+        
+        mock_ws_manager.broadcast_to_task.assert_not_called()
+        mock_ws_manager.broadcast_payload_to_task.assert_not_called()
+    
     async def test_broadcast_error_handling(self, broadcaster):
         """测试广播错误处理"""
         task_id = "test-task-123"
@@ -274,6 +357,7 @@ class TestTaskStatusBroadcaster:
         # 模拟WebSocket管理器抛出异常
         mock_manager = AsyncMock()
         mock_manager.broadcast_to_task.side_effect = Exception("WebSocket error")
+        mock_manager.has_subscribers = MagicMock(return_value=True)
         broadcaster.ws_manager = mock_manager
         
         # 广播不应该抛出异常
@@ -283,6 +367,38 @@ class TestTaskStatusBroadcaster:
         mock_manager.broadcast_to_task.assert_called_once()
 
 
+def test_coalescing_across_event_loops(mock_ws_manager):
+    """测试每个Celery任务使用新事件循环时，合并的消息在循环关闭前发出、新循环上能重新安排发送"""
+    broadcaster = TaskStatusBroadcaster(write_delay=0.01)
+    broadcaster.ws_manager = mock_ws_manager
+    task_id = "test-task-123"
+    
+    # 第一个事件循环关闭前未发出缓存：下一个事件循环仍能安排发送
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(broadcaster.broadcast_progress_update(task_id, 10.0))
+    loop.close()
+    
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(broadcaster.broadcast_progress_update(task_id, 20.0))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    loop.close()
+    
+    sent = [call[0][1] for call in mock_ws_manager.broadcast_to_task.call_args_list]
+    assert [message["progress"] for message in sent] == [20.0]
+    assert task_id not in broadcaster._flush_tasks
+    
+    # 关闭事件循环前调用flush_all，缓存的消息立即发出
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(broadcaster.broadcast_progress_update(task_id, 30.0))
+    loop.run_until_complete(broadcaster.flush_all())
+    loop.close()
+    
+    sent = [call[0][1] for call in mock_ws_manager.broadcast_to_task.call_args_list]
+    assert [message["progress"] for message in sent] == [20.0, 30.0]
+    assert not broadcaster._flush_tasks
+    assert not broadcaster._pending_progress
+
+
 @pytest.mark.asyncio
 class TestConvenienceFunctions:
     """便捷函数测试"""
@@ -320,6 +436,22 @@ class TestConvenienceFunctions:
             task_id, progress, message, {"step": "data_processing"}
         )
     
+    @patch('app.core.task_status_broadcaster.task_broadcaster')
+    async def test_broadcast_task_progress_step_info(self, mock_broadcaster):
+        """测试便捷函数：step_info直接传递，未传时为None"""
+        task_id = "test-task-123"
+        step_info = {"step": "monitoring"}
+        
+        await broadcast_task_progress(task_id=task_id, progress=40, message="Monitoring", step_info=step_info)
+        await broadcast_task_progress(task_id, 50)
+        
+        assert mock_broadcaster.broadcast_progress_update.call_args_list[0][0] == (
+            task_id, 40, "Monitoring", step_info
+        )
+        assert mock_broadcaster.broadcast_progress_update.call_args_list[1][0] == (
+            task_id, 50, None, None
+        )
+    
     @patch('app.core.task_status_broadcaster.task_broadcaster')
     async def test_broadcast_task_logs(self, mock_broadcaster):
         """测试便捷函数：广播任务日志"""
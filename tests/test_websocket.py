@@ -0,0 +1,219 @@
+import asyncio
+import pytest
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.task_status_broadcaster import TaskStatusBroadcaster
+from app.core.websocket import ConnectionManager, handle_client_message
+from app.models.task import TaskStatus
+from app.models.user import UserRole
+
+
+class MockWebSocket:
+    """模拟WebSocket连接"""
+    
+    def __init__(self):
+        self.accepted = False
+        self.sent_messages = []
+    
+    async def accept(self):
+        self.accepted = True
+    
+    async def send_text(self, text: str):
+        self.sent_messages.append(text)
+
+
+def make_user(role: UserRole = UserRole.USER):
+    """创建测试用户"""
+    return SimpleNamespace(id=uuid.uuid4(), role=role, nickname="tester", email="tester@example.com")
+
+
+def make_session(tasks: dict):
+    """创建按任务ID返回任务的模拟数据库会话"""
+    session = AsyncMock()
+    session.get = AsyncMock(side_effect=lambda model, task_id: tasks.get(task_id))
+    return session
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """创建连接管理器，并替换handle_client_message使用的全局实例"""
+    manager = ConnectionManager()
+    monkeypatch.setattr("app.core.websocket.manager", manager)
+    return manager
+
+
+@pytest.mark.asyncio
+class TestTaskSubscriptions:
+    """任务订阅索引测试"""
+    
+    async def test_subscribe_and_broadcast_to_task(self, manager):
+        """测试只有订阅该任务的连接收到任务消息"""
+        subscriber, other = MockWebSocket(), MockWebSocket()
+        subscriber_id = await manager.connect(subscriber, make_user())
+        await manager.connect(other, make_user())
+        
+        assert manager.subscribe_task(subscriber_id, "task-1") is True
+        assert manager.subscribe_task("unknown-connection", "task-1") is False
+        assert manager.has_task_subscribers("task-1")
+        
+        await manager.broadcast_to_task("task-1", {"type": "task_progress", "progress": 50})
+        
+        assert json.loads(subscriber.sent_messages[-1]) == {"type": "task_progress", "progress": 50}
+        assert other.sent_messages == []
+        assert manager.get_connection_stats()["subscribed_tasks"] == 1
+    
+    async def test_unsubscribe_task(self, manager):
+        """测试取消订阅后清理索引"""
+        websocket = MockWebSocket()
+        connection_id = await manager.connect(websocket, make_user())
+        manager.subscribe_task(connection_id, "task-1")
+        manager.subscribe_task(connection_id, "task-2")
+        
+        manager.unsubscribe_task(connection_id, "task-1")
+        assert not manager.has_task_subscribers("task-1")
+        assert manager.connection_tasks[connection_id] == {"task-2"}
+        
+        manager.unsubscribe_task(connection_id, "task-2")
+        assert manager.task_connections == {}
+        assert manager.connection_tasks == {}
+    
+    async def test_disconnect_removes_subscriptions(self, manager):
+        """测试断开连接时从所有订阅的任务中移除"""
+        first, second = MockWebSocket(), MockWebSocket()
+        first_id = await manager.connect(first, make_user())
+        second_id = await manager.connect(second, make_user())
+        manager.subscribe_task(first_id, "task-1")
+        manager.subscribe_task(first_id, "task-2")
+        manager.subscribe_task(second_id, "task-1")
+        
+        manager.disconnect(first_id)
+        
+        assert manager.task_connections == {"task-1": {second_id: second}}
+        assert first_id not in manager.connection_tasks
+    
+    async def test_subscribe_message_checks_task_owner(self, manager):
+        """测试只能订阅自己的任务，管理员可以订阅任意任务"""
+        owner, stranger, admin = make_user(), make_user(), make_user(UserRole.ADMIN)
+        session = make_session({"task-1": SimpleNamespace(user_id=owner.id)})
+        message = {"type": "subscribe_task_updates", "data": {"task_id": "task-1"}}
+        
+        owner_id = await manager.connect(MockWebSocket(), owner)
+        stranger_id = await manager.connect(MockWebSocket(), stranger)
+        admin_id = await manager.connect(MockWebSocket(), admin)
+        
+        await handle_client_message(message, owner, session, owner_id)
+        await handle_client_message(message, stranger, session, stranger_id)
+        await handle_client_message(message, admin, session, admin_id)
+        
+        assert set(manager.task_connections["task-1"]) == {owner_id, admin_id}
+        
+        # 不存在的任务不能订阅
+        missing = {"type": "subscribe_task_updates", "data": {"task_id": "missing"}}
+        await handle_client_message(missing, admin, session, admin_id)
+        assert not manager.has_task_subscribers("missing")
+        
+        await handle_client_message(
+            {"type": "unsubscribe_task_updates", "data": {"task_id": "task-1"}}, owner, session, owner_id
+        )
+        assert set(manager.task_connections["task-1"]) == {admin_id}
+    
+    async def test_broadcaster_delivers_to_subscribed_connections(self, manager):
+        """测试任务状态广播器将消息发送给通用连接中订阅了该任务的客户端"""
+        ws_manager = MagicMock()
+        ws_manager.has_subscribers.return_value = False
+        ws_manager.broadcast_to_task = AsyncMock()
+        ws_manager.broadcast_payload_to_task = AsyncMock()
+        
+        broadcaster = TaskStatusBroadcaster()
+        broadcaster.ws_manager = ws_manager
+        broadcaster.connection_manager = manager
+        
+        # 没有任何订阅者时不发送
+        await broadcaster.broadcast_status_update("task-1", TaskStatus.RUNNING)
+        ws_manager.broadcast_to_task.assert_not_called()
+        
+        websocket = MockWebSocket()
+        connection_id = await manager.connect(websocket, make_user())
+        manager.subscribe_task(connection_id, "task-1")
+        
+        await broadcaster.broadcast_status_update("task-1", TaskStatus.RUNNING)
+        await broadcaster.send_heartbeat("task-1")
+        
+        status_message, heartbeat = (json.loads(text) for text in websocket.sent_messages[-2:])
+        assert status_message["type"] == "task_status_update"
+        assert status_message["task_id"] == "task-1"
+        assert heartbeat["type"] == "heartbeat"
+
+
+class FailingWebSocket(MockWebSocket):
+    """发送时抛出异常的模拟连接"""
+    
+    async def send_text(self, text: str):
+        raise RuntimeError("connection closed")
+
+
+class SlowWebSocket(MockWebSocket):
+    """发送时让出事件循环的模拟连接，记录同时进行的发送数"""
+    
+    in_flight = 0
+    max_in_flight = 0
+    
+    async def send_text(self, text: str):
+        SlowWebSocket.in_flight += 1
+        SlowWebSocket.max_in_flight = max(SlowWebSocket.max_in_flight, SlowWebSocket.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            self.sent_messages.append(text)
+        finally:
+            SlowWebSocket.in_flight -= 1
+
+
+@pytest.mark.asyncio
+class TestFanOut:
+    """并发广播测试"""
+    
+    async def test_failing_connection_is_disconnected(self, manager):
+        """测试单个连接发送失败不影响其他连接，且失败连接从所有索引中移除"""
+        admin = make_user(UserRole.ADMIN)
+        failing = FailingWebSocket()
+        failing_id = await manager.connect(failing, admin)
+        manager.subscribe_task(failing_id, "task-1")
+        
+        healthy = [MockWebSocket() for _ in range(3)]
+        healthy_ids = [await manager.connect(websocket, make_user(UserRole.ADMIN)) for websocket in healthy]
+        
+        await manager.broadcast_to_all({"type": "notice"})
+        
+        for websocket in healthy:
+            assert json.loads(websocket.sent_messages[-1]) == {"type": "notice"}
+        assert failing_id not in manager.active_connections
+        assert str(admin.id) not in manager.user_connections
+        assert set(manager.admin_connections) == set(healthy_ids)
+        assert not manager.has_task_subscribers("task-1")
+        assert failing_id not in manager.connection_tasks
+        assert manager.send_failures == 1
+    
+    async def test_semaphore_limits_concurrency(self, manager, monkeypatch):
+        """测试连接数超过FAN_OUT_CONCURRENCY时限制同时进行的发送数，失败连接同样被清理"""
+        monkeypatch.setattr("app.core.websocket.FAN_OUT_CONCURRENCY", 2)
+        monkeypatch.setattr(SlowWebSocket, "in_flight", 0)
+        monkeypatch.setattr(SlowWebSocket, "max_in_flight", 0)
+        
+        healthy = [SlowWebSocket() for _ in range(5)]
+        for websocket in healthy:
+            connection_id = await manager.connect(websocket, make_user())
+            manager.subscribe_task(connection_id, "task-1")
+        failing_id = await manager.connect(FailingWebSocket(), make_user())
+        manager.subscribe_task(failing_id, "task-1")
+        
+        await manager.broadcast_to_task("task-1", {"type": "task_progress", "progress": 10})
+        
+        assert SlowWebSocket.max_in_flight == 2
+        for websocket in healthy:
+            assert json.loads(websocket.sent_messages[-1]) == {"type": "task_progress", "progress": 10}
+        assert failing_id not in manager.active_connections
+        assert failing_id not in manager.task_connections["task-1"]
+        assert len(manager.task_connections["task-1"]) == 5
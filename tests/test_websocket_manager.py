@@ -5,7 +5,7 @@ from datetime import datetime, timezone, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi import WebSocket
 
-from app.core.websocket_manager import WebSocketManager, websocket_manager
+from app.core.websocket_manager import WebSocketManager, encode_message, now_iso, websocket_manager
 
 
 class MockWebSocket:
@@ -138,6 +138,9 @@ class TestWebSocketManager:
         
         assert broadcast_msg2["type"] == "test_message"
         assert broadcast_msg2["data"] == "Hello World"
+        
+        # 所有连接收到的是同一份序列化负载
+        assert mock_ws1.sent_messages[1] is mock_ws2.sent_messages[1]
     
     async def test_send_to_connection(self, ws_manager, mock_websocket):
         """测试向指定连接发送消息"""
@@ -262,6 +265,8 @@ class TestWebSocketManager:
         assert ws_manager.get_connection_count() == 3
         assert ws_manager.get_connection_count(task1) == 2
         assert ws_manager.get_connection_count(task2) == 1
+        assert ws_manager.has_subscribers(task1)
+        assert not ws_manager.has_subscribers("nonexistent-task")
         
         # 验证活跃任务
         active_tasks = ws_manager.get_active_tasks()
@@ -292,6 +297,7 @@ class TestWebSocketManager:
         # 验证任务1组被清理
         assert task1 not in ws_manager.active_connections
         assert ws_manager.get_connection_count(task1) == 0
+        assert not ws_manager.has_subscribers(task1)
         
         # 任务2仍然存在
         active_tasks = ws_manager.get_active_tasks()
@@ -299,6 +305,65 @@ class TestWebSocketManager:
         assert task2 in active_tasks
 
 
+class SlowMockWebSocket(MockWebSocket):
+    """发送阻塞直到放行的模拟WebSocket连接"""
+    
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+    
+    async def send_text(self, text: str):
+        await self.release.wait()
+        self.sent_messages.append(text)
+
+
+@pytest.mark.asyncio
+class TestWebSocketBackpressure:
+    """WebSocket发送积压测试"""
+    
+    async def test_progress_shed_when_buffer_full(self, ws_manager, monkeypatch):
+        """测试积压已满时丢弃最早的进度消息"""
+        monkeypatch.setattr("app.core.websocket_manager.SEND_BUFFER_MAXSIZE", 2)
+        slow_ws = SlowMockWebSocket()
+        slow_ws.release.set()
+        task_id = "test-task-123"
+        await ws_manager.connect(slow_ws, task_id, "user-456")
+        slow_ws.release.clear()
+        
+        # 第一条消息阻塞在发送中，其余进入积压队列
+        sender = asyncio.create_task(ws_manager.broadcast_to_task(task_id, {"type": "task_logs", "logs": "first"}))
+        await asyncio.sleep(0)
+        for progress in (10, 20, 30):
+            await ws_manager.broadcast_to_task(task_id, {"type": "task_progress", "progress": progress})
+        
+        slow_ws.release.set()
+        await sender
+        
+        sent = [json.loads(text) for text in slow_ws.sent_messages[1:]]
+        assert [message.get("progress") for message in sent] == [None, 20, 30]
+    
+    async def test_slow_client_disconnected_when_buffer_full(self, ws_manager, monkeypatch):
+        """测试积压已满且消息不可丢弃时断开慢连接"""
+        monkeypatch.setattr("app.core.websocket_manager.SEND_BUFFER_MAXSIZE", 1)
+        slow_ws = SlowMockWebSocket()
+        slow_ws.release.set()
+        task_id = "test-task-123"
+        await ws_manager.connect(slow_ws, task_id, "user-456")
+        slow_ws.release.clear()
+        
+        sender = asyncio.create_task(ws_manager.broadcast_to_task(task_id, {"type": "task_logs", "logs": "first"}))
+        await asyncio.sleep(0)
+        await ws_manager.broadcast_to_task(task_id, {"type": "task_logs", "logs": "second"})
+        await ws_manager.broadcast_to_task(task_id, {"type": "task_error", "error_message": "boom"})
+        
+        assert ws_manager.get_connection_count(task_id) == 0
+        assert slow_ws.closed
+        assert slow_ws.close_code == 1013
+        
+        slow_ws.release.set()
+        await sender
+
+
 @pytest.mark.asyncio
 class TestGlobalWebSocketManager:
     """全局WebSocket管理器测试"""
@@ -315,3 +380,25 @@ class TestGlobalWebSocketManager:
         
         async with get_websocket_manager() as manager:
             assert manager is websocket_manager
+
+
+def test_encode_message():
+    """测试WebSocket消息编码：紧凑、保留中文、日期时间为ISO-8601"""
+    sent_at = datetime(2024, 1, 1, 8, 30, tzinfo=timezone.utc)
+    encoded = encode_message({"message": "任务完成", "sent_at": sent_at})
+    
+    assert encoded == '{"message":"任务完成","sent_at":"2024-01-01T08:30:00+00:00"}'
+    assert json.loads(encoded)["message"] == "任务完成"
+
+
+def test_now_iso(monkeypatch):
+    """测试时间戳为带时区的ISO-8601字符串，同一毫秒内复用缓存"""
+    monkeypatch.setattr("app.core.websocket_manager._last_timestamp", (float("-inf"), ""))
+    with patch("app.core.websocket_manager.time.monotonic", return_value=1000.0):
+        first = now_iso()
+        assert now_iso() is first
+    
+    assert datetime.fromisoformat(first).tzinfo is not None
+    
+    with patch("app.core.websocket_manager.time.monotonic", return_value=1000.01):
+        assert now_iso() is not first